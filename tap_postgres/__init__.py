@@ -13,9 +13,12 @@ from singer.catalog import Catalog
 import tap_postgres.db as post_db
 import tap_postgres.sync_strategies.common as sync_common
 
+from tap_postgres import stream_scheduler
+
 from tap_postgres.sync_strategies import logical_replication
 from tap_postgres.sync_strategies import full_table
 from tap_postgres.sync_strategies import incremental
+from tap_postgres.sync_strategies import xmin
 from tap_postgres.discovery_utils import discover_db
 from tap_postgres.stream_utils import (
     dump_catalog, clear_state_on_replication_change,
@@ -40,7 +43,7 @@ def do_discovery(conn_config):
 
     Returns: list of discovered streams
     """
-    with post_db.open_connection(conn_config) as conn:
+    with post_db.pooled_connection(conn_config) as conn:
         LOGGER.info("Discovering db %s", conn_config['dbname'])
         streams = discover_db(conn, conn_config.get('filter_schemas'))
 
@@ -51,9 +54,11 @@ def do_discovery(conn_config):
     return streams
 
 
-def do_sync_full_table(conn_config, stream, state, desired_columns, md_map):
+# pylint: disable=too-many-arguments
+def do_sync_full_table(conn_config, stream, state, desired_columns, md_map, table_stats=None):
     """
-    Runs full table sync
+    Runs full table sync, table_stats, the statistics of the table read before the sync, are bookmarked once
+    it completes
     """
     LOGGER.info("Stream %s is using full_table replication", stream['tap_stream_id'])
     sync_common.send_schema_message(stream, [])
@@ -61,10 +66,15 @@ def do_sync_full_table(conn_config, stream, state, desired_columns, md_map):
         state = full_table.sync_view(conn_config, stream, state, desired_columns, md_map)
     else:
         state = full_table.sync_table(conn_config, stream, state, desired_columns, md_map)
+
+    if table_stats is not None:
+        state = singer.write_bookmark(state, stream['tap_stream_id'], 'table_stats', table_stats)
+    else:
+        state.get('bookmarks', {}).get(stream['tap_stream_id'], {}).pop('table_stats', None)
     return state
 
 
-# Possible state keys: replication_key, replication_key_value, version
+# Possible state keys: replication_key, replication_key_value, replication_key_pk, version, pk_set_generation
 def do_sync_incremental(conn_config, stream, state, desired_columns, md_map):
     """
     Runs Incremental sync
@@ -76,18 +86,35 @@ def do_sync_incremental(conn_config, stream, state, desired_columns, md_map):
 
     stream_state = state.get('bookmarks', {}).get(stream['tap_stream_id'])
     illegal_bk_keys = set(stream_state.keys()).difference(
-        {'replication_key', 'replication_key_value', 'version', 'last_replication_method'})
+        {'replication_key', 'replication_key_value', 'replication_key_pk', 'version', 'last_replication_method',
+         'windows', 'pk_set_generation'})
     if len(illegal_bk_keys) != 0:
         raise Exception(f"invalid keys found in state: {illegal_bk_keys}")
 
     state = singer.write_bookmark(state, stream['tap_stream_id'], 'replication_key', replication_key)
 
+    if conn_config.get('incremental_delete_detection'):
+        stream = logical_replication.add_automatic_properties(stream)
+
     sync_common.send_schema_message(stream, [replication_key])
     state = incremental.sync_table(conn_config, stream, state, desired_columns, md_map)
 
+    if conn_config.get('incremental_delete_detection'):
+        state = incremental.detect_deletes(conn_config, stream, state, md_map)
+
     return state
 
 
+# Possible state keys: snapshot_xmin, version
+def do_sync_xmin(conn_config, stream, state, desired_columns, md_map):
+    """
+    Runs XMIN sync
+    """
+    LOGGER.info("Stream %s is using xmin replication", stream['tap_stream_id'])
+    sync_common.send_schema_message(stream, [])
+    return xmin.sync_table(conn_config, stream, state, desired_columns, md_map)
+
+
 def sync_method_for_streams(streams, state, default_replication_method):
     """
 	Determines the replication method of each stream
@@ -103,7 +130,7 @@ def sync_method_for_streams(streams, state, default_replication_method):
 
         state = clear_state_on_replication_change(state, stream['tap_stream_id'], replication_key, replication_method)
 
-        if replication_method not in {'LOG_BASED', 'FULL_TABLE', 'INCREMENTAL'}:
+        if replication_method not in {'LOG_BASED', 'FULL_TABLE', 'INCREMENTAL', 'XMIN'}:
             raise Exception(f"Unrecognized replication_method {replication_method}")
 
         md_map = metadata.to_map(stream['metadata'])
@@ -119,31 +146,38 @@ def sync_method_for_streams(streams, state, default_replication_method):
             raise Exception(f'Logical Replication is NOT supported for views. ' \
                             f'Please change the replication method for {stream["tap_stream_id"]}')
 
+        if replication_method == 'XMIN' and stream_metadata.get((), {}).get('is-view'):
+            raise Exception(f'XMIN Replication is NOT supported for views. ' \
+                            f'Please change the replication method for {stream["tap_stream_id"]}')
+
         if replication_method == 'FULL_TABLE':
             lookup[stream['tap_stream_id']] = 'full'
             traditional_steams.append(stream)
         elif replication_method == 'INCREMENTAL':
             lookup[stream['tap_stream_id']] = 'incremental'
             traditional_steams.append(stream)
+        elif replication_method == 'XMIN':
+            lookup[stream['tap_stream_id']] = 'xmin'
+            traditional_steams.append(stream)
 
-        elif get_bookmark(state, stream['tap_stream_id'], 'xmin') and \
+        elif full_table.is_interrupted(state, stream['tap_stream_id']) and \
                 get_bookmark(state, stream['tap_stream_id'], 'lsn'):
             # finishing previously interrupted full-table (first stage of logical replication)
             lookup[stream['tap_stream_id']] = 'logical_initial_interrupted'
             traditional_steams.append(stream)
 
         # inconsistent state
-        elif get_bookmark(state, stream['tap_stream_id'], 'xmin') and \
+        elif full_table.is_interrupted(state, stream['tap_stream_id']) and \
                 not get_bookmark(state, stream['tap_stream_id'], 'lsn'):
             raise Exception("Xmin found(%s) in state implying full-table replication but no lsn is present")
 
-        elif not get_bookmark(state, stream['tap_stream_id'], 'xmin') and \
+        elif not full_table.is_interrupted(state, stream['tap_stream_id']) and \
                 not get_bookmark(state, stream['tap_stream_id'], 'lsn'):
             # initial full-table phase of logical replication
             lookup[stream['tap_stream_id']] = 'logical_initial'
             traditional_steams.append(stream)
 
-        else:  # no xmin but we have an lsn
+        else:  # no xmin or chunks but we have an lsn
             # initial stage of logical replication(full-table) has been completed. moving onto pure logical replication
             lookup[stream['tap_stream_id']] = 'pure_logical'
             logical_streams.append(stream)
@@ -151,9 +185,10 @@ def sync_method_for_streams(streams, state, default_replication_method):
     return lookup, traditional_steams, logical_streams
 
 
-def sync_traditional_stream(conn_config, stream, state, sync_method, end_lsn):
+def sync_traditional_stream(conn_config, stream, state, sync_method, end_lsn, table_stats=None):
     """
-    Sync INCREMENTAL and FULL_TABLE streams
+    Sync INCREMENTAL, XMIN and FULL_TABLE streams, table_stats are the statistics of a FULL_TABLE stream
+    read by skip_unchanged_streams
     """
     LOGGER.info("Beginning sync of stream(%s) with sync method(%s)", stream['tap_stream_id'], sync_method)
     md_map = metadata.to_map(stream['metadata'])
@@ -165,38 +200,71 @@ def sync_traditional_stream(conn_config, stream, state, sync_method, end_lsn):
         LOGGER.warning('There are no columns selected for stream %s, skipping it', stream['tap_stream_id'])
         return state
 
-    register_type_adapters(conn_config)
+    register_type_adapters(conn_config, {md_map.get(('properties', c), {}).get('sql-datatype')
+                                         for c in desired_columns} - {None})
 
     if sync_method == 'full':
         state = singer.set_currently_syncing(state, stream['tap_stream_id'])
-        state = do_sync_full_table(conn_config, stream, state, desired_columns, md_map)
+        state = do_sync_full_table(conn_config, stream, state, desired_columns, md_map, table_stats)
     elif sync_method == 'incremental':
         state = singer.set_currently_syncing(state, stream['tap_stream_id'])
         state = do_sync_incremental(conn_config, stream, state, desired_columns, md_map)
+    elif sync_method == 'xmin':
+        state = singer.set_currently_syncing(state, stream['tap_stream_id'])
+        state = do_sync_xmin(conn_config, stream, state, desired_columns, md_map)
     elif sync_method == 'logical_initial':
         state = singer.set_currently_syncing(state, stream['tap_stream_id'])
         LOGGER.info("Performing initial full table sync")
         state = singer.write_bookmark(state, stream['tap_stream_id'], 'lsn', end_lsn)
 
         sync_common.send_schema_message(stream, [])
-        state = full_table.sync_table(conn_config, stream, state, desired_columns, md_map)
+        state = full_table.sync_table(dict(conn_config, full_table_checksums=False), stream, state, desired_columns,
+                                      md_map)
         state = singer.write_bookmark(state, stream['tap_stream_id'], 'xmin', None)
     elif sync_method == 'logical_initial_interrupted':
         state = singer.set_currently_syncing(state, stream['tap_stream_id'])
         LOGGER.info("Initial stage of full table sync was interrupted. resuming...")
         sync_common.send_schema_message(stream, [])
-        state = full_table.sync_table(conn_config, stream, state, desired_columns, md_map)
+        state = full_table.sync_table(dict(conn_config, full_table_checksums=False), stream, state, desired_columns,
+                                      md_map)
     else:
         raise Exception(f"unknown sync method {sync_method} for stream {stream['tap_stream_id']}")
 
     state = singer.set_currently_syncing(state, None)
-    singer.write_message(singer.StateMessage(value=copy.deepcopy(state)))
+    sync_common.write_message(singer.StateMessage(value=copy.deepcopy(state)))
     return state
 
 
+def replication_slot_groups(conn_config, logical_streams, state):
+    """
+    Groups LOG_BASED streams by the replication slot they are consumed from, one per database or
+    logical_replication_slots per database. Returns the state, with the slot bookmarks of sharded streams,
+    and the (connection config, replication slot, streams) of every slot, the slot is None when unsharded.
+    """
+    def database_name(stream):
+        return metadata.to_map(stream['metadata']).get(()).get('database-name')
+
+    groups = []
+    slot_count = conn_config.get('logical_replication_slots', 1)
+    for dbname, streams in itertools.groupby(sorted(logical_streams, key=database_name), database_name):
+        db_conn_config = dict(conn_config, dbname=dbname)
+        if slot_count > 1:
+            slots = logical_replication.locate_replication_slots(db_conn_config, slot_count)
+            state, shards = logical_replication.shard_streams(list(streams), state, slots)
+            groups.extend((db_conn_config, slot, shard) for slot, shard in shards.items() if shard)
+        else:
+            groups.append((db_conn_config, None, list(streams)))
+
+    return state, groups
+
+
+# pylint: disable=too-many-locals
 def sync_logical_streams(conn_config, logical_streams, state, end_lsn, state_file):
     """
-    Sync streams that use LOG_BASED method
+    Sync streams that use LOG_BASED method, the streams of each database from its own replication slot, or
+    sharded across logical_replication_slots slots. With logical_replication_workers > 1 the databases are
+    replicated concurrently. Sharded slots are all consumed at the same time, whatever the number of databases:
+    a slot waiting for a worker would only start once another one reached end_lsn.
     """
     if logical_streams:
         LOGGER.info("Pure Logical Replication upto lsn %s for (%s)", end_lsn,
@@ -218,65 +286,62 @@ def sync_logical_streams(conn_config, logical_streams, state, end_lsn, state_fil
                 new_state['bookmarks'][stream] = bookmark
         state = new_state
 
-        state = logical_replication.sync_tables(conn_config, logical_streams, state, end_lsn, state_file)
+        state, groups = replication_slot_groups(conn_config, logical_streams, state)
+
+        if conn_config.get('logical_replication_slots', 1) > 1:
+            workers = len(groups)
+        else:
+            workers = conn_config.get('logical_replication_workers', 1)
+        if workers > 1 and len(groups) > 1:
+            group_slots = {streams[0]['tap_stream_id']: (db_conn_config, slot)
+                           for db_conn_config, slot, streams in groups}
+
+            def sync_group(streams, group_state):
+                db_conn_config, slot = group_slots[streams[0]['tap_stream_id']]
+                return logical_replication.sync_tables(db_conn_config, streams, group_state, end_lsn, state_file,
+                                                       slot)
+
+            scheduler = stream_scheduler.StreamScheduler(state, workers)
+            state = scheduler.run_groups([streams for _, _, streams in groups], sync_group)
+        else:
+            for db_conn_config, slot, streams in groups:
+                state = logical_replication.sync_tables(db_conn_config, streams, state, end_lsn, state_file, slot)
 
     return state
 
 
-def register_type_adapters(conn_config):
+def register_type_adapters(conn_config, sql_datatypes=()):
     """
-    //todo doc needed
+    Registers the array types psycopg2 does not know about to be read as arrays of strings, using the type
+    OIDs cached by post_db.session_info. sql_datatypes are the types about to be read, the OIDs are fetched
+    again when one of them was created after they were cached.
     """
-    with post_db.open_connection(conn_config) as conn:
-        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-            # citext[]
-            cur.execute("SELECT typarray FROM pg_type where typname = 'citext'")
-            citext_array_oid = cur.fetchone()
-            if citext_array_oid:
-                psycopg2.extensions.register_type(
-                    psycopg2.extensions.new_array_type(
-                        (citext_array_oid[0],), 'CITEXT[]', psycopg2.STRING))
-
-            # bit[]
-            cur.execute("SELECT typarray FROM pg_type where typname = 'bit'")
-            bit_array_oid = cur.fetchone()[0]
-            psycopg2.extensions.register_type(
-                psycopg2.extensions.new_array_type(
-                    (bit_array_oid,), 'BIT[]', psycopg2.STRING))
-
-            # UUID[]
-            cur.execute("SELECT typarray FROM pg_type where typname = 'uuid'")
-            uuid_array_oid = cur.fetchone()[0]
-            psycopg2.extensions.register_type(
-                psycopg2.extensions.new_array_type(
-                    (uuid_array_oid,), 'UUID[]', psycopg2.STRING))
-
-            # money[]
-            cur.execute("SELECT typarray FROM pg_type where typname = 'money'")
-            money_array_oid = cur.fetchone()[0]
-            psycopg2.extensions.register_type(
-                psycopg2.extensions.new_array_type(
-                    (money_array_oid,), 'MONEY[]', psycopg2.STRING))
-
-            # json and jsonb
-            # pylint: disable=unnecessary-lambda
-            psycopg2.extras.register_default_json(loads=lambda x: str(x))
-            psycopg2.extras.register_default_jsonb(loads=lambda x: str(x))
-
-            # enum[]'s
-            cur.execute("SELECT distinct(t.typarray) FROM pg_type t JOIN pg_enum e ON t.oid = e.enumtypid")
-            for oid in cur.fetchall():
-                enum_oid = oid[0]
-                psycopg2.extensions.register_type(
-                    psycopg2.extensions.new_array_type(
-                        (enum_oid,), f'ENUM_{enum_oid}[]', psycopg2.STRING))
+    info = post_db.session_info(conn_config, sql_datatypes)
+
+    # citext[], bit[], UUID[], money[]
+    for type_name, array_oid in info['string_array_oids'].items():
+        psycopg2.extensions.register_type(
+            psycopg2.extensions.new_array_type(
+                (array_oid,), f'{type_name.upper()}[]', psycopg2.STRING))
+
+    # json and jsonb
+    # pylint: disable=unnecessary-lambda
+    psycopg2.extras.register_default_json(loads=lambda x: str(x))
+    psycopg2.extras.register_default_jsonb(loads=lambda x: str(x))
+
+    # enum[]'s
+    for enum_oid in info['enum_array_oids']:
+        psycopg2.extensions.register_type(
+            psycopg2.extensions.new_array_type(
+                (enum_oid,), f'ENUM_{enum_oid}[]', psycopg2.STRING))
 
 
 def do_sync(conn_config, catalog, default_replication_method, state, state_file=None):
     """
     Orchestrates sync of all streams
     """
-    currently_syncing = singer.get_currently_syncing(state)
+    currently_syncing = stream_scheduler.get_currently_syncing_streams(state)
+    state.pop(stream_scheduler.CURRENTLY_SYNCING_STREAMS, None)
     streams = list(filter(is_selected_via_metadata, catalog['streams']))
     streams.sort(key=lambda s: s['tap_stream_id'])
     LOGGER.info("Selected streams: %s ", [s['tap_stream_id'] for s in streams])
@@ -292,10 +357,18 @@ def do_sync(conn_config, catalog, default_replication_method, state, state_file=
     sync_method_lookup, traditional_streams, logical_streams = \
         sync_method_for_streams(streams, state, default_replication_method)
 
+    traditional_streams, skipped_streams, table_stats = skip_unchanged_streams(conn_config, traditional_streams,
+                                                                               sync_method_lookup, state)
+
+    planned_streams = stream_scheduler.plan_streams(traditional_streams, conn_config.get('stream_workers', 1))
+    if conn_config.get('stream_workers', 1) > 1:
+        traditional_streams = planned_streams
+
     if currently_syncing:
         LOGGER.debug("Found currently_syncing: %s", currently_syncing)
 
-        currently_syncing_stream = list(filter(lambda s: s['tap_stream_id'] == currently_syncing, traditional_streams))
+        currently_syncing_stream = [s for stream_id in currently_syncing
+                                    for s in traditional_streams if s['tap_stream_id'] == stream_id]
 
         if not currently_syncing_stream:
             LOGGER.warning("unable to locate currently_syncing(%s) amongst selected traditional streams(%s). "
@@ -303,26 +376,80 @@ def do_sync(conn_config, catalog, default_replication_method, state, state_file=
                            currently_syncing,
                            {s['tap_stream_id'] for s in traditional_streams})
 
-        other_streams = list(filter(lambda s: s['tap_stream_id'] != currently_syncing, traditional_streams))
+        other_streams = list(filter(lambda s: s['tap_stream_id'] not in currently_syncing, traditional_streams))
         traditional_streams = currently_syncing_stream + other_streams
     else:
         LOGGER.info("No streams marked as currently_syncing in state file")
 
-    for stream in traditional_streams:
-        state = sync_traditional_stream(conn_config,
-                                        stream,
-                                        state,
-                                        sync_method_lookup[stream['tap_stream_id']],
-                                        end_lsn)
-
-    logical_streams.sort(key=lambda s: metadata.to_map(s['metadata']).get(()).get('database-name'))
-    for dbname, streams in itertools.groupby(logical_streams,
-                                             lambda s: metadata.to_map(s['metadata']).get(()).get('database-name')):
-        conn_config['dbname'] = dbname
-        state = sync_logical_streams(conn_config, list(streams), state, end_lsn, state_file)
+    if conn_config.get('stream_workers', 1) > 1 and len(traditional_streams) > 1:
+        scheduler = stream_scheduler.StreamScheduler(state, conn_config['stream_workers'])
+        state = scheduler.run(traditional_streams,
+                              lambda stream, stream_state: sync_traditional_stream(
+                                  dict(conn_config),
+                                  stream,
+                                  stream_state,
+                                  sync_method_lookup[stream['tap_stream_id']],
+                                  end_lsn,
+                                  table_stats.get(stream['tap_stream_id'])))
+    else:
+        for stream in traditional_streams:
+            state = sync_traditional_stream(conn_config,
+                                            stream,
+                                            state,
+                                            sync_method_lookup[stream['tap_stream_id']],
+                                            end_lsn,
+                                            table_stats.get(stream['tap_stream_id']))
+
+    state = sync_logical_streams(conn_config, logical_streams, state, end_lsn, state_file)
+
+    if skipped_streams:
+        LOGGER.info("Skipped %i unchanged streams: %s", len(skipped_streams), skipped_streams)
     return state
 
 
+def skip_unchanged_streams(conn_config, streams, sync_method_lookup, state):
+    """
+    Leaves out the streams known not to have changed since their last sync, checked with one query per database
+    before any of them is set up:
+      * with skip_unchanged_streams, the INCREMENTAL streams with no rows past their bookmark, unless their
+        deletes are detected
+      * with skip_unchanged_full_tables, the FULL_TABLE streams of tables whose statistics and selected columns
+        are the ones bookmarked by their last completed sync, their previous table version stays active
+
+    Returns the streams to sync, the tap_stream_ids of the skipped ones and the statistics of the FULL_TABLE
+    tables to sync, to bookmark once their sync completes.
+    """
+    skipped_streams = []
+    table_stats = {}
+
+    incremental_streams = [s for s in streams if sync_method_lookup[s['tap_stream_id']] == 'incremental']
+    if conn_config.get('skip_unchanged_streams') and not conn_config.get('incremental_delete_detection') and \
+            incremental_streams:
+        changed_streams = incremental.fetch_changed_streams(conn_config, incremental_streams, state)
+        skipped_streams += [s['tap_stream_id'] for s in incremental_streams
+                            if s['tap_stream_id'] not in changed_streams]
+
+    full_table_streams = [s for s in streams if sync_method_lookup[s['tap_stream_id']] == 'full' and
+                          not metadata.to_map(s['metadata']).get((), {}).get('is-view')]
+    if conn_config.get('skip_unchanged_full_tables') and full_table_streams:
+        if conn_config.get('use_secondary'):
+            # the statistics of a replica do not count the changes replayed from the primary
+            LOGGER.warning('skip_unchanged_full_tables is not used with use_secondary')
+        else:
+            streams_by_id = {s['tap_stream_id']: s for s in full_table_streams}
+            for tap_stream_id, stats in full_table.fetch_table_stats(conn_config, full_table_streams).items():
+                md_map = metadata.to_map(streams_by_id[tap_stream_id]['metadata'])
+                stats['columns'] = sorted(c for c in streams_by_id[tap_stream_id]['schema']['properties']
+                                          if sync_common.should_sync_column(md_map, c))
+                if not full_table.is_interrupted(state, tap_stream_id) and \
+                        get_bookmark(state, tap_stream_id, 'table_stats') == stats:
+                    skipped_streams.append(tap_stream_id)
+                else:
+                    table_stats[tap_stream_id] = stats
+
+    return [s for s in streams if s['tap_stream_id'] not in skipped_streams], skipped_streams, table_stats
+
+
 def parse_args(required_config_keys):
     # fork function to be able to grab path of state file
     """Parse standard command-line args.
@@ -409,9 +536,49 @@ def main_impl():
         'break_at_end_lsn': args.config.get('break_at_end_lsn', True),
         'logical_poll_total_seconds': float(args.config.get('logical_poll_total_seconds', 0)),
         'use_secondary': args.config.get('use_secondary', False),
-        'limit': int(limit) if limit else None
+        'limit': int(limit) if limit else None,
+        'full_table_workers': int(args.config.get('full_table_workers', 1)),
+        'full_table_chunk_size': int(args.config.get('full_table_chunk_size', full_table.CHUNK_SIZE)),
+        'full_table_checksums': args.config.get('full_table_checksums', False),
+        'extraction_engine': args.config.get('extraction_engine', post_db.EXTRACTION_ENGINE_CURSOR),
+        'logical_decoding_plugin': args.config.get('logical_decoding_plugin',
+                                                   logical_replication.DECODING_PLUGIN_WAL2JSON),
+        'publication': args.config.get('publication'),
+        'stream_workers': int(args.config.get('stream_workers', 1)),
+        'logical_replication_workers': int(args.config.get('logical_replication_workers', 1)),
+        'logical_replication_slots': int(args.config.get('logical_replication_slots', 1)),
+        'logical_decode_workers': int(args.config.get('logical_decode_workers', 1)),
+        'lsn_ack_file': args.config.get('lsn_ack_file'),
+        'incremental_backfill_workers': int(args.config.get('incremental_backfill_workers', 1)),
+        'skip_unchanged_streams': args.config.get('skip_unchanged_streams', False),
+        'skip_unchanged_full_tables': args.config.get('skip_unchanged_full_tables', False),
+        'incremental_delete_detection': args.config.get('incremental_delete_detection', False),
+        'pk_set_dir': args.config.get('pk_set_dir')
     }
 
+    if conn_config['extraction_engine'] not in post_db.EXTRACTION_ENGINES:
+        raise ValueError(
+            f"Invalid 'extraction_engine' {conn_config['extraction_engine']}, "
+            f"must be one of: {', '.join(post_db.EXTRACTION_ENGINES)}"
+        )
+
+    if conn_config['logical_decoding_plugin'] not in logical_replication.DECODING_PLUGINS:
+        raise ValueError(
+            f"Invalid 'logical_decoding_plugin' {conn_config['logical_decoding_plugin']}, "
+            f"must be one of: {', '.join(logical_replication.DECODING_PLUGINS)}"
+        )
+
+    if conn_config['logical_replication_slots'] > 1 and conn_config['publication']:
+        raise ValueError("When 'logical_replication_slots' is greater than 1 every slot streams the publication "
+                         "named after it, 'publication' must not be defined.")
+
+    if conn_config['incremental_delete_detection'] and not conn_config['pk_set_dir']:
+        raise ValueError("When 'incremental_delete_detection' enabled 'pk_set_dir' must be defined.")
+
+    if conn_config['use_secondary'] and conn_config['full_table_checksums']:
+        # the statistics of a replica do not count the deletes replayed from the primary
+        LOGGER.warning('full_table_checksums is not used with use_secondary')
+
     if conn_config['use_secondary']:
         try:
             conn_config.update({
@@ -0,0 +1,404 @@
+import datetime
+import decimal
+import queue
+import struct
+import threading
+import uuid
+
+from typing import Callable, Dict, Iterator, List, Optional
+
+# COPY ... (FORMAT binary) stream layout, see https://www.postgresql.org/docs/current/sql-copy.html
+SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+HEADER_SIZE = len(SIGNATURE) + 8
+
+ROWS_PER_BATCH = 1000
+
+_INT2 = struct.Struct('!h')
+_INT4 = struct.Struct('!i')
+_INT8 = struct.Struct('!q')
+_FLOAT4 = struct.Struct('!f')
+_FLOAT8 = struct.Struct('!d')
+_NUMERIC_HEADER = struct.Struct('!hhHH')
+_TIMETZ = struct.Struct('!qi')
+_ARRAY_HEADER = struct.Struct('!iiI')
+_ARRAY_DIMENSION = struct.Struct('!ii')
+
+POSTGRES_EPOCH_DATE = datetime.date(2000, 1, 1).toordinal()
+POSTGRES_EPOCH_DATETIME = datetime.datetime(2000, 1, 1)
+POSTGRES_EPOCH_DATETIME_UTC = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+
+DATE_INFINITY = 0x7FFFFFFF
+DATE_MINUS_INFINITY = -0x80000000
+TIMESTAMP_INFINITY = 0x7FFFFFFFFFFFFFFF
+TIMESTAMP_MINUS_INFINITY = -0x8000000000000000
+
+NUMERIC_NEGATIVE = 0x4000
+NUMERIC_SPECIAL_VALUES = {0xC000: decimal.Decimal('NaN'),
+                          0xD000: decimal.Decimal('Infinity'),
+                          0xF000: decimal.Decimal('-Infinity')}
+
+
+class BinaryCopyError(Exception):
+    """Custom exception when the binary COPY stream cannot be decoded"""
+
+
+class CopyAborted(Exception):
+    """Custom exception raised into COPY to stop it when its rows are no longer consumed"""
+
+
+# pylint: disable=missing-function-docstring
+def decode_int2(data):
+    return _INT2.unpack(data)[0]
+
+
+def decode_int4(data):
+    return _INT4.unpack(data)[0]
+
+
+def decode_int8(data):
+    return _INT8.unpack(data)[0]
+
+
+def decode_float4(data):
+    return _FLOAT4.unpack(data)[0]
+
+
+def decode_float8(data):
+    return _FLOAT8.unpack(data)[0]
+
+
+def decode_bool(data):
+    return data[0] != 0
+
+
+def decode_uuid(data):
+    return str(uuid.UUID(bytes=bytes(data)))
+
+
+def decode_numeric(data):
+    ndigits, weight, sign, dscale = _NUMERIC_HEADER.unpack_from(data)
+    if sign in NUMERIC_SPECIAL_VALUES:
+        return NUMERIC_SPECIAL_VALUES[sign]
+
+    # base 10000 digits, the first one being weight groups of 4 decimal digits left of the decimal point
+    digits = ''.join(f'{digit:04d}' for digit in struct.unpack_from(f'!{ndigits}h', data, 8))
+    exponent = (weight + 1 - ndigits) * 4
+    if exponent + dscale >= 0:
+        digits += '0' * (exponent + dscale)
+    else:
+        digits = digits[:len(digits) + exponent + dscale]
+
+    return decimal.Decimal((1 if sign == NUMERIC_NEGATIVE else 0, tuple(map(int, digits or '0')), -dscale))
+
+
+def decode_date(data):
+    days = _INT4.unpack(data)[0]
+    if days == DATE_INFINITY:
+        return datetime.date.max
+    if days == DATE_MINUS_INFINITY:
+        return datetime.date.min
+    return datetime.date.fromordinal(POSTGRES_EPOCH_DATE + days)
+
+
+def decode_timestamp(data):
+    microseconds = _INT8.unpack(data)[0]
+    if microseconds == TIMESTAMP_INFINITY:
+        return datetime.datetime.max
+    if microseconds == TIMESTAMP_MINUS_INFINITY:
+        return datetime.datetime.min
+    return POSTGRES_EPOCH_DATETIME + datetime.timedelta(microseconds=microseconds)
+
+
+def decode_timestamptz(data):
+    microseconds = _INT8.unpack(data)[0]
+    if microseconds == TIMESTAMP_INFINITY:
+        return datetime.datetime.max.replace(tzinfo=datetime.timezone.utc)
+    if microseconds == TIMESTAMP_MINUS_INFINITY:
+        return datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
+    return POSTGRES_EPOCH_DATETIME_UTC + datetime.timedelta(microseconds=microseconds)
+
+
+def _microseconds_to_time(microseconds, tzinfo=None):
+    seconds, microsecond = divmod(microseconds, 1000000)
+    minutes, second = divmod(seconds, 60)
+    hour, minute = divmod(minutes, 60)
+    # 24:00:00 is a valid time in postgres
+    return datetime.time(hour % 24, minute, second, microsecond, tzinfo=tzinfo)
+
+
+def decode_time(data):
+    return _microseconds_to_time(_INT8.unpack(data)[0])
+
+
+def decode_timetz(data):
+    microseconds, zone = _TIMETZ.unpack(data)
+    # the zone is stored in seconds west of UTC
+    return _microseconds_to_time(microseconds, datetime.timezone(datetime.timedelta(seconds=-zone)))
+
+
+def text_decoder(encoding):
+    def decode_text(data):
+        return str(data, encoding)
+
+    return decode_text
+
+
+def jsonb_decoder(encoding):
+    def decode_jsonb(data):
+        # the first byte is the jsonb format version
+        return str(data[1:], encoding)
+
+    return decode_jsonb
+
+
+def hstore_decoder(encoding):
+    def decode_hstore(data):
+        pairs = {}
+        count = _INT4.unpack_from(data)[0]
+        pos = 4
+        for _ in range(count):
+            key_length = _INT4.unpack_from(data, pos)[0]
+            key = str(data[pos + 4:pos + 4 + key_length], encoding)
+            pos += 4 + key_length
+            value_length = _INT4.unpack_from(data, pos)[0]
+            pos += 4
+            if value_length == -1:
+                pairs[key] = None
+            else:
+                pairs[key] = str(data[pos:pos + value_length], encoding)
+                pos += value_length
+        return pairs
+
+    return decode_hstore
+
+
+def array_decoder(element_decoder):
+    def decode_array(data):
+        ndim, _, _ = _ARRAY_HEADER.unpack_from(data)
+        if ndim == 0:
+            return []
+
+        dimensions = [_ARRAY_DIMENSION.unpack_from(data, 12 + 8 * idx)[0] for idx in range(ndim)]
+        pos = 12 + 8 * ndim
+
+        elements = []
+        for _ in range(_product(dimensions)):
+            length = _INT4.unpack_from(data, pos)[0]
+            pos += 4
+            if length == -1:
+                elements.append(None)
+            else:
+                elements.append(element_decoder(data[pos:pos + length]))
+                pos += length
+
+        # nest the flat row-major element list into the array dimensions, innermost first
+        for size in reversed(dimensions[1:]):
+            elements = [elements[idx:idx + size] for idx in range(0, len(elements), size)]
+        return elements
+
+    return decode_array
+
+
+def _product(values):
+    result = 1
+    for value in values:
+        result *= value
+    return result
+
+
+SCALAR_DECODERS = {
+    'smallint': decode_int2,
+    'integer': decode_int4,
+    'bigint': decode_int8,
+    'real': decode_float4,
+    'double precision': decode_float8,
+    'boolean': decode_bool,
+    'numeric': decode_numeric,
+    'uuid': decode_uuid,
+    'date': decode_date,
+    'timestamp without time zone': decode_timestamp,
+    'timestamp with time zone': decode_timestamptz,
+    'time without time zone': decode_time,
+    'time with time zone': decode_timetz,
+}
+
+# types sent as text in the client encoding
+TEXT_TYPES = {'text', 'character varying', 'character', 'citext', 'json'}
+
+
+def has_decoder(sql_datatype: Optional[str]) -> bool:
+    """
+    Tells if values of the given sql-datatype can be decoded from their binary form. Values of other types
+    have to be cast to text in the COPY query.
+    """
+    if not sql_datatype:
+        return False
+    base_datatype = sql_datatype.replace('[]', '')
+    return base_datatype in SCALAR_DECODERS or base_datatype in TEXT_TYPES or base_datatype in {'jsonb', 'hstore'}
+
+
+def decoder_for(sql_datatype: Optional[str], encoding: str) -> Callable:
+    """
+    Returns the function decoding a binary field of the given sql-datatype into the value psycopg2 would return
+    for it. Types without a binary decoder are expected to be cast to text in the query.
+    """
+    if not has_decoder(sql_datatype):
+        decoder = text_decoder(encoding)
+        return array_decoder(decoder) if sql_datatype and sql_datatype.endswith('[]') else decoder
+
+    base_datatype = sql_datatype.replace('[]', '')
+    if base_datatype in SCALAR_DECODERS:
+        decoder = SCALAR_DECODERS[base_datatype]
+    elif base_datatype == 'jsonb':
+        decoder = jsonb_decoder(encoding)
+    elif base_datatype == 'hstore':
+        decoder = hstore_decoder(encoding)
+    else:
+        decoder = text_decoder(encoding)
+
+    return array_decoder(decoder) if sql_datatype.endswith('[]') else decoder
+
+
+# pylint: disable=too-few-public-methods
+class BinaryCopyParser:
+    """
+    Incrementally parses a binary COPY stream. It is used as the file object of copy_expert, so it receives
+    the stream in arbitrary pieces and hands every batch of complete, decoded rows to on_rows.
+    """
+
+    def __init__(self, decoders: List[Callable], on_rows: Callable[[List[List]], None]):
+        self.decoders = decoders
+        self.on_rows = on_rows
+        self.buffer = bytearray()
+        self.header_parsed = False
+        self.finished = False
+
+    def write(self, data):
+        self.buffer += data
+        rows = self._parse_rows()
+        if rows:
+            self.on_rows(rows)
+
+    def _parse_header(self):
+        if len(self.buffer) < HEADER_SIZE:
+            return False
+        if bytes(self.buffer[:len(SIGNATURE)]) != SIGNATURE:
+            raise BinaryCopyError('Invalid binary COPY signature')
+
+        extension_length = _INT4.unpack_from(self.buffer, len(SIGNATURE) + 4)[0]
+        if len(self.buffer) < HEADER_SIZE + extension_length:
+            return False
+
+        del self.buffer[:HEADER_SIZE + extension_length]
+        self.header_parsed = True
+        return True
+
+    def _parse_rows(self):
+        if not self.header_parsed and not self._parse_header():
+            return []
+
+        rows = []
+        data = memoryview(self.buffer)
+        size = len(data)
+        pos = 0
+        decoders = self.decoders
+        try:
+            while pos + 2 <= size:
+                field_count = _INT2.unpack_from(data, pos)[0]
+                if field_count == -1:
+                    self.finished = True
+                    pos += 2
+                    break
+                if field_count != len(decoders):
+                    raise BinaryCopyError(f'Expected {len(decoders)} fields per row, got {field_count}')
+
+                row = []
+                field_pos = pos + 2
+                for decoder in decoders:
+                    if field_pos + 4 > size:
+                        break
+                    length = _INT4.unpack_from(data, field_pos)[0]
+                    field_pos += 4
+                    if length == -1:
+                        row.append(None)
+                        continue
+                    if field_pos + length > size:
+                        break
+                    row.append(decoder(data[field_pos:field_pos + length]))
+                    field_pos += length
+
+                if len(row) < field_count:
+                    # incomplete row, wait for more data
+                    break
+
+                rows.append(row)
+                pos = field_pos
+        finally:
+            data.release()
+
+        del self.buffer[:pos]
+        return rows
+
+
+def copy_rows(conn, select_sql: str, decoders: List[Callable]) -> Iterator[List]:
+    """
+    Runs select_sql through COPY ... TO STDOUT (FORMAT binary) and yields the decoded rows.
+
+    psycopg2 only exposes COPY through the blocking copy_expert, so COPY runs in a background thread that
+    hands batches of rows over a bounded queue.
+    """
+    copy_sql = f"COPY ({select_sql.strip().rstrip(';')}) TO STDOUT (FORMAT binary)"
+    batches = queue.Queue(maxsize=16)
+    stopped = threading.Event()
+    end_of_rows = object()
+
+    pending = []
+
+    def on_rows(rows):
+        if stopped.is_set():
+            raise CopyAborted()
+        pending.extend(rows)
+        if len(pending) >= ROWS_PER_BATCH:
+            batches.put(pending[:])
+            pending.clear()
+
+    def run_copy():
+        parser = BinaryCopyParser(decoders, on_rows)
+        try:
+            with conn.cursor() as cur:
+                cur.copy_expert(copy_sql, parser)
+            batches.put(pending)
+            batches.put(end_of_rows)
+        except Exception as exc:
+            batches.put(exc)
+
+    copy_thread = threading.Thread(target=run_copy, name='binary_copy', daemon=True)
+    copy_thread.start()
+    try:
+        while True:
+            batch = batches.get()
+            if batch is end_of_rows:
+                break
+            if isinstance(batch, Exception):
+                raise batch
+            yield from batch
+    finally:
+        stopped.set()
+        # unblock the copy thread if it is waiting for room in the queue
+        while copy_thread.is_alive():
+            try:
+                batches.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        copy_thread.join()
+
+
+def column_decoders(sql_datatypes: List[Optional[str]], encoding: str) -> List[Callable]:
+    """
+    Returns the decoders of a list of columns given by their sql-datatype
+    """
+    decoders: Dict[Optional[str], Callable] = {}
+    for sql_datatype in sql_datatypes:
+        if sql_datatype not in decoders:
+            decoders[sql_datatype] = decoder_for(sql_datatype, encoding)
+    return [decoders[sql_datatype] for sql_datatype in sql_datatypes]
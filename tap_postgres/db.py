@@ -1,20 +1,51 @@
+import atexit
 import copy
 import datetime
 import json
 import decimal
 import math
+import re
 import pytz
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
 import singer
+import threading
+import time
 
-from typing import List
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from typing import Dict, Iterable, List
 from dateutil.parser import parse
 
+from tap_postgres import binary_copy
+
 LOGGER = singer.get_logger('tap_postgres')
 
 CURSOR_ITER_SIZE = 20000
 
+# Pooled connections idle for longer are closed, those idle for longer than the health check interval are
+# checked with a round trip before being borrowed again
+POOL_IDLE_TIMEOUT = 300
+POOL_HEALTH_CHECK_INTERVAL = 30
+POOL_MAX_IDLE_CONNECTIONS = 8
+
+# Ways of reading rows of FULL_TABLE and INCREMENTAL streams
+EXTRACTION_ENGINE_CURSOR = 'cursor'
+EXTRACTION_ENGINE_COPY_BINARY = 'copy_binary'
+EXTRACTION_ENGINE_COPY_JSON = 'copy_json'
+EXTRACTION_ENGINES = (EXTRACTION_ENGINE_CURSOR, EXTRACTION_ENGINE_COPY_BINARY, EXTRACTION_ENGINE_COPY_JSON)
+
+# json_build_object takes at most 100 arguments, records of wider tables are merged from several objects
+JSON_OBJECT_MAX_COLUMNS = 50
+
+# The type modifiers of a sql-datatype, e.g. (3) in bit(3)
+TYPE_MODIFIERS_RE = re.compile(r'\([^)]*\)')
+
+# sql-datatypes whose json representation built by postgres is the one selected_value_to_singer_value returns
+JSON_AS_IS_TYPES = {'smallint', 'integer', 'bigint', 'boolean', 'text', 'character varying', 'character', 'citext',
+                    'uuid', 'money', 'json', 'jsonb'}
+
 
 # pylint: disable=invalid-name,missing-function-docstring
 def calculate_destination_stream_name(stream, md_map):
@@ -28,6 +59,10 @@ def canonicalize_identifier(identifier):
     return identifier.replace('"', '""')
 
 
+def canonicalize_literal(literal):
+    return literal.replace("'", "''")
+
+
 def fully_qualified_column_name(schema, table, column):
     return f'"{canonicalize_identifier(schema)}"."{canonicalize_identifier(table)}"."{canonicalize_identifier(column)}"'
 
@@ -65,24 +100,281 @@ def open_connection(conn_config, logical_replication=False, prioritize_primary=F
 
     return conn
 
+
+class ConnectionPool:
+    """
+    Keeps the connections returned by pooled_connection open to be borrowed again, keyed by database and
+    primary or secondary role. Connections are closed when idle for longer than POOL_IDLE_TIMEOUT.
+    """
+
+    def __init__(self, idle_timeout=POOL_IDLE_TIMEOUT, health_check_interval=POOL_HEALTH_CHECK_INTERVAL,
+                 max_idle_connections=POOL_MAX_IDLE_CONNECTIONS):
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.max_idle_connections = max_idle_connections
+        # key -> list of (connection, time it was returned)
+        self.idle: Dict[tuple, List] = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(conn_config, prioritize_primary):
+        use_secondary = conn_config['use_secondary'] and not prioritize_primary
+        role = 'secondary' if use_secondary else 'primary'
+        host = conn_config.get('secondary_host', conn_config['host']) if use_secondary else conn_config['host']
+        port = conn_config.get('secondary_port', conn_config['port']) if use_secondary else conn_config['port']
+        return conn_config['dbname'], role, host, port, conn_config['user']
+
+    def _close_expired(self, now):
+        """
+        Closes connections idle for longer than idle_timeout, the caller holds the lock
+        """
+        for key, idle_connections in self.idle.items():
+            expired = [conn for conn, returned_at in idle_connections if now - returned_at > self.idle_timeout]
+            for conn in expired:
+                conn.close()
+            self.idle[key] = [(conn, returned_at) for conn, returned_at in idle_connections
+                              if now - returned_at <= self.idle_timeout]
+
+    def _is_healthy(self, conn, idle_seconds):
+        if conn.closed or conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+
+        if idle_seconds > self.health_check_interval:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+
+        return True
+
+    def get(self, conn_config, prioritize_primary=False):
+        """
+        Returns a healthy idle connection of the database, or a new one
+        """
+        key = self.key(conn_config, prioritize_primary)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._close_expired(now)
+                idle_connections = self.idle.get(key)
+                if not idle_connections:
+                    break
+                conn, returned_at = idle_connections.pop()
+
+            if self._is_healthy(conn, now - returned_at):
+                return conn
+
+            LOGGER.info('Discarding broken pooled connection to %s', key[0])
+            conn.close()
+
+        return open_connection(conn_config, prioritize_primary=prioritize_primary)
+
+    def put(self, conn, conn_config, prioritize_primary=False):
+        """
+        Returns a connection to the pool, or closes it when it is broken or the pool is full
+        """
+        if conn.closed or conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.close()
+            return
+
+        key = self.key(conn_config, prioritize_primary)
+        with self.lock:
+            idle_connections = self.idle.setdefault(key, [])
+            if len(idle_connections) < self.max_idle_connections:
+                idle_connections.append((conn, time.monotonic()))
+                return
+
+        conn.close()
+
+    def close_all(self):
+        with self.lock:
+            for idle_connections in self.idle.values():
+                for conn, _ in idle_connections:
+                    conn.close()
+            self.idle.clear()
+
+
+CONNECTION_POOL = ConnectionPool()
+atexit.register(CONNECTION_POOL.close_all)
+
+
+@contextmanager
+def pooled_connection(conn_config, prioritize_primary=False):
+    """
+    Borrows a connection from the pool, to be used like `with open_connection(...) as conn`: the transaction
+    is committed, or rolled back on error, when the block exits. The connection goes back to the pool instead
+    of being left open. Callers must not change its session characteristics.
+    """
+    conn = CONNECTION_POOL.get(conn_config, prioritize_primary)
+    try:
+        with conn as entered:
+            yield entered
+    finally:
+        CONNECTION_POOL.put(conn, conn_config, prioritize_primary)
+
 def prepare_columns_for_select_sql(c, md_map):
     column_name = f' "{canonicalize_identifier(c)}" '
 
     if ('properties', c) in md_map:
         sql_datatype = md_map[('properties', c)]['sql-datatype']
         if sql_datatype.startswith('timestamp') and not sql_datatype.endswith('[]'):
-            return f'CASE ' \
-                   f'WHEN {column_name} < \'0001-01-01 00:00:00.000\' ' \
-                   f'OR {column_name} > \'9999-12-31 23:59:59.999\' THEN \'9999-12-31 23:59:59.999\' ' \
-                   f'ELSE {column_name} ' \
-                   f'END AS {column_name}'
+            return f'{clamped_timestamp_sql(column_name)} AS {column_name}'
     return column_name
 
+
+def clamped_timestamp_sql(column_name):
+    return f'CASE ' \
+           f'WHEN {column_name} < \'0001-01-01 00:00:00.000\' ' \
+           f'OR {column_name} > \'9999-12-31 23:59:59.999\' THEN \'9999-12-31 23:59:59.999\' ' \
+           f'ELSE {column_name} ' \
+           f'END'
+
 def prepare_columns_sql(c):
     column_name = f""" "{canonicalize_identifier(c)}" """
     return column_name
 
 
+def prepare_columns_for_extraction_sql(c, md_map, conn_info):
+    """
+    Select expression of a column for the configured extraction engine. Binary COPY reads the columns it can
+    not decode as text.
+    """
+    if conn_info.get('extraction_engine') not in (EXTRACTION_ENGINE_COPY_BINARY, EXTRACTION_ENGINE_COPY_JSON):
+        return prepare_columns_for_select_sql(c, md_map)
+
+    sql_datatype = md_map.get(('properties', c), {}).get('sql-datatype')
+    if binary_copy.has_decoder(sql_datatype):
+        return prepare_columns_for_select_sql(c, md_map)
+
+    text_type = 'text[]' if sql_datatype and sql_datatype.endswith('[]') else 'text'
+    return f'{prepare_columns_sql(c)}::{text_type} AS {prepare_columns_sql(c)}'
+
+
+# pylint: disable=too-many-return-statements,too-many-branches
+def prepare_columns_for_json_sql(c, md_map):
+    """
+    Expression building the json value of a column the way selected_value_to_singer_value converts it, or
+    None when postgres can not build it
+    """
+    column_name = prepare_columns_sql(c)
+    sql_datatype = md_map.get(('properties', c), {}).get('sql-datatype')
+    if not sql_datatype:
+        return None
+
+    if sql_datatype.endswith('[]'):
+        # NULL arrays are sent as empty arrays
+        if sql_datatype[:-2] in JSON_AS_IS_TYPES:
+            return f"COALESCE(to_json({column_name}), '[]'::json)"
+        return None
+
+    if sql_datatype in JSON_AS_IS_TYPES:
+        return column_name
+
+    # fractional seconds are only sent when there are some, like datetime.isoformat does
+    if sql_datatype == 'timestamp without time zone':
+        return f"regexp_replace(to_char({clamped_timestamp_sql(column_name)}, " \
+               f"'YYYY-MM-DD\"T\"HH24:MI:SS.US'), '\\.000000$', '') || '+00:00'"
+    if sql_datatype == 'timestamp with time zone':
+        return f"regexp_replace(to_char({clamped_timestamp_sql(column_name)} AT TIME ZONE 'UTC', " \
+               f"'YYYY-MM-DD\"T\"HH24:MI:SS.US'), '\\.000000$', '') || '+00:00'"
+    if sql_datatype == 'date':
+        return f"CASE WHEN {column_name} = 'infinity' THEN '9999-12-31' " \
+               f"WHEN {column_name} = '-infinity' THEN '0001-01-01' " \
+               f"ELSE to_char({column_name}, 'YYYY-MM-DD') END || 'T00:00:00+00:00'"
+    if sql_datatype == 'time without time zone':
+        return f"regexp_replace(regexp_replace(to_char({column_name}, 'HH24:MI:SS.US'), '\\.000000$', ''), " \
+               f"'^24', '00')"
+    if sql_datatype == 'time with time zone':
+        # converted to UTC and without fractional seconds
+        return f"regexp_replace(to_char(({column_name} AT TIME ZONE 'UTC')::time, 'HH24:MI:SS'), '^24', '00')"
+    if sql_datatype == 'bit':
+        return f"{column_name}::text = '1'"
+    if sql_datatype == 'numeric':
+        return f"NULLIF({column_name}, 'NaN')"
+    if sql_datatype in ('real', 'double precision'):
+        return f"CASE WHEN {column_name} IN ('NaN', 'Infinity', '-Infinity') THEN NULL ELSE {column_name} END"
+    if sql_datatype == 'hstore':
+        return f"hstore_to_json({column_name})"
+
+    return None
+
+
+def prepare_json_record_sql(columns, md_map):
+    """
+    Expression building the json text of the singer record of a row, or None when a column can not be
+    built by postgres
+    """
+    values = [prepare_columns_for_json_sql(c, md_map) for c in columns]
+    if not columns or None in values:
+        return None
+
+    objects = []
+    for idx in range(0, len(columns), JSON_OBJECT_MAX_COLUMNS):
+        arguments = [f"'{canonicalize_literal(c)}', {value}"
+                     for c, value in zip(columns[idx:idx + JSON_OBJECT_MAX_COLUMNS],
+                                         values[idx:idx + JSON_OBJECT_MAX_COLUMNS])]
+        objects.append(f"json_build_object({', '.join(arguments)})")
+
+    if len(objects) == 1:
+        return f"{objects[0]}::text"
+    return f"({' || '.join(f'{o}::jsonb' for o in objects)})::text"
+
+
+def uses_json_records(columns, md_map, conn_info):
+    """
+    Tells if the records of the columns are built by postgres with the configured extraction engine
+    """
+    return conn_info.get('extraction_engine') == EXTRACTION_ENGINE_COPY_JSON and \
+        prepare_json_record_sql(columns, md_map) is not None
+
+
+def prepare_select_list_sql(columns, md_map, conn_info):
+    """
+    Select list reading the columns with the configured extraction engine. It is either the columns, or the
+    json record of the columns as a single text column when postgres builds the records.
+    """
+    if uses_json_records(columns, md_map, conn_info):
+        return [prepare_json_record_sql(columns, md_map)]
+
+    return [prepare_columns_for_extraction_sql(c, md_map, conn_info) for c in columns]
+
+
+def json_record_envelope(stream, version, time_extracted, md_map):
+    """
+    Returns the texts going before and after the json record in the RECORD messages of a stream
+    """
+    message = singer.format_message(singer.RecordMessage(stream=calculate_destination_stream_name(stream, md_map),
+                                                         record={},
+                                                         version=version,
+                                                         time_extracted=time_extracted))
+    before, after = message.split('"record": {}', 1)
+    return before + '"record": ', after
+
+
+# pylint: disable=too-many-arguments
+def fetch_rows(conn, conn_info, select_sql, columns, md_map, extra_text_columns=0):
+    """
+    Iterates over the rows of select_sql with the configured extraction engine. The select list has to be the
+    one returned by prepare_select_list_sql for the columns, followed by extra_text_columns expressions cast
+    to text.
+    """
+    if conn_info.get('extraction_engine') in (EXTRACTION_ENGINE_COPY_BINARY, EXTRACTION_ENGINE_COPY_JSON):
+        encoding = psycopg2.extensions.encodings[conn.encoding]
+        if uses_json_records(columns, md_map, conn_info):
+            sql_datatypes = ['json']
+        else:
+            sql_datatypes = [md_map.get(('properties', c), {}).get('sql-datatype') for c in columns]
+        decoders = binary_copy.column_decoders(sql_datatypes + ['text'] * extra_text_columns, encoding)
+        yield from binary_copy.copy_rows(conn, select_sql, decoders)
+    else:
+        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor, name='stitch_cursor') as cur:
+            cur.itersize = CURSOR_ITER_SIZE
+            cur.execute(select_sql)
+            yield from cur
+
+
 def filter_dbs_sql_clause(sql, filter_dbs):
     in_clause = " AND datname in (" + ",".join([f"'{b.strip(' ')}'" for b in filter_dbs.split(',')]) + ")"
     return sql + in_clause
@@ -181,15 +473,102 @@ def selected_value_to_singer_value(elem, sql_datatype):
     return selected_value_to_singer_value_impl(elem, sql_datatype)
 
 
+def array_converter(convert):
+    """
+    Wraps the converter of array elements into the converter of (nested) arrays, NULL arrays become empty
+    """
+    def convert_elements(elem):
+        if isinstance(elem, list):
+            return [convert_elements(e) for e in elem]
+        return convert(elem)
+
+    def convert_array(elem):
+        return [convert_elements(e) for e in (elem or [])]
+
+    return convert_array
+
+
+def _fast_path_converter(value_class, convert, sql_datatype):
+    """
+    Converts values of the class psycopg2 returns for a sql-datatype with convert, and anything else with
+    selected_value_to_singer_value_impl
+    """
+    def convert_value(elem):
+        if elem.__class__ is value_class:
+            return convert(elem)
+        return selected_value_to_singer_value_impl(elem, sql_datatype)
+
+    return convert_value
+
+
+def _convert_decimal(elem):
+    return None if elem.is_nan() else elem
+
+
+def _convert_float(elem):
+    return None if math.isnan(elem) or math.isinf(elem) else elem
+
+
+def _convert_json(elem):
+    return None if elem is None else json.loads(elem)
+
+
+def _identity(elem):
+    return elem
+
+
+# Converters of the most common sql-datatypes, the others go through selected_value_to_singer_value_impl
+SCALAR_CONVERTERS = {
+    'smallint': (int, _identity),
+    'integer': (int, _identity),
+    'bigint': (int, _identity),
+    'text': (str, _identity),
+    'character varying': (str, _identity),
+    'character': (str, _identity),
+    'citext': (str, _identity),
+    'uuid': (str, _identity),
+    'boolean': (bool, _identity),
+    'numeric': (decimal.Decimal, _convert_decimal),
+    'real': (float, _convert_float),
+    'double precision': (float, _convert_float),
+    'timestamp without time zone': (datetime.datetime, lambda elem: elem.isoformat() + '+00:00'),
+    'timestamp with time zone': (datetime.datetime, datetime.datetime.isoformat),
+    'date': (datetime.date, lambda elem: elem.isoformat() + 'T00:00:00+00:00'),
+}
+
+
+@lru_cache(maxsize=None)
+def value_converter(sql_datatype):
+    """
+    Returns the function converting values of a sql-datatype like selected_value_to_singer_value does. It is
+    resolved once per sql-datatype so that values do not walk the whole if-chain of conversions.
+    """
+    base_datatype = sql_datatype.replace('[]', '')
+    if base_datatype in ('json', 'jsonb'):
+        convert = _convert_json
+    elif base_datatype in SCALAR_CONVERTERS:
+        convert = _fast_path_converter(*SCALAR_CONVERTERS[base_datatype], base_datatype)
+    else:
+        convert = partial(selected_value_to_singer_value_impl, sql_datatype=base_datatype)
+
+    if sql_datatype.find('[]') > 0:
+        return array_converter(convert)
+    return convert
+
+
+def row_converters(columns, md_map):
+    """
+    Returns the value converters of the columns of a stream, to pass to selected_row_to_singer_message
+    """
+    return tuple(value_converter(md_map.get(('properties', c))['sql-datatype']) for c in columns)
+
+
 # pylint: disable=too-many-arguments
-def selected_row_to_singer_message(stream, row, version, columns, time_extracted, md_map):
-    row_to_persist = ()
-    for idx, elem in enumerate(row):
-        sql_datatype = md_map.get(('properties', columns[idx]))['sql-datatype']
-        cleaned_elem = selected_value_to_singer_value(elem, sql_datatype)
-        row_to_persist += (cleaned_elem,)
+def selected_row_to_singer_message(stream, row, version, columns, time_extracted, md_map, converters=None):
+    if converters is None:
+        converters = row_converters(columns, md_map)
 
-    rec = dict(zip(columns, row_to_persist))
+    rec = {column: convert(elem) for column, convert, elem in zip(columns, converters, row)}
 
     return singer.RecordMessage(
         stream=calculate_destination_stream_name(stream, md_map),
@@ -198,14 +577,84 @@ def selected_row_to_singer_message(stream, row, version, columns, time_extracted
         time_extracted=time_extracted)
 
 
+# Types whose arrays are read as arrays of strings, see register_type_adapters
+STRING_ARRAY_TYPES = ('citext', 'bit', 'uuid', 'money')
+
+# What stream syncs need to know about a database, fetched in one round trip once per database per process.
+# Table row types are left out of the types, there is one per table.
+SESSION_INFO_SQL = """
+SELECT current_setting('server_encoding'),
+       current_setting('client_encoding'),
+       EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'hstore' AND installed_version IS NOT NULL),
+       (SELECT json_agg(json_build_array(format_type(t.oid, NULL), t.typname, t.oid, t.typarray, t.typtype))
+          FROM pg_type AS t
+          LEFT JOIN pg_class AS c ON c.oid = t.typrelid
+         WHERE c.oid IS NULL OR c.relkind = 'c')::text"""
+
+_SESSION_INFO: Dict = {}
+_SESSION_INFO_LOCK = threading.Lock()
+
+
+def fetch_session_info(conn_info):
+    """
+    Fetches the encodings, hstore availability and type OIDs of a database
+    """
+    with pooled_connection(conn_info) as conn:
+        with conn.cursor() as cur:
+            cur.execute(SESSION_INFO_SQL)
+            server_encoding, client_encoding, hstore_installed, types_json = cur.fetchone()
+
+    types = json.loads(types_json or '[]')
+    oids_by_name = {typname: (oid, typarray) for _, typname, oid, typarray, _ in types}
+    return {
+        'server_encoding': server_encoding,
+        'client_encoding': client_encoding,
+        'hstore_available': hstore_installed,
+        'hstore_oids': oids_by_name.get('hstore') if hstore_installed else None,
+        'string_array_oids': {name: oids_by_name[name][1] for name in STRING_ARRAY_TYPES
+                              if name in oids_by_name},
+        'enum_array_oids': sorted({typarray for _, _, _, typarray, typtype in types if typtype == 'e'}),
+        'type_names': frozenset(type_name for type_name, *_ in types),
+    }
+
+
+def session_info(conn_info, sql_datatypes: Iterable[str] = ()):
+    """
+    Returns the session info of the database of conn_info, fetched once per database per process.
+    It is fetched again when one of sql_datatypes is missing from it: a type created after it was fetched.
+    """
+    key = (conn_info['host'], conn_info['port'], conn_info['dbname'])
+    with _SESSION_INFO_LOCK:
+        info = _SESSION_INFO.get(key)
+        # the type names have no type modifiers
+        missing_types = {TYPE_MODIFIERS_RE.sub('', t) for t in sql_datatypes}.difference(info['type_names']) \
+            if info else set()
+        if info is None or missing_types:
+            if missing_types:
+                LOGGER.info('Types %s are not cached, fetching the session info of %s again',
+                            missing_types, conn_info['dbname'])
+            info = _SESSION_INFO[key] = fetch_session_info(conn_info)
+            LOGGER.info("Server Encoding: %s, Client Encoding: %s, hstore is %s",
+                        info['server_encoding'],
+                        info['client_encoding'],
+                        'available' if info['hstore_available'] else 'UNavailable')
+
+    return info
+
+
 def hstore_available(conn_info):
-    with open_connection(conn_info) as conn:
-        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor, name='stitch_cursor') as cur:
-            cur.execute(""" SELECT installed_version FROM pg_available_extensions WHERE name = 'hstore' """)
-            res = cur.fetchone()
-            if res and res[0]:
-                return True
-            return False
+    return session_info(conn_info)['hstore_available']
+
+
+def register_hstore(conn, conn_info):
+    """
+    Registers the hstore adapter on conn with the cached hstore OIDs, instead of querying them every time
+    """
+    hstore_oids = session_info(conn_info)['hstore_oids']
+    if hstore_oids is None:
+        psycopg2.extras.register_hstore(conn)
+    else:
+        psycopg2.extras.register_hstore(conn, oid=hstore_oids[0], array_oid=hstore_oids[1])
 
 
 def compute_tap_stream_id(schema_name, table_name):
@@ -267,9 +716,8 @@ def attempt_connection_to_db(conn_config, dbname):
     nascent_config['dbname'] = dbname
     LOGGER.info('(%s) Testing connectivity...', dbname)
     try:
-        conn = open_connection(nascent_config)
-        LOGGER.info('(%s) connectivity verified', dbname)
-        conn.close()
+        with pooled_connection(nascent_config):
+            LOGGER.info('(%s) connectivity verified', dbname)
         return True
     except Exception as err:
         LOGGER.warning('Unable to connect to %s. This maybe harmless if you '
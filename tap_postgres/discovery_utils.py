@@ -65,9 +65,13 @@ def produce_table_info(conn, filter_schemas=None, tables: Optional[List[str]] =
         cur.itersize = post_db.CURSOR_ITER_SIZE
         table_info = {}
         # SELECT CASE WHEN $2.typtype = 'd' THEN $2.typbasetype ELSE $1.atttypid END
+        # pg_stats has two rows per column of a parent table, the row including its children is the one summed
         sql = """
 SELECT
   pg_class.reltuples::BIGINT                            AS approximate_row_count,
+  pg_relation_size(pg_class.oid)                        AS relation_size,
+  table_stats.row_width                                 AS row_width,
+  GREATEST(stat.last_analyze, stat.last_autoanalyze)    AS last_analyzed,
   (pg_class.relkind = 'v' or pg_class.relkind = 'm')    AS is_view,
   n.nspname                                             AS schema_name,
   pg_class.relname                                      AS table_name,
@@ -101,6 +105,15 @@ LEFT OUTER JOIN pg_index as i
 LEFT OUTER JOIN pg_type AS subpgt
   ON pgt.typelem = subpgt.oid
  AND pgt.typelem != 0
+LEFT OUTER JOIN pg_stat_all_tables AS stat
+  ON stat.relid = pg_class.oid
+LEFT OUTER JOIN (SELECT schemaname, tablename, SUM(avg_width)::BIGINT AS row_width
+                   FROM (SELECT DISTINCT ON (schemaname, tablename, attname) schemaname, tablename, avg_width
+                           FROM pg_stats
+                          ORDER BY schemaname, tablename, attname, inherited DESC) AS column_stats
+                  GROUP BY schemaname, tablename) AS table_stats
+  ON table_stats.schemaname = n.nspname
+ AND table_stats.tablename = pg_class.relname
 WHERE attnum > 0
 AND NOT a.attisdropped
 AND pg_class.relkind IN ('r', 'v', 'm', 'p')
@@ -116,17 +129,28 @@ AND has_column_privilege(pg_class.oid, attname, 'SELECT') = true """
         cur.execute(sql)
 
         for row in cur.fetchall():
-            row_count, is_view, schema_name, table_name, *col_info = row
+            schema_name, table_name = row['schema_name'], row['table_name']
 
             if table_info.get(schema_name) is None:
                 table_info[schema_name] = {}
 
             if table_info[schema_name].get(table_name) is None:
-                table_info[schema_name][table_name] = {'is_view': is_view, 'row_count': row_count, 'columns': {}}
-
-            col_name = col_info[0]
-
-            table_info[schema_name][table_name]['columns'][col_name] = Column(*col_info)
+                table_info[schema_name][table_name] = {'is_view': row['is_view'],
+                                                       'row_count': row['approximate_row_count'],
+                                                       'relation_size': row['relation_size'],
+                                                       'row_width': row['row_width'],
+                                                       'last_analyzed': row['last_analyzed'],
+                                                       'columns': {}}
+
+            table_info[schema_name][table_name]['columns'][row['column_name']] = Column(
+                column_name=row['column_name'],
+                is_primary_key=row['primary_key'],
+                sql_data_type=row['data_type'],
+                character_maximum_length=row['character_maximum_length'],
+                numeric_precision=row['numeric_precision'],
+                numeric_scale=row['numeric_scale'],
+                is_array=row['is_array'],
+                is_enum=row['is_enum'])
 
         return table_info
 
@@ -151,6 +175,7 @@ def discover_columns(connection, table_info):
             metadata.write(mdata, (), 'database-name', database_name)
             metadata.write(mdata, (), 'row-count', table_info[schema_name][table_name]['row_count'])
             metadata.write(mdata, (), 'is-view', table_info[schema_name][table_name].get('is_view'))
+            write_table_statistics_md(mdata, table_info[schema_name][table_name])
 
             column_schemas = {col_name: schema_for_column(col_info) for col_name, col_info in columns.items()}
 
@@ -184,6 +209,24 @@ def discover_columns(connection, table_info):
     return entries
 
 
+def write_table_statistics_md(mdata, table):
+    """
+    Writes the size statistics of a table used to plan the order streams are synced in. Statistics postgres
+    does not have are left out: tables without storage (views, partitioned tables) or never written to have no
+    relation-size, and tables never analyzed have no row-width nor last-analyzed.
+    """
+    if table.get('relation_size'):
+        metadata.write(mdata, (), 'relation-size', table['relation_size'])
+
+    if table.get('row_width') is not None:
+        metadata.write(mdata, (), 'row-width', table['row_width'])
+
+    if table.get('last_analyzed') is not None:
+        metadata.write(mdata, (), 'last-analyzed', table['last_analyzed'].isoformat())
+
+    return mdata
+
+
 # pylint: disable=too-many-return-statements,too-many-branches,too-many-statements
 def schema_for_column_datatype(col):
     """
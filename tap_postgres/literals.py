@@ -0,0 +1,171 @@
+from typing import Callable, Dict, List, Optional
+
+
+class LiteralParseError(Exception):
+    """Custom exception when a postgres text literal is malformed"""
+
+
+BOOLEAN_VALUES = {'t': True, 'true': True, 'y': True, 'yes': True, 'on': True, '1': True,
+                  'f': False, 'false': False, 'n': False, 'no': False, 'off': False, '0': False}
+
+
+def parse_boolean(text: str) -> bool:
+    """
+    Parses the text of a boolean like the boolean input function of postgres
+    """
+    try:
+        return BOOLEAN_VALUES[text.strip().lower()]
+    except KeyError as exc:
+        raise LiteralParseError(f'invalid input syntax for type boolean: "{text}"') from exc
+
+
+def _skip_whitespace(text, pos):
+    while pos < len(text) and text[pos].isspace():
+        pos += 1
+    return pos
+
+
+def _parse_quoted_element(text, pos):
+    """
+    Parses the double quoted array element starting at pos, returns its value and the position after it
+    """
+    chars = []
+    pos += 1
+    while True:
+        char = text[pos]
+        if char == '"':
+            return ''.join(chars), pos + 1
+        if char == '\\':
+            pos += 1
+            char = text[pos]
+        chars.append(char)
+        pos += 1
+
+
+def _parse_unquoted_element(text, pos):
+    """
+    Parses the unquoted array element starting at pos, returns its value and the position after it. The value
+    is None for NULL elements.
+    """
+    chars = []
+    escaped = False
+    # length of the value without trailing whitespace, which is not part of unquoted elements
+    length = 0
+    while text[pos] not in ',}':
+        char = text[pos]
+        if char in '{"':
+            raise LiteralParseError(f'Unexpected "{char}" in array literal: {text}')
+        if char == '\\':
+            pos += 1
+            chars.append(text[pos])
+            escaped = True
+            length = len(chars)
+        else:
+            chars.append(char)
+            if not char.isspace():
+                length = len(chars)
+        pos += 1
+
+    value = ''.join(chars[:length])
+    if not escaped and value.upper() == 'NULL':
+        return None, pos
+    return value, pos
+
+
+def parse_array(text: str, parse_element: Callable[[str], object] = str) -> List:
+    """
+    Parses the text representation of a postgres array, e.g. '{{1,NULL},{"a \\"b\\"",c}}', into nested lists.
+    Elements are converted with parse_element, NULL elements are None.
+    """
+    pos = _skip_whitespace(text, 0)
+
+    # optional dimension decoration, e.g. [1:2][0:1]={...}
+    if text.startswith('[', pos):
+        pos = _skip_whitespace(text, text.index('=', pos) + 1)
+
+    if not text.startswith('{', pos):
+        raise LiteralParseError(f'Array literal must start with "{{": {text}')
+
+    stack: List[List] = []
+    result: Optional[List] = None
+    try:
+        while result is None:
+            char = text[pos]
+            if char == '{':
+                array: List = []
+                if stack:
+                    stack[-1].append(array)
+                stack.append(array)
+                pos += 1
+            elif char == '}':
+                array = stack.pop()
+                if not stack:
+                    result = array
+                pos += 1
+            elif char == ',' or char.isspace():
+                pos += 1
+            elif char == '"':
+                value, pos = _parse_quoted_element(text, pos)
+                stack[-1].append(parse_element(value))
+            else:
+                value, pos = _parse_unquoted_element(text, pos)
+                stack[-1].append(None if value is None else parse_element(value))
+    except IndexError as exc:
+        raise LiteralParseError(f'Unterminated array literal: {text}') from exc
+
+    if _skip_whitespace(text, pos) != len(text):
+        raise LiteralParseError(f'Junk after closing right brace in array literal: {text}')
+
+    return result
+
+
+def _parse_hstore_token(text, pos):
+    """
+    Parses the quoted or unquoted hstore key or value starting at pos, returns it, whether it was quoted and
+    the position after it
+    """
+    if text[pos] == '"':
+        value, pos = _parse_quoted_element(text, pos)
+        return value, True, pos
+
+    chars = []
+    while pos < len(text) and not text[pos].isspace() and text[pos] not in ',"' \
+            and not text.startswith('=>', pos):
+        if text[pos] == '\\':
+            pos += 1
+        chars.append(text[pos])
+        pos += 1
+
+    if not chars:
+        raise LiteralParseError(f'Unexpected end of hstore or missing key or value: {text}')
+    return ''.join(chars), False, pos
+
+
+def parse_hstore(text: str) -> Dict[str, Optional[str]]:
+    """
+    Parses the text representation of a hstore, e.g. '"a"=>"1", "b"=>NULL', into a dictionary. NULL values are
+    None.
+    """
+    pairs = {}
+    pos = _skip_whitespace(text, 0)
+    try:
+        while pos < len(text):
+            key, _, pos = _parse_hstore_token(text, pos)
+
+            pos = _skip_whitespace(text, pos)
+            if not text.startswith('=>', pos):
+                raise LiteralParseError(f'Expected "=>" after hstore key "{key}": {text}')
+            pos = _skip_whitespace(text, pos + 2)
+
+            value, quoted, pos = _parse_hstore_token(text, pos)
+            pairs[key] = None if not quoted and value.upper() == 'NULL' else value
+
+            pos = _skip_whitespace(text, pos)
+            if pos < len(text):
+                if text[pos] != ',':
+                    raise LiteralParseError(f'Expected "," after hstore value of "{key}": {text}')
+                pos = _skip_whitespace(text, pos + 1)
+    except IndexError as exc:
+        raise LiteralParseError(f'Unterminated hstore: {text}') from exc
+
+    return pairs
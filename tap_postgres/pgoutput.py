@@ -0,0 +1,211 @@
+import struct
+
+from typing import Dict, List, Optional
+
+from tap_postgres import literals
+
+# pgoutput logical replication protocol (version 1),
+# see https://www.postgresql.org/docs/current/protocol-logicalrep-message-formats.html
+PROTO_VERSION = 1
+
+_INT8 = struct.Struct('!b')
+_INT16 = struct.Struct('!h')
+_INT32 = struct.Struct('!i')
+_UINT32 = struct.Struct('!I')
+
+# Replica identity columns are flagged in Relation messages
+COLUMN_FLAG_KEY = 1
+
+# Built-in type OIDs whose text is sent by wal2json as a json boolean or number,
+# every other type is kept as text like wal2json does
+TEXT_VALUE_PARSERS = {
+    16: literals.parse_boolean,  # boolean
+    20: int,  # bigint
+    21: int,  # smallint
+    23: int,  # integer
+    26: int,  # oid
+    700: float,  # real
+    701: float,  # double precision
+}
+
+
+class PgoutputDecodeError(Exception):
+    """Custom exception when a pgoutput message cannot be decoded"""
+
+
+class _Reader:
+    """Reads the fields of one pgoutput message"""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def byte(self) -> str:
+        """Reads a single byte as a character"""
+        value = chr(self.data[self.pos])
+        self.pos += 1
+        return value
+
+    def int8(self) -> int:
+        """Reads a signed 8 bit integer"""
+        value = _INT8.unpack_from(self.data, self.pos)[0]
+        self.pos += 1
+        return value
+
+    def int16(self) -> int:
+        """Reads a signed 16 bit integer in network byte order"""
+        value = _INT16.unpack_from(self.data, self.pos)[0]
+        self.pos += 2
+        return value
+
+    def int32(self) -> int:
+        """Reads a signed 32 bit integer in network byte order"""
+        value = _INT32.unpack_from(self.data, self.pos)[0]
+        self.pos += 4
+        return value
+
+    def oid(self) -> int:
+        """Reads an unsigned 32 bit OID in network byte order"""
+        value = _UINT32.unpack_from(self.data, self.pos)[0]
+        self.pos += 4
+        return value
+
+    def string(self, encoding) -> str:
+        """Reads a null terminated string"""
+        end = self.data.index(b'\x00', self.pos)
+        value = self.data[self.pos:end].decode(encoding)
+        self.pos = end + 1
+        return value
+
+    def read_bytes(self, length) -> bytes:
+        """Reads length bytes, raises IndexError if the message is shorter"""
+        if self.pos + length > len(self.data):
+            raise IndexError('pgoutput message is truncated')
+        value = self.data[self.pos:self.pos + length]
+        self.pos += length
+        return value
+
+
+# pylint: disable=too-few-public-methods
+class PgoutputDecoder:
+    """
+    Decodes the binary messages of the pgoutput plugin into the payloads wal2json sends with format-version 2,
+    so both plugins feed the same record pipeline. Relation and Type messages, which pgoutput sends before the
+    first change of a table or custom type in the session and again after they change, are cached by OID.
+    """
+
+    def __init__(self, encoding: str = 'utf-8'):
+        self.encoding = encoding
+        # relation OID -> {'schema', 'table', 'columns': [{'name', 'type_oid', 'key'}]}
+        self.relations: Dict[int, Dict] = {}
+        # custom type OID -> (schema, name)
+        self.types: Dict[int, tuple] = {}
+
+    def decode(self, data: bytes) -> Optional[Dict]:
+        """
+        Decodes one pgoutput message. Returns the wal2json style payload of Insert, Update and Delete
+        messages and None for any other message.
+        """
+        reader = _Reader(data)
+        try:
+            kind = reader.byte()
+            if kind == 'R':
+                self._decode_relation(reader)
+            elif kind == 'Y':
+                type_oid = reader.oid()
+                self.types[type_oid] = (reader.string(self.encoding), reader.string(self.encoding))
+            elif kind == 'I':
+                return self._decode_insert(reader)
+            elif kind == 'U':
+                return self._decode_update(reader)
+            elif kind == 'D':
+                return self._decode_delete(reader)
+            elif kind not in {'B', 'C', 'O', 'T', 'M'}:
+                raise PgoutputDecodeError(f'Unknown pgoutput message type "{kind}"')
+        except (IndexError, ValueError, struct.error) as exc:
+            raise PgoutputDecodeError(f'Malformed pgoutput message: {data!r}') from exc
+
+        return None
+
+    def _decode_relation(self, reader):
+        relation_oid = reader.oid()
+        schema = reader.string(self.encoding) or 'pg_catalog'
+        table = reader.string(self.encoding)
+        reader.int8()  # replica identity setting
+        columns = []
+        for _ in range(reader.int16()):
+            flags = reader.int8()
+            name = reader.string(self.encoding)
+            type_oid = reader.oid()
+            reader.int32()  # type modifier
+            columns.append({'name': name, 'type_oid': type_oid, 'key': bool(flags & COLUMN_FLAG_KEY)})
+
+        self.relations[relation_oid] = {'schema': schema, 'table': table, 'columns': columns}
+
+    def _relation(self, reader):
+        relation_oid = reader.oid()
+        try:
+            return self.relations[relation_oid]
+        except KeyError as exc:
+            raise PgoutputDecodeError(f'Change of relation {relation_oid} received before its Relation message') \
+                from exc
+
+    def _decode_tuple(self, reader, relation, key_only=False) -> List[Dict]:
+        """
+        Decodes TupleData into wal2json style columns. Unchanged TOASTed values are left out, as wal2json does,
+        and so are the columns outside of the replica identity of key only tuples.
+        """
+        columns = relation['columns']
+        ncolumns = reader.int16()
+        if ncolumns != len(columns):
+            raise PgoutputDecodeError(f'Tuple has {ncolumns} columns, relation {relation["schema"]}.'
+                                      f'{relation["table"]} has {len(columns)}')
+
+        values = []
+        for column in columns:
+            kind = reader.byte()
+            if kind == 'n':
+                value = None
+            elif kind == 't':
+                text = reader.read_bytes(reader.int32()).decode(self.encoding)
+                parse = TEXT_VALUE_PARSERS.get(column['type_oid'])
+                value = text if parse is None else parse(text)
+            elif kind == 'u':
+                continue
+            else:
+                raise PgoutputDecodeError(f'Unknown pgoutput tuple column kind "{kind}"')
+
+            if not key_only or column['key']:
+                values.append({'name': column['name'], 'value': value})
+
+        return values
+
+    def _decode_insert(self, reader):
+        relation = self._relation(reader)
+        if reader.byte() != 'N':
+            raise PgoutputDecodeError('Insert message without new tuple')
+
+        return {'action': 'I', 'schema': relation['schema'], 'table': relation['table'],
+                'columns': self._decode_tuple(reader, relation)}
+
+    def _decode_update(self, reader):
+        relation = self._relation(reader)
+        kind = reader.byte()
+        if kind in {'K', 'O'}:
+            # old key or old row, only sent when the replica identity changed
+            self._decode_tuple(reader, relation, key_only=kind == 'K')
+            kind = reader.byte()
+        if kind != 'N':
+            raise PgoutputDecodeError('Update message without new tuple')
+
+        return {'action': 'U', 'schema': relation['schema'], 'table': relation['table'],
+                'columns': self._decode_tuple(reader, relation)}
+
+    def _decode_delete(self, reader):
+        relation = self._relation(reader)
+        kind = reader.byte()
+        if kind not in {'K', 'O'}:
+            raise PgoutputDecodeError('Delete message without old key or old tuple')
+
+        return {'action': 'D', 'schema': relation['schema'], 'table': relation['table'],
+                'identity': self._decode_tuple(reader, relation, key_only=kind == 'K')}
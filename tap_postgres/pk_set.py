@@ -0,0 +1,77 @@
+import json
+import os
+import re
+
+from typing import Iterable, Iterator, List, Optional
+
+import singer
+
+LOGGER = singer.get_logger('tap_postgres')
+
+
+def _read_keys(path: str, key_columns: List[str]) -> Iterator[list]:
+    """
+    Iterates over the keys of a primary key set file, the first line of which lists its key columns.
+    Yields nothing if the file does not exist or was written for other key columns.
+    """
+    if not os.path.exists(path):
+        return
+
+    with open(path, encoding='utf-8') as keys_file:
+        if json.loads(keys_file.readline() or 'null') != key_columns:
+            LOGGER.warning('Primary key set %s was written for other key columns, ignoring it', path)
+            return
+
+        for line in keys_file:
+            yield json.loads(line)
+
+
+def set_path(directory: str, tap_stream_id: str, generation: int) -> str:
+    """
+    Path of the primary key set of a generation of a stream
+    """
+    return os.path.join(directory, f'{tap_stream_id}.{generation}.pks')
+
+
+def remove_sets(directory: str, tap_stream_id: str, keep: Iterable[int]):
+    """
+    Removes the primary key sets of a stream, and their leftover temporary files, but the generations of keep
+    """
+    set_file_name = re.compile(re.escape(tap_stream_id) + r'\.(\d+)\.pks(\.tmp)?')
+    for file_name in os.listdir(directory):
+        match = set_file_name.fullmatch(file_name)
+        if match and int(match.group(1)) not in keep:
+            os.remove(os.path.join(directory, file_name))
+
+
+def diff_key_sets(previous_path: Optional[str], path: str, key_columns: List[str],
+                  current_keys: Iterable) -> Iterator[list]:
+    """
+    Merges the sorted current_keys with the sorted keys stored at previous_path and yields the keys of the
+    previous set missing from current_keys. Both sets are read one key at a time, so memory does not grow with
+    the size of the table.
+
+    current_keys are written as a new set at path once they are all read. The previous set is left as it is:
+    it stays the one to diff against until the state naming the new set is committed by the target.
+    """
+    previous_keys = _read_keys(previous_path, key_columns) if previous_path else iter(())
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as keys_file:
+        keys_file.write(json.dumps(key_columns) + '\n')
+
+        previous_key = next(previous_keys, None)
+        for key in current_keys:
+            key = list(key)
+            keys_file.write(json.dumps(key) + '\n')
+
+            while previous_key is not None and previous_key < key:
+                yield previous_key
+                previous_key = next(previous_keys, None)
+            if previous_key == key:
+                previous_key = next(previous_keys, None)
+
+        while previous_key is not None:
+            yield previous_key
+            previous_key = next(previous_keys, None)
+
+    os.replace(tmp_path, path)
@@ -0,0 +1,168 @@
+import copy
+import heapq
+import singer
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+from functools import partial
+from typing import Callable, Dict, List
+from singer import metadata
+
+import tap_postgres.sync_strategies.common as sync_common
+
+LOGGER = singer.get_logger('tap_postgres')
+
+# State key listing every stream in flight when streams are synced concurrently
+CURRENTLY_SYNCING_STREAMS = 'currently_syncing_streams'
+
+# Width in bytes assumed for the rows of tables postgres has no statistics about
+DEFAULT_ROW_WIDTH = 100
+
+
+def get_currently_syncing_streams(state: Dict) -> List[str]:
+    """
+    Returns the streams that were in flight when the state was written, the single currently_syncing stream
+    of a sequential sync or the currently_syncing_streams of a concurrent one
+    """
+    streams = list(state.get(CURRENTLY_SYNCING_STREAMS) or [])
+    currently_syncing = singer.get_currently_syncing(state)
+    if currently_syncing and currently_syncing not in streams:
+        streams.insert(0, currently_syncing)
+    return streams
+
+
+def estimate_stream_size(stream: Dict) -> int:
+    """
+    Estimates the bytes read to sync a stream from the statistics discovery writes into its metadata: the size
+    of its table, or its row-count times its row-width when postgres has no size for it. INCREMENTAL streams
+    usually read a fraction of it, the size of the table is their upper bound.
+    """
+    md_root = metadata.to_map(stream['metadata']).get((), {})
+    if md_root.get('relation-size'):
+        return md_root['relation-size']
+
+    row_count = max(md_root.get('row-count') or 0, 0)
+    return row_count * (md_root.get('row-width') or DEFAULT_ROW_WIDTH)
+
+
+def plan_streams(streams: List[Dict], workers: int) -> List[Dict]:
+    """
+    Orders streams largest first, which is the order the scheduler should start them in: handing the next
+    largest stream to whichever worker frees up first keeps the largest tables from starting last and bounds
+    the run to the largest stream or about an even share of the total work.
+    Logs the estimated total work and the share of the busiest worker.
+    """
+    sizes = {stream['tap_stream_id']: estimate_stream_size(stream) for stream in streams}
+    planned = sorted(streams, key=lambda stream: sizes[stream['tap_stream_id']], reverse=True)
+
+    worker_loads = [0] * max(workers, 1)
+    for stream in planned:
+        heapq.heapreplace(worker_loads, worker_loads[0] + sizes[stream['tap_stream_id']])
+
+    LOGGER.info('Estimated work of %i streams: %.1f MB, %.1f MB on the busiest of %i workers',
+                len(streams), sum(sizes.values()) / 1024 ** 2, max(worker_loads) / 1024 ** 2, len(worker_loads))
+    return planned
+
+
+class StreamScheduler:
+    """
+    Syncs streams concurrently on a pool of worker threads, each stream on its own connections.
+
+    Every stream is synced with its own copy of the state. Singer messages of a stream are written in the order
+    the stream writes them, and its STATE messages are replaced by the merged state: the bookmarks of every
+    stream as last written by that stream, with the streams in flight in currently_syncing_streams.
+    """
+
+    def __init__(self, state: Dict, workers: int):
+        self.state = copy.deepcopy(state)
+        self.workers = workers
+        self.in_flight: List[str] = []
+
+    def _write_state(self):
+        """
+        Writes the merged state, the caller holds sync_common.OUTPUT_LOCK
+        """
+        self.state['currently_syncing'] = self.in_flight[0] if self.in_flight else None
+        self.state[CURRENTLY_SYNCING_STREAMS] = list(self.in_flight)
+        singer.write_message(singer.StateMessage(value=copy.deepcopy(self.state)))
+
+    def _merge_stream_state(self, tap_stream_id, stream_state):
+        bookmark = stream_state.get('bookmarks', {}).get(tap_stream_id)
+        if bookmark is None:
+            self.state.get('bookmarks', {}).pop(tap_stream_id, None)
+        else:
+            self.state.setdefault('bookmarks', {})[tap_stream_id] = copy.deepcopy(bookmark)
+
+    def _start_stream(self, tap_stream_id):
+        with sync_common.OUTPUT_LOCK:
+            self.in_flight.append(tap_stream_id)
+            return copy.deepcopy(self.state)
+
+    def _finish_stream(self, tap_stream_id, stream_state):
+        with sync_common.OUTPUT_LOCK:
+            self._merge_stream_state(tap_stream_id, stream_state)
+            self.in_flight.remove(tap_stream_id)
+            self._write_state()
+
+    def _on_state(self, tap_stream_id, stream_state):
+        with sync_common.OUTPUT_LOCK:
+            self._merge_stream_state(tap_stream_id, stream_state)
+            self._write_state()
+
+    def _on_group_state(self, streams, group_state):
+        with sync_common.OUTPUT_LOCK:
+            for stream in streams:
+                self._merge_stream_state(stream['tap_stream_id'], group_state)
+            singer.write_message(singer.StateMessage(value=copy.deepcopy(self.state)))
+
+    def _sync_group(self, streams, sync_group):
+        with sync_common.OUTPUT_LOCK:
+            group_state = copy.deepcopy(self.state)
+        with sync_common.state_handler(lambda value: self._on_group_state(streams, value)):
+            group_state = sync_group(streams, group_state)
+
+        self._on_group_state(streams, group_state)
+
+    def _sync_stream(self, stream, sync_stream):
+        tap_stream_id = stream['tap_stream_id']
+        stream_state = self._start_stream(tap_stream_id)
+        # a failed stream stays in currently_syncing_streams to be resumed first by the next run
+        with sync_common.state_handler(lambda value: self._on_state(tap_stream_id, value)):
+            stream_state = sync_stream(stream, stream_state)
+
+        self._finish_stream(tap_stream_id, stream_state)
+
+    def run(self, streams: List[Dict], sync_stream: Callable[[Dict, Dict], Dict]) -> Dict:
+        """
+        Syncs the streams in the given order with sync_stream(stream, state), which returns the state of the
+        stream, and returns the merged state. Streams not started yet are cancelled when a stream fails.
+        """
+        LOGGER.info('Syncing %i streams with %i workers', len(streams), self.workers)
+        self._run([partial(self._sync_stream, stream, sync_stream) for stream in streams])
+
+        self.state['currently_syncing'] = None
+        self.state.pop(CURRENTLY_SYNCING_STREAMS, None)
+        return self.state
+
+    def run_groups(self, groups: List[List[Dict]], sync_group: Callable[[List[Dict], Dict], Dict]) -> Dict:
+        """
+        Syncs groups of streams that are synced together, like the LOG_BASED streams of a database, with
+        sync_group(streams, state), which returns the state of the streams, and returns the merged state.
+        Groups are not listed in currently_syncing_streams, their bookmarks are where they resume from.
+        """
+        LOGGER.info('Syncing %i groups of streams with %i workers', len(groups), self.workers)
+        self._run([partial(self._sync_group, streams, sync_group) for streams in groups])
+        return self.state
+
+    def _run(self, tasks):
+        """
+        Runs the tasks on the worker threads, tasks not started yet are cancelled when a task fails
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(task) for task in tasks]
+            _, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in not_done:
+                future.cancel()
+
+        for future in futures:
+            if not future.cancelled():
+                future.result()
@@ -6,7 +6,7 @@ import singer
 from typing import List, Dict
 from singer import metadata
 
-from tap_postgres.db import open_connection
+from tap_postgres.db import pooled_connection
 from tap_postgres.discovery_utils import discover_db
 
 LOGGER = singer.get_logger('tap_postgres')
@@ -66,7 +66,7 @@ def refresh_streams_schema(conn_config: Dict, streams: List[Dict]):
     LOGGER.debug('Current streams schemas %s', streams)
 
     # Run discovery to get the streams most up to date json schemas
-    with open_connection(conn_config) as conn:
+    with pooled_connection(conn_config) as conn:
         new_discovery = {
             stream['tap_stream_id']: stream
             for stream in discover_db(conn, conn_config.get('filter_schemas'), [st['table_name'] for st in streams])
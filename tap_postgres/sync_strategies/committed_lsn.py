@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+import singer
+
+from typing import List, Optional
+
+LOGGER = singer.get_logger('tap_postgres')
+
+# Seconds between two checks of the lsn acknowledgement file for changes
+ACK_FILE_POLL_INTERVAL = 0.1
+
+
+def parse_lsn(lsn_text: str) -> int:
+    """
+    Parses an lsn written as an integer or as a pg_lsn text
+    """
+    if '/' in lsn_text:
+        file, index = lsn_text.split('/')
+        return (int(file, 16) << 32) + int(index, 16)
+
+    return int(lsn_text)
+
+
+# pylint: disable=too-many-instance-attributes
+class CommittedLsnReader(threading.Thread):
+    """
+    Reads the lsn committed by the target, the oldest lsn bookmark of the replicated streams in the state file,
+    every poll_interval seconds on a thread of its own, so consuming the replication slot does not pause while
+    the file is read and parsed.
+
+    When the target acknowledges its durable lsn in ack_file instead, a file holding nothing but that lsn,
+    the state file is not read: the inode, modification time and size of ack_file are checked every
+    ACK_FILE_POLL_INTERVAL seconds and the file is read when any changed, so the slot is flushed as soon as
+    the target commits. The inode catches files replaced by a rename within the resolution of the modification
+    time.
+
+    The replication loop waits on the reader with select alongside the replication cursor: the reader is
+    readable whenever the committed lsn has moved, and is emptied by calling acknowledge.
+    """
+
+    def __init__(self, state_file: Optional[str], tap_stream_ids: List[str], lsn_comitted: int,
+                 poll_interval: float, ack_file: Optional[str] = None):
+        super().__init__(name='committed-lsn-reader', daemon=True)
+        self.state_file = state_file
+        self.tap_stream_ids = tap_stream_ids
+        self.lsn_comitted = lsn_comitted
+        self.poll_interval = poll_interval
+        self.ack_file = ack_file
+        self._ack_file_identity = None
+        self._stopped = threading.Event()
+        self._wake_up_read, self._wake_up_write = os.pipe()
+        os.set_blocking(self._wake_up_read, False)
+        os.set_blocking(self._wake_up_write, False)
+
+    def fileno(self) -> int:
+        """
+        The file descriptor select waits on, readable when the committed lsn has moved
+        """
+        return self._wake_up_read
+
+    def run(self):
+        if self.ack_file:
+            while not self._stopped.wait(ACK_FILE_POLL_INTERVAL):
+                self.read_ack_file()
+        else:
+            while not self._stopped.wait(self.poll_interval):
+                self.read_state_file()
+
+    def read_state_file(self):
+        """
+        Reads the committed lsn from the state file, wakes up the replication loop when it has moved
+        """
+        try:
+            with open(self.state_file, mode='r', encoding='utf-8') as state_fh:
+                state_comitted = json.load(state_fh)
+            lsn_comitted = min(singer.get_bookmark(state_comitted, tap_stream_id, 'lsn')
+                               for tap_stream_id in self.tap_stream_ids)
+        except Exception:
+            LOGGER.debug('Unable to open and parse %s', self.state_file)
+            return
+
+        self._commit(lsn_comitted)
+
+    def read_ack_file(self):
+        """
+        Reads the committed lsn from the acknowledgement file if it has been changed since it was last read,
+        wakes up the replication loop when it has moved. The lsn is an integer, like the lsn bookmarks, or a
+        pg_lsn text.
+        """
+        try:
+            stat = os.stat(self.ack_file)
+            identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if identity == self._ack_file_identity:
+                return
+
+            with open(self.ack_file, mode='r', encoding='utf-8') as ack_fh:
+                lsn_text = ack_fh.read().strip()
+            lsn_comitted = parse_lsn(lsn_text)
+        except (OSError, ValueError):
+            LOGGER.debug('Unable to read an lsn from %s', self.ack_file)
+            return
+
+        self._ack_file_identity = identity
+        self._commit(lsn_comitted)
+
+    def _commit(self, lsn_comitted):
+        if lsn_comitted > self.lsn_comitted:
+            self.lsn_comitted = lsn_comitted
+            try:
+                os.write(self._wake_up_write, b'\0')
+            except BlockingIOError:
+                # the pipe is full of wake ups the replication loop has not acknowledged yet
+                pass
+
+    def acknowledge(self) -> int:
+        """
+        Empties the wake up pipe and returns the committed lsn
+        """
+        try:
+            while os.read(self._wake_up_read, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        return self.lsn_comitted
+
+    def stop(self):
+        """
+        Stops the reader thread, if started, and closes the wake up pipe
+        """
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
+
+        os.close(self._wake_up_read)
+        os.close(self._wake_up_write)
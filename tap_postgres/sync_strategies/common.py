@@ -1,10 +1,20 @@
 import sys
+import threading
 import simplejson as json
 import singer
+
+from contextlib import contextmanager
 from singer import  metadata
 import tap_postgres.db as post_db
 
 
+# Serialises writes to stdout when more than one thread is emitting singer messages
+OUTPUT_LOCK = threading.Lock()
+
+# Per thread handler of STATE messages, set while a thread syncs a stream for the StreamScheduler
+_THREAD_OUTPUT = threading.local()
+
+
 # pylint: disable=invalid-name,missing-function-docstring
 def should_sync_column(md_map, field_name):
     field_metadata = md_map.get(('properties', field_name), {})
@@ -13,9 +23,19 @@ def should_sync_column(md_map, field_name):
                                     True)
 
 
+def write_json_record(envelope, record_json):
+    """
+    Writes a RECORD message around a record already serialised to json, see post_db.json_record_envelope
+    """
+    with OUTPUT_LOCK:
+        sys.stdout.write(envelope[0] + record_json + envelope[1] + '\n')
+        sys.stdout.flush()
+
+
 def write_schema_message(schema_message):
-    sys.stdout.write(json.dumps(schema_message, use_decimal=True) + '\n')
-    sys.stdout.flush()
+    with OUTPUT_LOCK:
+        sys.stdout.write(json.dumps(schema_message, use_decimal=True) + '\n')
+        sys.stdout.flush()
 
 
 def send_schema_message(stream, bookmark_properties):
@@ -32,3 +52,29 @@ def send_schema_message(stream, bookmark_properties):
                       'bookmark_properties': bookmark_properties}
 
     write_schema_message(schema_message)
+
+
+def write_message(message):
+    """
+    Thread safe variant of singer.write_message. STATE messages written by a thread that has a state handler
+    are passed to the handler instead, which writes the state merged with the progress of other threads.
+    """
+    on_state = getattr(_THREAD_OUTPUT, 'on_state', None)
+    if on_state is not None and isinstance(message, singer.StateMessage):
+        on_state(message.value)
+        return
+
+    with OUTPUT_LOCK:
+        singer.write_message(message)
+
+
+@contextmanager
+def state_handler(on_state):
+    """
+    Passes the STATE messages written with write_message by the current thread to on_state
+    """
+    _THREAD_OUTPUT.on_state = on_state
+    try:
+        yield
+    finally:
+        _THREAD_OUTPUT.on_state = None
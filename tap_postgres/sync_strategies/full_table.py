@@ -1,19 +1,94 @@
 import copy
+import math
 import time
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
 import singer
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from functools import partial
+from singer import metadata
 from singer import utils
 from singer import metrics
 
 import tap_postgres.db as post_db
+import tap_postgres.sync_strategies.common as sync_common
 
 LOGGER = singer.get_logger('tap_postgres')
 
 UPDATE_BOOKMARK_PERIOD = 1000
 
+# Approximate number of rows read by one worker in a single chunk when full_table_workers > 1
+CHUNK_SIZE = 1000000
+
+# TID range scans are available from PostgreSQL 14, before that a ctid range is a full table scan
+TID_RANGE_SCAN_MIN_VERSION = 140000
+
+CHUNKABLE_PK_TYPES = {'smallint', 'integer', 'bigint'}
+
+# Number of rows in one checksummed chunk when full_table_checksums is enabled
+CHECKSUM_CHUNK_SIZE = 10000
+
+# Bookmarks that are only present while a full table sync is in progress
+RESUME_BOOKMARKS = ('xmin', 'chunks', 'pk_keyset')
+
+
+# Modification counters of the ordinary tables of the current database. The relfilenode changes with TRUNCATE,
+# which the counters miss, and the reset time of the database statistics with pg_stat_reset.
+TABLE_STATS_SQL = """
+SELECT n.nspname, c.relname, c.relfilenode, s.n_tup_ins, s.n_tup_upd, s.n_tup_del,
+       pg_stat_get_db_stat_reset_time(d.oid)::text
+  FROM pg_class AS c
+  JOIN pg_namespace AS n ON n.oid = c.relnamespace
+  JOIN pg_stat_user_tables AS s ON s.relid = c.oid
+  JOIN pg_database AS d ON d.datname = current_database()
+ WHERE c.relkind = 'r'"""
+
+
+def fetch_table_stats(conn_config, streams):
+    """
+    Reads the modification statistics of the tables of streams, with one query per database. Partitioned
+    tables and views have no statistics of their own and are left out.
+    Returns the statistics by tap_stream_id.
+    """
+    streams_by_db = {}
+    for stream in streams:
+        md_root = metadata.to_map(stream['metadata']).get(())
+        streams_by_db.setdefault(md_root.get('database-name'), {})[
+            (md_root.get('schema-name'), stream['table_name'])] = stream['tap_stream_id']
+
+    table_stats = {}
+    for dbname, db_streams in streams_by_db.items():
+        with post_db.pooled_connection(dict(conn_config, dbname=dbname)) as conn:
+            with conn.cursor() as cur:
+                cur.execute(TABLE_STATS_SQL)
+                for row in cur.fetchall():
+                    tap_stream_id = db_streams.get((row[0], row[1]))
+                    if tap_stream_id is not None:
+                        table_stats[tap_stream_id] = table_stats_from_row(row)
+
+    return table_stats
+
+
+def table_stats_from_row(row):
+    """
+    Maps a row of TABLE_STATS_SQL to the statistics of its table
+    """
+    _, _, relfilenode, inserted, updated, deleted, stats_reset = row
+    return {'relfilenode': relfilenode,
+            'n_tup_ins': inserted,
+            'n_tup_upd': updated,
+            'n_tup_del': deleted,
+            'stats_reset': stats_reset}
+
+
+def is_interrupted(state, tap_stream_id):
+    """
+    Tells if a previous full table sync of the stream did not complete
+    """
+    return any(singer.get_bookmark(state, tap_stream_id, key) is not None for key in RESUME_BOOKMARKS)
+
 
 # pylint: disable=invalid-name,missing-function-docstring,too-many-locals,duplicate-code
 def sync_view(conn_info, stream, state, desired_columns, md_map):
@@ -21,27 +96,35 @@ def sync_view(conn_info, stream, state, desired_columns, md_map):
 
     # before writing the table version to state, check if we had one to begin with
     first_run = singer.get_bookmark(state, stream['tap_stream_id'], 'version') is None
+
+    # ctid chunks are not resumed: between runs an update, VACUUM FULL or CLUSTER can move a row of a pending
+    # chunk to a chunk already done, so an interrupted sync by ctid ranges starts over with a new version
+    chunks = singer.get_bookmark(state, stream['tap_stream_id'], 'chunks')
+    if chunks is not None and chunks['kind'] == 'ctid':
+        LOGGER.info("Not resuming the interrupted ctid chunks of %s, starting over", stream['tap_stream_id'])
+        state = singer.write_bookmark(state, stream['tap_stream_id'], 'chunks', None)
     nascent_stream_version = int(time.time() * 1000)
 
     state = singer.write_bookmark(state,
                                   stream['tap_stream_id'],
                                   'version',
                                   nascent_stream_version)
-    singer.write_message(singer.StateMessage(value=copy.deepcopy(state)))
+    sync_common.write_message(singer.StateMessage(value=copy.deepcopy(state)))
 
     schema_name = md_map.get(()).get('schema-name')
 
     escaped_columns = map(post_db.prepare_columns_sql, desired_columns)
+    converters = post_db.row_converters(desired_columns, md_map)
 
     activate_version_message = singer.ActivateVersionMessage(
         stream=post_db.calculate_destination_stream_name(stream, md_map),
         version=nascent_stream_version)
 
     if first_run:
-        singer.write_message(activate_version_message)
+        sync_common.write_message(activate_version_message)
 
     with metrics.record_counter(None) as counter:
-        with post_db.open_connection(conn_info) as conn:
+        with post_db.pooled_connection(conn_info) as conn:
             with conn.cursor(cursor_factory=psycopg2.extras.DictCursor, name='stitch_cursor') as cur:
                 cur.itersize = post_db.CURSOR_ITER_SIZE
                 select_sql = f"SELECT {','.join(escaped_columns)} FROM " \
@@ -57,30 +140,55 @@ def sync_view(conn_info, stream, state, desired_columns, md_map):
                                                                             nascent_stream_version,
                                                                             desired_columns,
                                                                             time_extracted,
-                                                                            md_map)
-                    singer.write_message(record_message)
+                                                                            md_map,
+                                                                            converters)
+                    sync_common.write_message(record_message)
                     rows_saved += 1
                     if rows_saved % UPDATE_BOOKMARK_PERIOD == 0:
-                        singer.write_message(singer.StateMessage(value=copy.deepcopy(state)))
+                        sync_common.write_message(singer.StateMessage(value=copy.deepcopy(state)))
 
                     counter.increment()
 
     # always send the activate version whether first run or subsequent
-    singer.write_message(activate_version_message)
+    sync_common.write_message(activate_version_message)
 
     return state
 
 
-# pylint: disable=too-many-statements,duplicate-code
+# pylint: disable=too-many-statements,duplicate-code,too-many-arguments
 def sync_table(conn_info, stream, state, desired_columns, md_map):
     time_extracted = utils.now()
 
     # before writing the table version to state, check if we had one to begin with
     first_run = singer.get_bookmark(state, stream['tap_stream_id'], 'version') is None
 
-    # pick a new table version IFF we do not have an xmin in our state
-    # the presence of an xmin indicates that we were interrupted last time through
-    if singer.get_bookmark(state, stream['tap_stream_id'], 'xmin') is None:
+    # ctid chunks are not resumed: between runs an update, VACUUM FULL or CLUSTER can move a row of a pending
+    # chunk to a chunk already done, so an interrupted sync by ctid ranges starts over with a new version
+    chunks = singer.get_bookmark(state, stream['tap_stream_id'], 'chunks')
+    if chunks is not None and chunks['kind'] == 'ctid':
+        LOGGER.info("Not resuming the interrupted ctid chunks of %s, starting over", stream['tap_stream_id'])
+        state = singer.write_bookmark(state, stream['tap_stream_id'], 'chunks', None)
+
+    # with checksums, tables synced completely before are only re-read where their checksums changed, unless
+    # rows were deleted: the table is then read again in full with a new version. Deletes are detected with the
+    # statistics of the table, which on a replica do not count the deletes replayed from the primary.
+    checksums_enabled = conn_info.get('full_table_checksums') and not conn_info.get('use_secondary')
+    use_checksums = checksums_enabled and md_map.get((), {}).get('table-key-properties') and \
+        not is_interrupted(state, stream['tap_stream_id'])
+    if use_checksums and not first_run and singer.get_bookmark(state, stream['tap_stream_id'], 'checksums'):
+        checksums_state = sync_table_checksums(conn_info, stream, state, desired_columns, md_map)
+        if checksums_state is not None:
+            return checksums_state
+
+    if use_checksums:
+        state = singer.write_bookmark(state, stream['tap_stream_id'], 'checksums',
+                                      plan_table_checksums(conn_info, stream, desired_columns, md_map))
+    elif not checksums_enabled:
+        state.get('bookmarks', {}).get(stream['tap_stream_id'], {}).pop('checksums', None)
+
+    # pick a new table version IFF we do not have a resume bookmark (xmin, chunks or pk_keyset)
+    # in our state. the presence of one indicates that we were interrupted last time through
+    if not is_interrupted(state, stream['tap_stream_id']):
         nascent_stream_version = int(time.time() * 1000)
     else:
         nascent_stream_version = singer.get_bookmark(state, stream['tap_stream_id'], 'version')
@@ -89,80 +197,570 @@ def sync_table(conn_info, stream, state, desired_columns, md_map):
                                   stream['tap_stream_id'],
                                   'version',
                                   nascent_stream_version)
-    singer.write_message(singer.StateMessage(value=copy.deepcopy(state)))
-
-    schema_name = md_map.get(()).get('schema-name')
-
-    escaped_columns = map(partial(post_db.prepare_columns_for_select_sql, md_map=md_map), desired_columns)
+    sync_common.write_message(singer.StateMessage(value=copy.deepcopy(state)))
 
     activate_version_message = singer.ActivateVersionMessage(
         stream=post_db.calculate_destination_stream_name(stream, md_map),
         version=nascent_stream_version)
 
     if first_run:
-        singer.write_message(activate_version_message)
+        sync_common.write_message(activate_version_message)
 
     hstore_available = post_db.hstore_available(conn_info)
-    with metrics.record_counter(None) as counter:
-        with post_db.open_connection(conn_info) as conn:
 
-            # Client side character encoding defaults to the value in postgresql.conf under client_encoding.
-            # The server / db can also have its own configred encoding.
-            with conn.cursor() as cur:
-                cur.execute("show server_encoding")
-                LOGGER.info("Current Server Encoding: %s", cur.fetchone()[0])
-                cur.execute("show client_encoding")
-                LOGGER.info("Current Client Encoding: %s", cur.fetchone()[0])
+    sync_info = {'version': nascent_stream_version,
+                 'time_extracted': time_extracted,
+                 'hstore_available': hstore_available}
 
-            if hstore_available:
-                LOGGER.info("hstore is available")
-                psycopg2.extras.register_hstore(conn)
+    chunks_state = None
+    if singer.get_bookmark(state, stream['tap_stream_id'], 'chunks') is not None or \
+            (conn_info.get('full_table_workers', 1) > 1 and not is_interrupted(state, stream['tap_stream_id'])):
+        chunks_state = sync_table_chunks(conn_info, stream, state, desired_columns, md_map, sync_info)
+
+    if chunks_state is not None:
+        state = singer.write_bookmark(chunks_state, stream['tap_stream_id'], 'chunks', None)
+    else:
+        state = sync_table_in_pages(conn_info, stream, state, desired_columns, md_map, sync_info)
+
+    # always send the activate version whether first run or subsequent
+    sync_common.write_message(activate_version_message)
+
+    return state
+
+
+def sync_table_in_pages(conn_info, stream, state, desired_columns, md_map, sync_info):
+    """
+    Reads the whole table on a single connection without sorting it. Tables with a primary key are paged by
+    keyset on the key, one short transaction per page so the vacuum horizon is not held back for the whole
+    sync, and the last completed page is the bookmark. Tables without one are read by ctid page ranges
+    (PostgreSQL 14+) in a single snapshot.
+
+    Older servers reading tables without a primary key, and syncs interrupted while reading by xmin, use the
+    xmin ordered single query instead.
+    """
+    tap_stream_id = stream['tap_stream_id']
+    table_pks = md_map.get((), {}).get('table-key-properties', [])
+
+    with metrics.record_counter(None) as counter:
+        with post_db.pooled_connection(conn_info) as conn:
+
+            # The server and client encodings are logged once per database by post_db.session_info
+            if sync_info['hstore_available']:
+                post_db.register_hstore(conn, conn_info)
+
+            sync_info = dict(sync_info, counter=counter, conn_info=conn_info)
+            if singer.get_bookmark(state, tap_stream_id, 'xmin') is not None:
+                state = sync_table_by_xmin(conn, stream, state, desired_columns, md_map, sync_info)
+            elif singer.get_bookmark(state, tap_stream_id, 'pk_keyset') is not None or table_pks:
+                state = sync_table_by_keyset(conn, stream, state, desired_columns, md_map, sync_info)
+            elif conn.server_version >= TID_RANGE_SCAN_MIN_VERSION:
+                state = sync_table_by_ctid(conn, stream, state, desired_columns, md_map, sync_info)
             else:
-                LOGGER.info("hstore is UNavailable")
+                state = sync_table_by_xmin(conn, stream, state, desired_columns, md_map, sync_info)
 
-            with conn.cursor(cursor_factory=psycopg2.extras.DictCursor, name='stitch_cursor') as cur:
-                cur.itersize = post_db.CURSOR_ITER_SIZE
+    return state
 
-                fq_table_name = post_db.fully_qualified_table_name(schema_name, stream['table_name'])
-                xmin = singer.get_bookmark(state, stream['tap_stream_id'], 'xmin')
-                if xmin:
-                    LOGGER.info("Resuming Full Table replication %s from xmin %s", nascent_stream_version, xmin)
-                    select_sql = f"""
-                        SELECT {','.join(escaped_columns)}, xmin::text::bigint
-                        FROM {fq_table_name} where age(xmin::xid) <= age('{xmin}'::xid)
-                        ORDER BY xmin::text ASC"""
-                else:
-                    LOGGER.info("Beginning new Full Table replication %s", nascent_stream_version)
-                    select_sql = f"""SELECT {','.join(escaped_columns)}, xmin::text::bigint
-                                      FROM {fq_table_name}
-                                     ORDER BY xmin::text ASC"""
 
-                LOGGER.info("select %s with itersize %s", select_sql, cur.itersize)
-                cur.execute(select_sql)
+def sync_table_by_keyset(conn, stream, state, desired_columns, md_map, sync_info):
+    """
+    Reads the table in primary key order, CURSOR_ITER_SIZE rows per page. Every page seeks past the last
+    primary key of the previous one, which is kept in the pk_keyset bookmark as text.
+    """
+    tap_stream_id = stream['tap_stream_id']
+    schema_name = md_map.get(()).get('schema-name')
+    fq_table_name = post_db.fully_qualified_table_name(schema_name, stream['table_name'])
+    pk_columns = [post_db.prepare_columns_sql(pk) for pk in md_map.get(()).get('table-key-properties')]
+    escaped_columns = post_db.prepare_select_list_sql(desired_columns, md_map, sync_info['conn_info'])
+    converters = post_db.row_converters(desired_columns, md_map)
+    json_envelope = post_db.json_record_envelope(stream, sync_info['version'], sync_info['time_extracted'], md_map) \
+        if post_db.uses_json_records(desired_columns, md_map, sync_info['conn_info']) else None
+    page_size = post_db.CURSOR_ITER_SIZE
+
+    last_pk = singer.get_bookmark(state, tap_stream_id, 'pk_keyset')
+    if last_pk:
+        LOGGER.info("Resuming Full Table replication %s after primary key %s", sync_info['version'], last_pk)
+    else:
+        LOGGER.info("Beginning new Full Table replication %s", sync_info['version'])
 
-                rows_saved = 0
-                for rec in cur:
-                    xmin = rec['xmin']
-                    rec = rec[:-1]
-                    record_message = post_db.selected_row_to_singer_message(stream,
-                                                                            rec,
-                                                                            nascent_stream_version,
-                                                                            desired_columns,
-                                                                            time_extracted,
-                                                                            md_map)
-                    singer.write_message(record_message)
-                    state = singer.write_bookmark(state, stream['tap_stream_id'], 'xmin', xmin)
-                    rows_saved += 1
-                    if rows_saved % UPDATE_BOOKMARK_PERIOD == 0:
-                        singer.write_message(singer.StateMessage(value=copy.deepcopy(state)))
+    while True:
+        # Literals are left untyped so they take the type of the primary key columns they are compared with
+        where_statement = ''
+        if last_pk:
+            with conn.cursor() as cur:
+                last_pk_sql = cur.mogrify(','.join(['%s'] * len(last_pk)), last_pk).decode()
+            where_statement = f"WHERE ({','.join(pk_columns)}) > ({last_pk_sql})"
+
+        select_sql = f"""SELECT {','.join(escaped_columns)}, {','.join(f'{c}::text' for c in pk_columns)}
+                           FROM {fq_table_name}
+                          {where_statement}
+                          ORDER BY {','.join(pk_columns)}
+                          LIMIT {page_size}"""
+
+        LOGGER.debug("select %s", select_sql)
+        rows = list(post_db.fetch_rows(conn, sync_info['conn_info'], select_sql, desired_columns, md_map,
+                                       extra_text_columns=len(pk_columns)))
+        conn.commit()
+
+        for rec in rows:
+            if json_envelope:
+                sync_common.write_json_record(json_envelope, rec[0])
+            else:
+                record_message = post_db.selected_row_to_singer_message(stream,
+                                                                        rec[:len(desired_columns)],
+                                                                        sync_info['version'],
+                                                                        desired_columns,
+                                                                        sync_info['time_extracted'],
+                                                                        md_map,
+                                                                        converters)
+                sync_common.write_message(record_message)
+            sync_info['counter'].increment()
+
+        if len(rows) < page_size:
+            break
+
+        last_pk = list(rows[-1][-len(pk_columns):])
+        state = singer.write_bookmark(state, tap_stream_id, 'pk_keyset', last_pk)
+        sync_common.write_message(singer.StateMessage(value=copy.deepcopy(state)))
+
+    return singer.write_bookmark(state, tap_stream_id, 'pk_keyset', None)
+
+
+def sync_table_by_ctid(conn, stream, state, desired_columns, md_map, sync_info):
+    """
+    Reads the table in ctid page ranges of about CURSOR_ITER_SIZE rows using TID range scans. All ranges are
+    read in one repeatable read transaction: in separate ones a row moved by an update to a page already read
+    would be missed. The last range is open ended to pick up pages added since the size was read.
+
+    There is no resume bookmark, a page number means nothing once VACUUM FULL or CLUSTER rewrote the table.
+    """
+    tap_stream_id = stream['tap_stream_id']
+    schema_name = md_map.get(()).get('schema-name')
+    fq_table_name = post_db.fully_qualified_table_name(schema_name, stream['table_name'])
+    escaped_columns = post_db.prepare_select_list_sql(desired_columns, md_map, sync_info['conn_info'])
+    converters = post_db.row_converters(desired_columns, md_map)
+    json_envelope = post_db.json_record_envelope(stream, sync_info['version'], sync_info['time_extracted'], md_map) \
+        if post_db.uses_json_records(desired_columns, md_map, sync_info['conn_info']) else None
+
+    with conn.cursor() as cur:
+        cur.execute("""SELECT pg_relation_size(oid) / current_setting('block_size')::int, reltuples::bigint
+                         FROM pg_class
+                        WHERE oid = %s::regclass""", (fq_table_name,))
+        pages, row_estimate = cur.fetchone()
+    conn.commit()
+
+    rows_per_page = row_estimate / pages if pages and row_estimate and row_estimate > 0 else 1
+    pages_per_range = max(1, int(post_db.CURSOR_ITER_SIZE / rows_per_page))
+
+    LOGGER.info("Beginning new Full Table replication %s", sync_info['version'])
+    with conn.cursor() as cur:
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+
+    page = 0
+    while True:
+        last_range = page + pages_per_range >= pages
+        where_statement = f"WHERE ctid >= '({page},0)'::tid" if last_range else \
+            f"WHERE ctid >= '({page},0)'::tid AND ctid < '({page + pages_per_range},0)'::tid"
+        select_sql = f"SELECT {','.join(escaped_columns)} FROM {fq_table_name} {where_statement}"
+
+        LOGGER.debug("select %s", select_sql)
+        for rec in post_db.fetch_rows(conn, sync_info['conn_info'], select_sql, desired_columns, md_map):
+            if json_envelope:
+                sync_common.write_json_record(json_envelope, rec[0])
+            else:
+                record_message = post_db.selected_row_to_singer_message(stream,
+                                                                        rec,
+                                                                        sync_info['version'],
+                                                                        desired_columns,
+                                                                        sync_info['time_extracted'],
+                                                                        md_map,
+                                                                        converters)
+                sync_common.write_message(record_message)
+            sync_info['counter'].increment()
+
+        if last_range:
+            break
+
+        page += pages_per_range
+    conn.commit()
+
+    # page bookmarks written by earlier versions of the tap are not resumed from
+    return singer.write_bookmark(state, tap_stream_id, 'ctid_page', None)
+
+
+def sync_table_by_xmin(conn, stream, state, desired_columns, md_map, sync_info):
+    """
+    Reads the whole table in one query ordered by xmin, resuming from the xmin bookmark if present
+    """
+    nascent_stream_version = sync_info['version']
+    schema_name = md_map.get(()).get('schema-name')
 
-                    counter.increment()
+    escaped_columns = map(partial(post_db.prepare_columns_for_select_sql, md_map=md_map), desired_columns)
+    converters = post_db.row_converters(desired_columns, md_map)
+
+    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor, name='stitch_cursor') as cur:
+        cur.itersize = post_db.CURSOR_ITER_SIZE
+
+        fq_table_name = post_db.fully_qualified_table_name(schema_name, stream['table_name'])
+        xmin = singer.get_bookmark(state, stream['tap_stream_id'], 'xmin')
+        if xmin:
+            LOGGER.info("Resuming Full Table replication %s from xmin %s", nascent_stream_version, xmin)
+            select_sql = f"""
+                SELECT {','.join(escaped_columns)}, xmin::text::bigint
+                FROM {fq_table_name} where age(xmin::xid) <= age('{xmin}'::xid)
+                ORDER BY xmin::text ASC"""
+        else:
+            LOGGER.info("Beginning new Full Table replication %s", nascent_stream_version)
+            select_sql = f"""SELECT {','.join(escaped_columns)}, xmin::text::bigint
+                              FROM {fq_table_name}
+                             ORDER BY xmin::text ASC"""
+
+        LOGGER.info("select %s with itersize %s", select_sql, cur.itersize)
+        cur.execute(select_sql)
+
+        rows_saved = 0
+        for rec in cur:
+            xmin = rec['xmin']
+            rec = rec[:-1]
+            record_message = post_db.selected_row_to_singer_message(stream,
+                                                                    rec,
+                                                                    nascent_stream_version,
+                                                                    desired_columns,
+                                                                    sync_info['time_extracted'],
+                                                                    md_map,
+                                                                    converters)
+            sync_common.write_message(record_message)
+            state = singer.write_bookmark(state, stream['tap_stream_id'], 'xmin', xmin)
+            rows_saved += 1
+            if rows_saved % UPDATE_BOOKMARK_PERIOD == 0:
+                sync_common.write_message(singer.StateMessage(value=copy.deepcopy(state)))
+
+            sync_info['counter'].increment()
 
     # once we have completed the full table replication, discard the xmin bookmark.
     # the xmin bookmark only comes into play when a full table replication is interrupted
     state = singer.write_bookmark(state, stream['tap_stream_id'], 'xmin', None)
 
-    # always send the activate version whether first run or subsequent
-    singer.write_message(activate_version_message)
+    return state
+
+
+def plan_chunks(cur, conn_info, fq_table_name, md_map):
+    """
+    Splits a table into ctid page ranges (PostgreSQL 14+) or integer primary key ranges.
+
+    Returns the chunks bookmark with the range bounds, chunk i covering [bounds[i], bounds[i + 1]) where None
+    means unbounded, or None if the table is too small or cannot be split.
+    """
+    chunk_size = conn_info.get('full_table_chunk_size') or CHUNK_SIZE
+
+    cur.execute("""SELECT pg_relation_size(oid) / current_setting('block_size')::int, reltuples::bigint
+                     FROM pg_class
+                    WHERE oid = %s::regclass""", (fq_table_name,))
+    pages, row_estimate = cur.fetchone()
+
+    chunk_count = math.ceil(row_estimate / chunk_size) if row_estimate and row_estimate > 0 else 1
+    if chunk_count < 2:
+        LOGGER.info("%s has about %s rows, not splitting it into chunks", fq_table_name, row_estimate)
+        return None
+
+    if cur.connection.server_version >= TID_RANGE_SCAN_MIN_VERSION and pages > 0:
+        step = math.ceil(pages / chunk_count)
+        return {'kind': 'ctid', 'column': None, 'bounds': list(range(0, pages, step)) + [None], 'done': []}
+
+    table_pks = md_map.get((), {}).get('table-key-properties', [])
+    if len(table_pks) != 1 or \
+            md_map.get(('properties', table_pks[0]), {}).get('sql-datatype') not in CHUNKABLE_PK_TYPES:
+        LOGGER.info("%s has no single integer primary key to split it into chunks", fq_table_name)
+        return None
+
+    pk_column = post_db.prepare_columns_sql(table_pks[0])
+    cur.execute(f"SELECT min({pk_column}), max({pk_column}) FROM {fq_table_name}")
+    min_pk, max_pk = cur.fetchone()
+    if min_pk is None:
+        return None
+
+    step = max(1, math.ceil((max_pk - min_pk + 1) / chunk_count))
+    return {'kind': 'pk',
+            'column': table_pks[0],
+            'bounds': [None] + list(range(min_pk + step, max_pk + 1, step)) + [None],
+            'done': []}
+
+
+def chunk_where_clause(chunks, index):
+    """
+    Builds the WHERE clause selecting the rows of a single chunk
+    """
+    lower, upper = chunks['bounds'][index], chunks['bounds'][index + 1]
+    conditions = []
+    if chunks['kind'] == 'ctid':
+        conditions.append(f"ctid >= '({lower},0)'::tid")
+        if upper is not None:
+            conditions.append(f"ctid < '({upper},0)'::tid")
+    else:
+        pk_column = post_db.prepare_columns_sql(chunks['column'])
+        if lower is not None:
+            conditions.append(f"{pk_column} >= {int(lower)}")
+        if upper is not None:
+            conditions.append(f"{pk_column} < {int(upper)}")
+
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+
+def sync_table_chunks(conn_info, stream, state, desired_columns, md_map, sync_info):
+    """
+    Reads the table in chunks over full_table_workers connections that share one exported snapshot, so the
+    chunks together are a consistent point-in-time copy. Completed chunks are recorded in the chunks bookmark
+    so an interrupted sync only re-reads the unfinished ones, primary key chunks only: sync_table discards
+    the bookmark of ctid chunks.
+
+    Returns the new state or None if the table cannot be split into chunks.
+    """
+    schema_name = md_map.get(()).get('schema-name')
+    fq_table_name = post_db.fully_qualified_table_name(schema_name, stream['table_name'])
+    workers = max(1, conn_info.get('full_table_workers', 1))
+
+    # The snapshot is only valid while the exporting transaction is open
+    coordinator = post_db.open_connection(conn_info)
+    try:
+        coordinator.set_session(isolation_level=psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ,
+                                readonly=True)
+        with coordinator.cursor() as cur:
+            cur.execute("SELECT pg_export_snapshot()")
+            snapshot_id = cur.fetchone()[0]
+
+            chunks = singer.get_bookmark(state, stream['tap_stream_id'], 'chunks')
+            if chunks is None:
+                chunks = plan_chunks(cur, conn_info, fq_table_name, md_map)
+                if chunks is None:
+                    return None
+            else:
+                LOGGER.info("Resuming chunked Full Table replication %s, %s of %s chunks already done",
+                            sync_info['version'], len(chunks['done']), len(chunks['bounds']) - 1)
+
+        state = singer.write_bookmark(state, stream['tap_stream_id'], 'chunks', chunks)
+        pending = [idx for idx in range(len(chunks['bounds']) - 1) if idx not in chunks['done']]
+        LOGGER.info("Reading %s in %s %s chunks with %s workers on snapshot %s",
+                    fq_table_name, len(pending), chunks['kind'], workers, snapshot_id)
+
+        sync_chunk = partial(_sync_chunk, conn_info, stream, desired_columns, md_map,
+                             dict(sync_info, chunks=chunks, snapshot_id=snapshot_id,
+                                  fq_table_name=fq_table_name))
+
+        with metrics.record_counter(None) as counter:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(sync_chunk, idx): idx for idx in pending}
+                try:
+                    for future in as_completed(futures):
+                        counter.increment(future.result())
+                        chunks['done'].append(futures[future])
+                        state = singer.write_bookmark(state, stream['tap_stream_id'], 'chunks', chunks)
+                        sync_common.write_message(singer.StateMessage(value=copy.deepcopy(state)))
+                except Exception:
+                    for future in futures:
+                        future.cancel()
+                    raise
+    finally:
+        coordinator.close()
+
+    return state
+
+
+def _sync_chunk(conn_info, stream, desired_columns, md_map, sync_info, index):
+    escaped_columns = post_db.prepare_select_list_sql(desired_columns, md_map, conn_info)
+    converters = post_db.row_converters(desired_columns, md_map)
+    json_envelope = post_db.json_record_envelope(stream, sync_info['version'], sync_info['time_extracted'], md_map) \
+        if post_db.uses_json_records(desired_columns, md_map, conn_info) else None
+    select_sql = f"SELECT {','.join(escaped_columns)} FROM {sync_info['fq_table_name']} " \
+                 f"{chunk_where_clause(sync_info['chunks'], index)}"
+
+    conn = post_db.open_connection(conn_info)
+    try:
+        if sync_info['hstore_available']:
+            post_db.register_hstore(conn, conn_info)
+
+        conn.set_session(isolation_level=psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
+        with conn.cursor() as cur:
+            cur.execute("SET TRANSACTION SNAPSHOT %s", (sync_info['snapshot_id'],))
+
+        LOGGER.info("select %s", select_sql)
+        rows_saved = 0
+        for rec in post_db.fetch_rows(conn, conn_info, select_sql, desired_columns, md_map):
+            if json_envelope:
+                sync_common.write_json_record(json_envelope, rec[0])
+            else:
+                record_message = post_db.selected_row_to_singer_message(stream,
+                                                                        rec,
+                                                                        sync_info['version'],
+                                                                        desired_columns,
+                                                                        sync_info['time_extracted'],
+                                                                        md_map,
+                                                                        converters)
+                sync_common.write_message(record_message)
+            rows_saved += 1
+
+        conn.commit()
+    finally:
+        conn.close()
+
+    return rows_saved
+
+
+def _checksum_sql(stream, desired_columns, md_map):
+    fq_table_name = post_db.fully_qualified_table_name(md_map.get(()).get('schema-name'), stream['table_name'])
+    pk_columns = [post_db.prepare_columns_sql(pk) for pk in md_map.get(()).get('table-key-properties')]
+    row_sql = f"ROW({','.join(post_db.prepare_columns_sql(c) for c in desired_columns)})::text"
+    return fq_table_name, pk_columns, row_sql
+
+
+def checksum_where_clause(cur, pk_columns, lower, upper):
+    """
+    Builds the WHERE clause selecting the rows between two primary keys kept as text, None meaning unbounded.
+    Literals are left untyped so they take the type of the primary key columns they are compared with.
+    """
+    conditions = []
+    for bound, operator in ((lower, '>='), (upper, '<')):
+        if bound is not None:
+            bound_sql = cur.mogrify(','.join(['%s'] * len(bound)), bound).decode()
+            conditions.append(f"({','.join(pk_columns)}) {operator} ({bound_sql})")
+
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+
+def plan_checksums(cur, fq_table_name, pk_columns, row_sql, where_statement=''):
+    """
+    Splits the rows of where_statement into chunks of CHECKSUM_CHUNK_SIZE rows in primary key order, in a single
+    pass. Returns the first primary key of every chunk as text along with the checksum and the number of its rows.
+    """
+    cur.execute(f"""
+        SELECT {','.join(f'(array_agg({c}::text ORDER BY rn))[1]' for c in pk_columns)},
+               left(md5(string_agg(row_text, E'\\n' ORDER BY rn)), 16),
+               count(*)
+          FROM (SELECT {','.join(pk_columns)}, {row_sql} AS row_text,
+                       row_number() OVER (ORDER BY {','.join(pk_columns)}) - 1 AS rn
+                  FROM {fq_table_name}
+                 {where_statement}) AS numbered
+         GROUP BY rn / {CHECKSUM_CHUNK_SIZE}
+         ORDER BY rn / {CHECKSUM_CHUNK_SIZE}""")
+    return [(list(row[:-2]), row[-2], row[-1]) for row in cur.fetchall()]
+
+
+def fetch_deleted_rows(cur, fq_table_name):
+    """
+    Reads the number of rows deleted from a table according to its statistics, None if it has none
+    """
+    cur.execute("SELECT n_tup_del FROM pg_stat_user_tables WHERE relid = %s::regclass", (fq_table_name,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def plan_table_checksums(conn_info, stream, desired_columns, md_map):
+    """
+    Checksums a whole table, before it is read by a full table sync. Returns the checksums bookmark with the
+    primary key bounds of the chunks, chunk i covering [bounds[i], bounds[i + 1]) where None means unbounded,
+    their checksums and row counts, and the number of rows deleted from the table so far.
+    """
+    fq_table_name, pk_columns, row_sql = _checksum_sql(stream, desired_columns, md_map)
+    with post_db.pooled_connection(conn_info) as conn:
+        with conn.cursor() as cur:
+            deleted_rows = fetch_deleted_rows(cur, fq_table_name)
+            planned = plan_checksums(cur, fq_table_name, pk_columns, row_sql) or [(None, None, 0)]
+
+    LOGGER.info("Checksummed %s in %s chunks", fq_table_name, len(planned))
+    return {'bounds': [None] + [first_pk for first_pk, _, _ in planned[1:]] + [None],
+            'hashes': [checksum for _, checksum, _ in planned],
+            'rows': [rows for _, _, rows in planned],
+            'n_tup_del': deleted_rows}
+
+
+# pylint: disable=too-many-locals
+def sync_table_checksums(conn_info, stream, state, desired_columns, md_map):
+    """
+    Re-reads only the chunks of a table whose checksum changed since the previous sync, on a single connection
+    and one transaction per chunk. The records keep the current table version so the rows of unchanged chunks
+    stay active.
+
+    A changed chunk is split again into chunks of CHECKSUM_CHUNK_SIZE rows, checksummed before its rows are read
+    so a change made in between is read again by the next sync.
+
+    Deleted rows would stay active in the target, so None is returned for a full sync with a new version when
+    the deleted rows counter of the table moved or a changed chunk holds fewer rows than before.
+    """
+    time_extracted = utils.now()
+    tap_stream_id = stream['tap_stream_id']
+    version = singer.get_bookmark(state, tap_stream_id, 'version')
+    checksums = copy.deepcopy(singer.get_bookmark(state, tap_stream_id, 'checksums'))
+    fq_table_name, pk_columns, row_sql = _checksum_sql(stream, desired_columns, md_map)
+    escaped_columns = post_db.prepare_select_list_sql(desired_columns, md_map, conn_info)
+    converters = post_db.row_converters(desired_columns, md_map)
+    json_envelope = post_db.json_record_envelope(stream, version, time_extracted, md_map) \
+        if post_db.uses_json_records(desired_columns, md_map, conn_info) else None
+    hstore_available = post_db.hstore_available(conn_info)
+
+    changed_chunks = 0
+    with metrics.record_counter(None) as counter:
+        with post_db.pooled_connection(conn_info) as conn:
+            with conn.cursor() as cur:
+                deleted_rows = fetch_deleted_rows(cur, fq_table_name)
+            conn.commit()
+
+            # checksums bookmarked by earlier versions of the tap have no row counts
+            if 'rows' not in checksums or deleted_rows != checksums['n_tup_del']:
+                LOGGER.info("Rows may have been deleted from %s, reading it in full", fq_table_name)
+                return None
+
+            LOGGER.info("Beginning checksum diff of Full Table replication %s in %s chunks",
+                        version, len(checksums['hashes']))
+
+            # The server and client encodings are logged once per database by post_db.session_info
+            if hstore_available:
+                post_db.register_hstore(conn, conn_info)
+
+            index = 0
+            while index < len(checksums['hashes']):
+                lower, upper = checksums['bounds'][index], checksums['bounds'][index + 1]
+                with conn.cursor() as cur:
+                    where_statement = checksum_where_clause(cur, pk_columns, lower, upper)
+                    cur.execute(f"""SELECT left(md5(string_agg({row_sql}, E'\\n' ORDER BY {','.join(pk_columns)})), 16)
+                                      FROM {fq_table_name}
+                                     {where_statement}""")
+                    if cur.fetchone()[0] == checksums['hashes'][index]:
+                        conn.commit()
+                        index += 1
+                        continue
+
+                    planned = plan_checksums(cur, fq_table_name, pk_columns, row_sql, where_statement) or \
+                        [(lower, None, 0)]
+
+                if sum(rows for _, _, rows in planned) < checksums['rows'][index]:
+                    conn.commit()
+                    LOGGER.info("Rows were deleted from %s, reading it in full", fq_table_name)
+                    return None
+
+                select_sql = f"SELECT {','.join(escaped_columns)} FROM {fq_table_name} {where_statement}"
+                LOGGER.debug("select %s", select_sql)
+                for rec in post_db.fetch_rows(conn, conn_info, select_sql, desired_columns, md_map):
+                    if json_envelope:
+                        sync_common.write_json_record(json_envelope, rec[0])
+                    else:
+                        sync_common.write_message(post_db.selected_row_to_singer_message(stream,
+                                                                                         rec,
+                                                                                         version,
+                                                                                         desired_columns,
+                                                                                         time_extracted,
+                                                                                         md_map,
+                                                                                         converters))
+                    counter.increment()
+                conn.commit()
+
+                # the first of the new chunks keeps the lower bound of the changed chunk
+                checksums['bounds'][index + 1:index + 1] = [first_pk for first_pk, _, _ in planned[1:]]
+                checksums['hashes'][index:index + 1] = [checksum for _, checksum, _ in planned]
+                checksums['rows'][index:index + 1] = [rows for _, _, rows in planned]
+                index += len(planned)
+                changed_chunks += 1
+
+                state = singer.write_bookmark(state, tap_stream_id, 'checksums', copy.deepcopy(checksums))
+                sync_common.write_message(singer.StateMessage(value=copy.deepcopy(state)))
 
+    LOGGER.info("Re-read %s changed chunks of %s, now in %s chunks",
+                changed_chunks, fq_table_name, len(checksums['hashes']))
     return state
@@ -1,24 +1,40 @@
 import copy
+import datetime
+import decimal
+import json
+import os
 import time
-import psycopg2
-import psycopg2.extras
 import singer
 
-from singer import utils
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from functools import partial
+from singer import metadata
+from singer import utils
 from singer import metrics
 
 import tap_postgres.db as post_db
+import tap_postgres.sync_strategies.common as sync_common
+
+from tap_postgres import pk_set
 
 
 LOGGER = singer.get_logger('tap_postgres')
 
 UPDATE_BOOKMARK_PERIOD = 10000
 
+# Primary key types deletes are detected for, integers are compared as numbers and the others as text in
+# the "C" collation, which sorts them like python sorts strings
+DELETE_DETECTION_INTEGER_TYPES = {'smallint', 'integer', 'bigint'}
+DELETE_DETECTION_TEXT_TYPES = {'text', 'character varying', 'uuid', 'citext'}
+
+# Number of replication key windows per backfill worker, more windows keep the contiguous bookmark closer to
+# the progress of the workers
+BACKFILL_WINDOWS_PER_WORKER = 8
+
 
 # pylint: disable=invalid-name,missing-function-docstring
 def fetch_max_replication_key(conn_config, replication_key, schema_name, table_name):
-    with post_db.open_connection(conn_config, False) as conn:
+    with post_db.pooled_connection(conn_config) as conn:
         with conn.cursor() as cur:
             max_key_sql = f"""
                 SELECT max({post_db.prepare_columns_sql(replication_key)})
@@ -32,6 +48,166 @@ def fetch_max_replication_key(conn_config, replication_key, schema_name, table_n
             return max_key
 
 
+def fetch_min_replication_key(conn_config, replication_key, schema_name, table_name):
+    with post_db.pooled_connection(conn_config) as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT min({post_db.prepare_columns_sql(replication_key)})
+                FROM {post_db.fully_qualified_table_name(schema_name, table_name)}""")
+            return cur.fetchone()[0]
+
+
+def split_replication_key_range(min_value, max_value, count):
+    """
+    Splits [min_value, max_value] into at most count windows of about the same width and returns their bounds,
+    window i covering [bounds[i], bounds[i + 1]) and the last one including max_value.
+    Returns None for replication key types that cannot be split: anything but numbers, dates and timestamps.
+    """
+    if isinstance(min_value, bool) or \
+            not isinstance(min_value, (int, float, decimal.Decimal, datetime.date)) or \
+            type(min_value) is not type(max_value):
+        return None
+
+    width = max_value - min_value
+    bounds = []
+    for idx in range(count):
+        bound = min_value + width * idx // count if isinstance(min_value, int) else min_value + width * idx / count
+        if not bounds or bound > bounds[-1]:
+            bounds.append(bound)
+
+    if max_value > bounds[-1]:
+        bounds.append(max_value)
+    else:
+        # a single value
+        bounds.append(bounds[-1])
+
+    return bounds
+
+
+def plan_windows(conn_info, stream, md_map):
+    """
+    Splits the replication key range of a table not synced yet into windows to backfill in parallel.
+    Returns the windows bookmark with the bounds as bookmark values, or None if the table is empty or its
+    replication key cannot be split.
+    """
+    schema_name = md_map.get(()).get('schema-name')
+    replication_key = md_map.get((), {}).get('replication-key')
+    replication_key_sql_datatype = md_map.get(('properties', replication_key)).get('sql-datatype')
+    workers = conn_info['incremental_backfill_workers']
+
+    max_value = fetch_max_replication_key(conn_info, replication_key, schema_name, stream['table_name'])
+    if max_value is None:
+        return None
+
+    min_value = fetch_min_replication_key(conn_info, replication_key, schema_name, stream['table_name'])
+    bounds = split_replication_key_range(min_value, max_value, workers * BACKFILL_WINDOWS_PER_WORKER)
+    if bounds is None:
+        LOGGER.info("Replication key %s of type %s cannot be split into windows, not backfilling in parallel",
+                    replication_key, replication_key_sql_datatype)
+        return None
+
+    to_bookmark_value = post_db.value_converter(replication_key_sql_datatype)
+    return {'bounds': [to_bookmark_value(bound) for bound in bounds], 'done': []}
+
+
+def window_where_clause(windows, index, replication_key, replication_key_sql_datatype):
+    """
+    Builds the WHERE clause selecting the rows of a single window. Rows with a NULL replication key, which
+    a first sync without windows reads too, are read with the first window.
+    """
+    column = post_db.prepare_columns_sql(replication_key)
+    lower, upper = windows['bounds'][index], windows['bounds'][index + 1]
+    upper_operator = '<=' if index == len(windows['bounds']) - 2 else '<'
+    condition = f"{column} >= '{lower}'::{replication_key_sql_datatype} " \
+                f"AND {column} {upper_operator} '{upper}'::{replication_key_sql_datatype}"
+    if index == 0:
+        condition = f"({condition}) OR {column} IS NULL"
+
+    return f"WHERE {condition}"
+
+
+# pylint: disable=too-many-arguments,too-many-locals
+def sync_table_windows(conn_info, stream, state, desired_columns, md_map, windows, sync_info):
+    """
+    Backfills a table by replication key windows over incremental_backfill_workers connections. The windows
+    bookmark records the finished windows so an interrupted backfill only reads the unfinished ones, and
+    replication_key_value only moves up to the end of the highest contiguous finished window: rows below it
+    are all synced whatever happens to the windows after it.
+    """
+    tap_stream_id = stream['tap_stream_id']
+    workers = conn_info['incremental_backfill_workers']
+    window_count = len(windows['bounds']) - 1
+    pending = [idx for idx in range(window_count) if idx not in windows['done']]
+    LOGGER.info("Backfilling %s in %s of %s replication key windows with %s workers",
+                tap_stream_id, len(pending), window_count, workers)
+
+    state = singer.write_bookmark(state, tap_stream_id, 'windows', windows)
+    sync_window = partial(_sync_window, conn_info, stream, desired_columns, md_map, dict(sync_info, windows=windows))
+
+    with metrics.record_counter(None) as counter:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(sync_window, idx): idx for idx in pending}
+            try:
+                for future in as_completed(futures):
+                    counter.increment(future.result())
+                    windows['done'].append(futures[future])
+
+                    contiguous = 0
+                    while contiguous in windows['done']:
+                        contiguous += 1
+                    if contiguous == window_count:
+                        state['bookmarks'][tap_stream_id].pop('windows')
+                        state = singer.write_bookmark(state, tap_stream_id, 'replication_key_value',
+                                                      windows['bounds'][-1])
+                    else:
+                        state = singer.write_bookmark(state, tap_stream_id, 'windows', windows)
+                        if contiguous > 0:
+                            state = singer.write_bookmark(state, tap_stream_id, 'replication_key_value',
+                                                          windows['bounds'][contiguous])
+                    sync_common.write_message(singer.StateMessage(value=copy.deepcopy(state)))
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    state['bookmarks'][tap_stream_id].pop('windows', None)
+    return state
+
+
+def _sync_window(conn_info, stream, desired_columns, md_map, sync_info, index):
+    replication_key = md_map.get((), {}).get('replication-key')
+    replication_key_sql_datatype = md_map.get(('properties', replication_key)).get('sql-datatype')
+    escaped_columns = post_db.prepare_select_list_sql(desired_columns, md_map, conn_info)
+    converters = post_db.row_converters(desired_columns, md_map)
+    json_envelope = post_db.json_record_envelope(stream, sync_info['version'], sync_info['time_extracted'], md_map) \
+        if post_db.uses_json_records(desired_columns, md_map, conn_info) else None
+    fq_table_name = post_db.fully_qualified_table_name(md_map.get(()).get('schema-name'), stream['table_name'])
+    select_sql = f"SELECT {','.join(escaped_columns)} FROM {fq_table_name} " \
+                 f"{window_where_clause(sync_info['windows'], index, replication_key, replication_key_sql_datatype)}"
+
+    rows_saved = 0
+    with post_db.pooled_connection(conn_info) as conn:
+        if sync_info['hstore_available']:
+            post_db.register_hstore(conn, conn_info)
+
+        LOGGER.info("select %s", select_sql)
+        for rec in post_db.fetch_rows(conn, conn_info, select_sql, desired_columns, md_map):
+            if json_envelope:
+                sync_common.write_json_record(json_envelope, rec[0])
+            else:
+                record_message = post_db.selected_row_to_singer_message(stream,
+                                                                        rec,
+                                                                        sync_info['version'],
+                                                                        desired_columns,
+                                                                        sync_info['time_extracted'],
+                                                                        md_map,
+                                                                        converters)
+                sync_common.write_message(record_message)
+            rows_saved += 1
+
+    return rows_saved
+
+
 # pylint: disable=too-many-locals
 def sync_table(conn_info, stream, state, desired_columns, md_map):
     time_extracted = utils.now()
@@ -44,43 +220,64 @@ def sync_table(conn_info, stream, state, desired_columns, md_map):
                                   stream['tap_stream_id'],
                                   'version',
                                   stream_version)
-    singer.write_message(singer.StateMessage(value=copy.deepcopy(state)))
+    sync_common.write_message(singer.StateMessage(value=copy.deepcopy(state)))
 
     schema_name = md_map.get(()).get('schema-name')
 
-    escaped_columns = map(partial(post_db.prepare_columns_for_select_sql, md_map=md_map), desired_columns)
+    escaped_columns = post_db.prepare_select_list_sql(desired_columns, md_map, conn_info)
+    converters = post_db.row_converters(desired_columns, md_map)
+    json_records = post_db.uses_json_records(desired_columns, md_map, conn_info)
 
     activate_version_message = singer.ActivateVersionMessage(
         stream=post_db.calculate_destination_stream_name(stream, md_map),
         version=stream_version)
 
-    singer.write_message(activate_version_message)
+    sync_common.write_message(activate_version_message)
 
     replication_key = md_map.get((), {}).get('replication-key')
     replication_key_value = singer.get_bookmark(state, stream['tap_stream_id'], 'replication_key_value')
     replication_key_sql_datatype = md_map.get(('properties', replication_key)).get('sql-datatype')
 
     hstore_available = post_db.hstore_available(conn_info)
-    with metrics.record_counter(None) as counter:
-        with post_db.open_connection(conn_info) as conn:
 
-            # Client side character encoding defaults to the value in postgresql.conf under client_encoding.
-            # The server / db can also have its own configured encoding.
-            with conn.cursor() as cur:
-                cur.execute("show server_encoding")
-                LOGGER.info("Current Server Encoding: %s", cur.fetchone()[0])
-                cur.execute("show client_encoding")
-                LOGGER.info("Current Client Encoding: %s", cur.fetchone()[0])
+    # First syncs of tables are backfilled in parallel by replication key windows, until all windows are done
+    windows = singer.get_bookmark(state, stream['tap_stream_id'], 'windows')
+    if windows is None and replication_key_value is None and not conn_info['limit'] \
+            and conn_info.get('incremental_backfill_workers', 1) > 1:
+        windows = plan_windows(conn_info, stream, md_map)
+
+    if windows is not None:
+        return sync_table_windows(conn_info, stream, state, desired_columns, md_map, windows,
+                                  {'version': stream_version,
+                                   'time_extracted': time_extracted,
+                                   'hstore_available': hstore_available})
+
+    json_envelope = None
+    if json_records:
+        # the replication key value of records built by postgres is read from an extra json column
+        json_envelope = post_db.json_record_envelope(stream, stream_version, time_extracted, md_map)
+        escaped_columns.append(f"to_json({post_db.prepare_columns_for_json_sql(replication_key, md_map)})::text")
+
+    sync_info = {'version': stream_version,
+                 'time_extracted': time_extracted,
+                 'desired_columns': desired_columns,
+                 'escaped_columns': escaped_columns,
+                 'converters': converters,
+                 'json_envelope': json_envelope,
+                 'conn_info': conn_info}
 
+    with metrics.record_counter(None) as counter:
+        with post_db.pooled_connection(conn_info) as conn:
+
+            # The server and client encodings are logged once per database by post_db.session_info
             if hstore_available:
-                LOGGER.info("hstore is available")
-                psycopg2.extras.register_hstore(conn)
-            else:
-                LOGGER.info("hstore is UNavailable")
+                post_db.register_hstore(conn, conn_info)
 
-            with conn.cursor(cursor_factory=psycopg2.extras.DictCursor, name='pipelinewise') as cur:
-                cur.itersize = post_db.CURSOR_ITER_SIZE
-                LOGGER.info("Beginning new incremental replication sync %s", stream_version)
+            LOGGER.info("Beginning new incremental replication sync %s", stream_version)
+            sync_info = dict(sync_info, counter=counter, rows_saved=0)
+            if md_map.get((), {}).get('table-key-properties'):
+                state = sync_table_by_keyset(conn, stream, state, md_map, sync_info)
+            else:
                 select_sql = _get_select_sql({"escaped_columns": escaped_columns,
                                               "replication_key": replication_key,
                                               "replication_key_sql_datatype": replication_key_sql_datatype,
@@ -89,38 +286,249 @@ def sync_table(conn_info, stream, state, desired_columns, md_map):
                                               "table_name": stream['table_name'],
                                               "limit": conn_info['limit']
                                               })
-                LOGGER.info('select statement: %s with itersize %s', select_sql, cur.itersize)
-                cur.execute(select_sql)
+                LOGGER.info('select statement: %s with itersize %s', select_sql, post_db.CURSOR_ITER_SIZE)
+
+                rows = post_db.fetch_rows(conn, conn_info, select_sql, desired_columns, md_map,
+                                          extra_text_columns=1 if json_records else 0)
+                state = _write_rows(rows, stream, state, md_map, sync_info)
+
+    return state
+
 
-                rows_saved = 0
+def _key_columns(md_map):
+    return [post_db.prepare_columns_sql(c) for c in
+            [md_map.get((), {}).get('replication-key')] + (md_map.get((), {}).get('table-key-properties') or [])]
 
-                for rec in cur:
-                    record_message = post_db.selected_row_to_singer_message(stream,
-                                                                            rec,
-                                                                            stream_version,
-                                                                            desired_columns,
-                                                                            time_extracted,
-                                                                            md_map)
 
-                    singer.write_message(record_message)
-                    rows_saved += 1
+def keyset_condition(cur, md_map, replication_key_value, last_pk, include_bookmark=True):
+    """
+    Builds the condition selecting the rows after a bookmark: the rows past its replication key value and
+    primary key when the primary key is bookmarked, the rows from its replication key value on otherwise, or
+    past it when include_bookmark is False.
+    """
+    replication_key = md_map.get((), {}).get('replication-key')
+    replication_key_sql_datatype = md_map.get(('properties', replication_key)).get('sql-datatype')
+    key_columns = _key_columns(md_map)
+    bookmark_sql = f"'{replication_key_value}'::{replication_key_sql_datatype}"
+
+    # Primary key literals are left untyped so they take the type of the columns they are compared with
+    if last_pk and len(last_pk) == len(key_columns) - 1:
+        last_pk_sql = cur.mogrify(','.join(['%s'] * len(last_pk)), last_pk).decode()
+        return f"({','.join(key_columns)}) > ({bookmark_sql},{last_pk_sql})"
+
+    return f"{key_columns[0]} {'>=' if include_bookmark else '>'} {bookmark_sql}"
+
+
+def fetch_changed_streams(conn_config, streams, state):
+    """
+    Probes which INCREMENTAL streams have rows past their bookmark, with a single query per database seeking
+    past the bookmark of every stream, an index lookup when the replication key is indexed. Streams without a
+    replication key bookmark or with a backfill in progress are always changed.
+    Returns the tap_stream_ids of the changed streams.
+    """
+    changed = set()
+    probes = {}
+    for stream in streams:
+        md_map = metadata.to_map(stream['metadata'])
+        bookmark = state.get('bookmarks', {}).get(stream['tap_stream_id'], {})
+        if bookmark.get('replication_key_value') is None or bookmark.get('windows') is not None:
+            changed.add(stream['tap_stream_id'])
+        else:
+            probes.setdefault(md_map.get(()).get('database-name'), []).append((stream, md_map, bookmark))
+
+    for dbname, db_probes in probes.items():
+        with post_db.pooled_connection(dict(conn_config, dbname=dbname)) as conn:
+            with conn.cursor() as cur:
+                exists = []
+                for stream, md_map, bookmark in db_probes:
+                    condition = keyset_condition(cur, md_map, bookmark['replication_key_value'],
+                                                 bookmark.get('replication_key_pk'), include_bookmark=False)
+                    fq_table_name = post_db.fully_qualified_table_name(md_map.get(()).get('schema-name'),
+                                                                       stream['table_name'])
+                    exists.append(f"EXISTS (SELECT 1 FROM {fq_table_name} WHERE {condition})")
+
+                cur.execute(f"SELECT {', '.join(exists)}")
+                has_changes = cur.fetchone()
+
+        changed.update(stream['tap_stream_id'] for (stream, _, _), has_change in zip(db_probes, has_changes)
+                       if has_change)
+
+    return changed
+
+
+def sync_table_by_keyset(conn, stream, state, md_map, sync_info):
+    """
+    Reads the rows changed since the bookmark in pages of CURSOR_ITER_SIZE rows ordered by replication key and
+    primary key, one short transaction per page. Every page seeks past the replication key and the primary key
+    of the last row read, both kept in the bookmarks, so rows sharing the last replication key value are not
+    read again by the next page or the next run. Both are bookmarked as the text of the columns, as the values
+    of the records are clamped to the range of python datetimes and would not move past infinity. A bookmark
+    without a primary key, written by an older version or by a windowed backfill, is resumed with >= once.
+
+    First syncs read the rows with a NULL replication key after the pages, like the single query does.
+    """
+    tap_stream_id = stream['tap_stream_id']
+    conn_info = sync_info['conn_info']
+    desired_columns = sync_info['desired_columns']
+    key_columns = _key_columns(md_map)
+    fq_table_name = post_db.fully_qualified_table_name(md_map.get(()).get('schema-name'), stream['table_name'])
+    select_list = ','.join(sync_info['escaped_columns'] + [f'{c}::text' for c in key_columns])
+    extra_text_columns = len(key_columns) + (1 if sync_info['json_envelope'] else 0)
+    limit = conn_info['limit']
+
+    replication_key_value = singer.get_bookmark(state, tap_stream_id, 'replication_key_value')
+    last_pk = singer.get_bookmark(state, tap_stream_id, 'replication_key_pk')
+    first_sync = replication_key_value is None
+
+    while True:
+        page_size = post_db.CURSOR_ITER_SIZE
+        if limit:
+            page_size = min(page_size, limit - sync_info['rows_saved'])
+            if page_size <= 0:
+                return state
+
+        where_statement = f"WHERE {key_columns[0]} IS NOT NULL"
+        if replication_key_value is not None:
+            with conn.cursor() as cur:
+                where_statement = f"WHERE {keyset_condition(cur, md_map, replication_key_value, last_pk)}"
+
+        select_sql = f"""SELECT {select_list}
+                           FROM {fq_table_name}
+                          {where_statement}
+                          ORDER BY {','.join(key_columns)}
+                          LIMIT {page_size}"""
+
+        LOGGER.debug("select %s", select_sql)
+        rows = list(post_db.fetch_rows(conn, conn_info, select_sql, desired_columns, md_map,
+                                       extra_text_columns=extra_text_columns))
+        conn.commit()
+
+        state = _write_rows(rows, stream, state, md_map, sync_info)
+        if len(rows) < page_size:
+            break
+
+        replication_key_value = singer.get_bookmark(state, tap_stream_id, 'replication_key_value')
+        last_pk = singer.get_bookmark(state, tap_stream_id, 'replication_key_pk')
+
+    if first_sync:
+        limit_statement = f"LIMIT {limit - sync_info['rows_saved']}" if limit else ''
+        select_sql = f"""SELECT {select_list}
+                           FROM {fq_table_name}
+                          WHERE {key_columns[0]} IS NULL
+                          {limit_statement}"""
+
+        LOGGER.debug("select %s", select_sql)
+        rows = post_db.fetch_rows(conn, conn_info, select_sql, desired_columns, md_map,
+                                  extra_text_columns=extra_text_columns)
+        state = _write_rows(rows, stream, state, md_map, sync_info)
 
-                    #Picking a replication_key with NULL values will result in it ALWAYS been synced which is not great
-                    #event worse would be allowing the NULL value to enter into the state
-                    if record_message.record[replication_key] is not None:
-                        state = singer.write_bookmark(state,
-                                                      stream['tap_stream_id'],
-                                                      'replication_key_value',
-                                                      record_message.record[replication_key])
+    return state
 
-                    if rows_saved % UPDATE_BOOKMARK_PERIOD == 0:
-                        singer.write_message(singer.StateMessage(value=copy.deepcopy(state)))
 
-                    counter.increment()
+def _write_rows(rows, stream, state, md_map, sync_info):
+    """
+    Writes the records of rows and bookmarks the replication key value of the last one. When the table has a
+    primary key, the rows are read by keyset and the replication key and primary key bookmarked are read from
+    the last columns of the rows.
+    """
+    replication_key = md_map.get((), {}).get('replication-key')
+    pk_count = len(md_map.get((), {}).get('table-key-properties') or [])
+    json_envelope = sync_info['json_envelope']
+
+    for rec in rows:
+        if json_envelope:
+            sync_common.write_json_record(json_envelope, rec[0])
+            record_replication_key_value = json.loads(rec[1], parse_float=decimal.Decimal)
+        else:
+            record_message = post_db.selected_row_to_singer_message(stream,
+                                                                    rec,
+                                                                    sync_info['version'],
+                                                                    sync_info['desired_columns'],
+                                                                    sync_info['time_extracted'],
+                                                                    md_map,
+                                                                    sync_info['converters'])
+
+            sync_common.write_message(record_message)
+            record_replication_key_value = record_message.record[replication_key]
+        if pk_count:
+            record_replication_key_value = rec[-pk_count - 1]
+        sync_info['rows_saved'] += 1
+
+        #Picking a replication_key with NULL values will result in it ALWAYS been synced which is not great
+        #event worse would be allowing the NULL value to enter into the state
+        if record_replication_key_value is not None:
+            state = singer.write_bookmark(state,
+                                          stream['tap_stream_id'],
+                                          'replication_key_value',
+                                          record_replication_key_value)
+            if pk_count:
+                state = singer.write_bookmark(state,
+                                              stream['tap_stream_id'],
+                                              'replication_key_pk',
+                                              list(rec[-pk_count:]))
+
+        if sync_info['rows_saved'] % UPDATE_BOOKMARK_PERIOD == 0:
+            sync_common.write_message(singer.StateMessage(value=copy.deepcopy(state)))
+
+        sync_info['counter'].increment()
 
     return state
 
 
+def detect_deletes(conn_info, stream, state, md_map):
+    """
+    Sends a record with _sdc_deleted_at for every primary key of the previous run missing from the table. The
+    primary keys are read in order, an index only scan for integer keys, and merged with the sorted set of
+    keys stored in the pk_set_dir directory by the run of the pk_set_generation bookmark. They are stored as the
+    next generation, which the returned state bookmarks: the set of the previous generation is only removed
+    by a later run, once the target has committed the state naming the new one.
+    """
+    tap_stream_id = stream['tap_stream_id']
+    table_pks = md_map.get((), {}).get('table-key-properties') or []
+    sql_datatypes = [md_map.get(('properties', pk), {}).get('sql-datatype') for pk in table_pks]
+    if not table_pks or \
+            any(t not in DELETE_DETECTION_INTEGER_TYPES | DELETE_DETECTION_TEXT_TYPES for t in sql_datatypes):
+        LOGGER.warning("Deletes of %s are not detected, it has no primary key of integer or text columns",
+                       tap_stream_id)
+        return state
+
+    key_sql = [post_db.prepare_columns_sql(pk) if sql_datatype in DELETE_DETECTION_INTEGER_TYPES
+               else f'{post_db.prepare_columns_sql(pk)}::text COLLATE "C"'
+               for pk, sql_datatype in zip(table_pks, sql_datatypes)]
+    fq_table_name = post_db.fully_qualified_table_name(md_map.get(()).get('schema-name'), stream['table_name'])
+    os.makedirs(conn_info['pk_set_dir'], exist_ok=True)
+    committed_generation = singer.get_bookmark(state, tap_stream_id, 'pk_set_generation')
+    generation = (committed_generation or 0) + 1
+    previous_path = pk_set.set_path(conn_info['pk_set_dir'], tap_stream_id, committed_generation) \
+        if committed_generation else None
+    path = pk_set.set_path(conn_info['pk_set_dir'], tap_stream_id, generation)
+
+    # sets of older generations, or written by runs whose state the target never committed, are not needed
+    pk_set.remove_sets(conn_info['pk_set_dir'], tap_stream_id, keep={committed_generation})
+
+    time_extracted = utils.now()
+    stream_name = post_db.calculate_destination_stream_name(stream, md_map)
+    version = singer.get_bookmark(state, tap_stream_id, 'version')
+    deleted_rows = 0
+    with post_db.pooled_connection(conn_info) as conn:
+        with conn.cursor(name='pk_set_cursor') as cur:
+            cur.itersize = post_db.CURSOR_ITER_SIZE
+            select_sql = f"SELECT {','.join(key_sql)} FROM {fq_table_name} ORDER BY {','.join(key_sql)}"
+            LOGGER.info("select %s with itersize %s", select_sql, cur.itersize)
+            cur.execute(select_sql)
+
+            for key in pk_set.diff_key_sets(previous_path, path, table_pks, cur):
+                sync_common.write_message(singer.RecordMessage(
+                    stream=stream_name,
+                    record=dict(zip(table_pks, key), _sdc_deleted_at=singer.utils.strftime(time_extracted)),
+                    version=version,
+                    time_extracted=time_extracted))
+                deleted_rows += 1
+
+    LOGGER.info("Detected %s deleted rows of %s", deleted_rows, tap_stream_id)
+    return singer.write_bookmark(state, tap_stream_id, 'pk_set_generation', generation)
+
+
 def _get_select_sql(params):
     escaped_columns = params['escaped_columns']
     replication_key = post_db.prepare_columns_sql(params['replication_key'])
@@ -1,22 +1,28 @@
+# pylint: disable=too-many-lines
 import datetime
 import pytz
 import decimal
 import psycopg2
 import copy
 import json
+import multiprocessing
 import re
+import simplejson
 import singer
 import warnings
+import zlib
 
+from collections import deque
 from select import select
-from psycopg2 import sql
 from singer import metadata, utils, get_bookmark
 from dateutil.parser import parse, UnknownTimezoneWarning, ParserError
-from functools import reduce
+from functools import partial
 
+from tap_postgres import literals, pgoutput
 import tap_postgres.db as post_db
 import tap_postgres.sync_strategies.common as sync_common
 from tap_postgres.stream_utils import refresh_streams_schema
+from tap_postgres.sync_strategies import committed_lsn
 
 LOGGER = singer.get_logger('tap_postgres')
 
@@ -24,6 +30,16 @@ UPDATE_BOOKMARK_PERIOD = 10000
 FALLBACK_DATETIME = '9999-12-31T23:59:59.999+00:00'
 FALLBACK_DATE = '9999-12-31T00:00:00+00:00'
 
+DECODING_PLUGIN_WAL2JSON = 'wal2json'
+DECODING_PLUGIN_PGOUTPUT = 'pgoutput'
+DECODING_PLUGINS = (DECODING_PLUGIN_WAL2JSON, DECODING_PLUGIN_PGOUTPUT)
+
+# Number of wal2json messages sent to a decode worker process at once
+DECODE_BATCH_SIZE = 500
+
+# Streams and settings of a decode worker process, set by _init_decode_worker
+_DECODE_WORKER = {}
+
 
 class ReplicationSlotNotFoundError(Exception):
     """Custom exception when replication slot not found"""
@@ -33,9 +49,17 @@ class UnsupportedPayloadKindError(Exception):
     """Custom exception when waljson payload is not insert, update nor delete"""
 
 
+class ReplicationSlotBehindError(Exception):
+    """Custom exception when no replication slot still has the changes of a stream"""
+
+
+class PublicationTablesMissingError(Exception):
+    """Custom exception when tables of replicated streams are not in the publication streamed by pgoutput"""
+
+
 # pylint: disable=invalid-name,missing-function-docstring,too-many-branches,too-many-statements,too-many-arguments
 def get_pg_version(conn_info):
-    with post_db.open_connection(conn_info, False, True) as conn:
+    with post_db.pooled_connection(conn_info, prioritize_primary=True) as conn:
         with conn.cursor() as cur:
             cur.execute("SELECT setting::int AS version FROM pg_settings WHERE name='server_version_num'")
             version = cur.fetchone()[0]
@@ -94,7 +118,7 @@ def fetch_current_lsn(conn_config):
     if version < 90400:
         raise Exception('Logical replication not supported before PostgreSQL 9.4')
 
-    with post_db.open_connection(conn_config, False, True) as conn:
+    with post_db.pooled_connection(conn_config, prioritize_primary=True) as conn:
         with conn.cursor() as cur:
             # Use version specific lsn command
             if version >= 100000:
@@ -127,82 +151,33 @@ def get_stream_version(tap_stream_id, state):
     return stream_version
 
 
-def tuples_to_map(accum, t):
-    accum[t[0]] = t[1]
-    return accum
-
-
-def create_hstore_elem_query(elem):
-    return sql.SQL("SELECT hstore_to_array({})").format(sql.Literal(elem))
+def create_hstore_elem(conn_info, elem):  # pylint: disable=unused-argument
+    """
+    Parses the text of a hstore sent by wal2json into a dictionary, without a round trip to the server
+    """
+    return literals.parse_hstore(elem)
 
 
-def create_hstore_elem(conn_info, elem):
-    with post_db.open_connection(conn_info, False, True) as conn:
-        with conn.cursor() as cur:
-            query = create_hstore_elem_query(elem)
-            cur.execute(query)
-            res = cur.fetchone()[0]
-            hstore_elem = reduce(tuples_to_map, [res[i:i + 2] for i in range(0, len(res), 2)], {})
-            return hstore_elem
+# Parsers of the elements of arrays whose elements are not kept as text
+ARRAY_ELEMENT_PARSERS = {
+    'bit[]': literals.parse_boolean,
+    'boolean[]': literals.parse_boolean,
+    'double precision[]': float,
+    'integer[]': int,
+    'real[]': float,
+    'smallint[]': int,
+}
 
 
-def create_array_elem(elem, sql_datatype, conn_info):
+def create_array_elem(elem, sql_datatype, conn_info):  # pylint: disable=unused-argument
+    """
+    Parses the text of an array sent by wal2json into nested lists, without a round trip to the server.
+    Elements of types not in ARRAY_ELEMENT_PARSERS, including custom datatypes like enums, are kept as text.
+    """
     if elem is None:
         return None
 
-    with post_db.open_connection(conn_info, False, True) as conn:
-        with conn.cursor() as cur:
-            if sql_datatype == 'bit[]':
-                cast_datatype = 'boolean[]'
-            elif sql_datatype == 'boolean[]':
-                cast_datatype = 'boolean[]'
-            elif sql_datatype == 'character varying[]':
-                cast_datatype = 'character varying[]'
-            elif sql_datatype == 'cidr[]':
-                cast_datatype = 'cidr[]'
-            elif sql_datatype == 'citext[]':
-                cast_datatype = 'text[]'
-            elif sql_datatype == 'date[]':
-                cast_datatype = 'text[]'
-            elif sql_datatype == 'double precision[]':
-                cast_datatype = 'double precision[]'
-            elif sql_datatype == 'hstore[]':
-                cast_datatype = 'text[]'
-            elif sql_datatype == 'integer[]':
-                cast_datatype = 'integer[]'
-            elif sql_datatype == 'inet[]':
-                cast_datatype = 'inet[]'
-            elif sql_datatype == 'json[]':
-                cast_datatype = 'text[]'
-            elif sql_datatype == 'jsonb[]':
-                cast_datatype = 'text[]'
-            elif sql_datatype == 'macaddr[]':
-                cast_datatype = 'macaddr[]'
-            elif sql_datatype == 'money[]':
-                cast_datatype = 'text[]'
-            elif sql_datatype == 'numeric[]':
-                cast_datatype = 'text[]'
-            elif sql_datatype == 'real[]':
-                cast_datatype = 'real[]'
-            elif sql_datatype == 'smallint[]':
-                cast_datatype = 'smallint[]'
-            elif sql_datatype == 'text[]':
-                cast_datatype = 'text[]'
-            elif sql_datatype in ('time without time zone[]', 'time with time zone[]'):
-                cast_datatype = 'text[]'
-            elif sql_datatype in ('timestamp with time zone[]', 'timestamp without time zone[]'):
-                cast_datatype = 'text[]'
-            elif sql_datatype == 'uuid[]':
-                cast_datatype = 'text[]'
-
-            else:
-                # custom datatypes like enums
-                cast_datatype = 'text[]'
-
-            sql_stmt = f"""SELECT $stitch_quote${elem}$stitch_quote$::{cast_datatype}"""
-            cur.execute(sql_stmt)
-            res = cur.fetchone()[0]
-            return res
+    return literals.parse_array(elem, ARRAY_ELEMENT_PARSERS.get(sql_datatype, str))
 
 
 # pylint: disable=too-many-branches,too-many-nested-blocks,too-many-return-statements
@@ -352,22 +327,93 @@ def selected_value_to_singer_value(elem, sql_datatype, conn_info):
     return selected_value_to_singer_value_impl(elem, sql_datatype, conn_info)
 
 
-def row_to_singer_message(stream, row, version, columns, time_extracted, md_map, conn_info):
-    row_to_persist = ()
-    md_map[('properties', '_sdc_deleted_at')] = {'sql-datatype': 'timestamp with time zone'}
-    md_map[('properties', '_sdc_lsn')] = {'sql-datatype': "character varying"}
+def _fast_path_converter(value_class, sql_datatype, conn_info):
+    """
+    Returns values of the class wal2json sends for a sql-datatype as they are, and converts anything else
+    with selected_value_to_singer_value_impl
+    """
+    def convert_value(elem):
+        if elem.__class__ is value_class:
+            return elem
+        return selected_value_to_singer_value_impl(elem, sql_datatype, conn_info)
+
+    return convert_value
+
+
+def _convert_json(elem):
+    return None if elem is None else json.loads(elem)
+
 
-    for idx, elem in enumerate(row):
-        sql_datatype = md_map.get(('properties', columns[idx])).get('sql-datatype')
+def _convert_numeric(elem):
+    return None if elem is None else decimal.Decimal(elem)
+
+
+# Classes of the values wal2json sends for the most common sql-datatypes, which need no conversion
+PASS_THROUGH_CLASSES = {
+    'smallint': int,
+    'integer': int,
+    'bigint': int,
+    'text': str,
+    'character varying': str,
+    'character': str,
+    'citext': str,
+    'uuid': str,
+    'boolean': bool,
+    'real': float,
+    'double precision': float,
+}
+
+
+def value_converter(sql_datatype, conn_info):
+    """
+    Returns the function converting values of a sql-datatype like selected_value_to_singer_value does,
+    resolved once per column instead of walking the whole if-chain of conversions for every value
+    """
+    base_datatype = sql_datatype.replace('[]', '')
+    if base_datatype in ('json', 'jsonb'):
+        convert = _convert_json
+    elif base_datatype == 'numeric':
+        convert = _convert_numeric
+    elif base_datatype in PASS_THROUGH_CLASSES:
+        convert = _fast_path_converter(PASS_THROUGH_CLASSES[base_datatype], sql_datatype, conn_info)
+    else:
+        convert = partial(selected_value_to_singer_value_impl, og_sql_datatype=sql_datatype, conn_info=conn_info)
+
+    if sql_datatype.find('[]') > 0:
+        convert_array = post_db.array_converter(convert)
+        return lambda elem: convert_array(create_array_elem(elem, sql_datatype, conn_info))
+    return convert
+
+
+def row_converters(stream, columns, md_map, conn_info):
+    """
+    Returns the value converters of the columns of a stream, to pass to row_to_singer_message
+    """
+    converters = []
+    for column in columns:
+        sql_datatype = md_map.get(('properties', column)).get('sql-datatype')
 
         if not sql_datatype:
-            LOGGER.info("No sql-datatype found for stream %s: %s", stream, columns[idx])
+            LOGGER.info("No sql-datatype found for stream %s: %s", stream, column)
             raise Exception(f"Unable to find sql-datatype for stream {stream}")
 
-        cleaned_elem = selected_value_to_singer_value(elem, sql_datatype, conn_info)
-        row_to_persist += (cleaned_elem,)
+        converters.append(value_converter(sql_datatype, conn_info))
 
-    rec = dict(zip(columns, row_to_persist))
+    return tuple(converters)
+
+
+def add_automatic_properties_metadata(md_map):
+    md_map[('properties', '_sdc_deleted_at')] = {'sql-datatype': 'timestamp with time zone'}
+    md_map[('properties', '_sdc_lsn')] = {'sql-datatype': "character varying"}
+    return md_map
+
+
+def row_to_singer_message(stream, row, version, columns, time_extracted, md_map, conn_info, converters=None):
+    if converters is None:
+        add_automatic_properties_metadata(md_map)
+        converters = row_converters(stream, columns, md_map, conn_info)
+
+    rec = {column: convert(elem) for column, convert, elem in zip(columns, converters, row)}
 
     return singer.RecordMessage(
         stream=post_db.calculate_destination_stream_name(stream, md_map),
@@ -376,23 +422,108 @@ def row_to_singer_message(stream, row, version, columns, time_extracted, md_map,
         time_extracted=time_extracted)
 
 
-# pylint: disable=unused-argument,too-many-locals
-def consume_message(streams, state, msg, time_extracted, conn_info):
+def build_decode_plan(stream):
+    """
+    Returns what consume_message needs to turn the changes of a stream into records, computed once per stream
+    and rebuilt when its schema is refreshed
+    """
+    md_map = add_automatic_properties_metadata(metadata.to_map(stream['metadata']))
+    properties = set(stream['schema']['properties'].keys())
+
+    return {
+        'stream': stream,
+        'md_map': md_map,
+        'properties': properties,
+        'desired_columns': {c for c in properties if sync_common.should_sync_column(md_map, c)},
+        'destination_stream': post_db.calculate_destination_stream_name(stream, md_map),
+        # value converters by column name, resolved the first time a column is seen
+        'converters': {},
+    }
+
+
+def decode_plan_converters(decode_plan, columns, conn_info):
+    converters = decode_plan['converters']
+    missing_columns = [c for c in columns if c not in converters]
+    if missing_columns:
+        converters.update(zip(missing_columns, row_converters(decode_plan['stream'],
+                                                              missing_columns,
+                                                              decode_plan['md_map'],
+                                                              conn_info)))
+
+    return tuple(converters[c] for c in columns)
+
+
+def consume_message(streams, state, msg, time_extracted, conn_info, decode_plans=None):
+    """
+    Writes the record of a wal2json change. decode_plans caches what is computed once per stream between
+    calls, it is keyed by tap_stream_id.
+    """
     try:
         payload = json.loads(msg.payload)
     except Exception:
         return state
 
-    lsn = msg.data_start
+    return consume_change(streams, state, payload, msg.data_start, time_extracted, conn_info, decode_plans)
 
-    streams_lookup = {s['tap_stream_id']: s for s in streams}
 
-    tap_stream_id = post_db.compute_tap_stream_id(payload['schema'], payload['table'])
-    if streams_lookup.get(tap_stream_id) is None:
+def consume_pgoutput_message(streams, state, msg, time_extracted, conn_info, decoder, decode_plans=None):
+    """
+    Writes the record of a pgoutput change, decoded by decoder into the same payload as wal2json sends.
+    Messages other than changes only update the relation and type caches of the decoder.
+    """
+    payload = decoder.decode(msg.payload)
+    if payload is None:
         return state
 
-    target_stream = streams_lookup[tap_stream_id]
+    return consume_change(streams, state, payload, msg.data_start, time_extracted, conn_info, decode_plans)
+
+
+# pylint: disable=unused-argument,too-many-locals
+def stream_decode_plan(streams, payload, decode_plans):
+    """
+    Returns the decode plan of the stream a change payload belongs to, None for tables that are not replicated
+    """
+    tap_stream_id = post_db.compute_tap_stream_id(payload['schema'], payload['table'])
+    decode_plan = decode_plans.get(tap_stream_id)
+    if decode_plan is None:
+        target_stream = next((s for s in streams if s['tap_stream_id'] == tap_stream_id), None)
+        if target_stream is None:
+            return None
+
+    # Action Types:
+    # I = Insert
+    # U = Update
+    # D = Delete
+    # B = Begin Transaction
+    # C = Commit Transaction
+    # M = Message
+    # T = Truncate
+    action = payload['action']
+
+    if action not in {'I', 'U', 'D'}:
+        raise UnsupportedPayloadKindError(f"unrecognized replication operation: {action}")
+
+    if decode_plan is None:
+        decode_plan = decode_plans[tap_stream_id] = build_decode_plan(target_stream)
 
+    return decode_plan
+
+
+def new_payload_columns(decode_plan, payload):
+    """
+    Returns the columns of a change payload that are not in the schema of its stream
+    """
+    # only inserts and updates have the list of columns that can be used to detect any different in columns
+    if payload['action'] in {'I', 'U'}:
+        return {column['name'] for column in payload['columns']}.difference(decode_plan['properties'])
+
+    return set()
+
+
+def change_record(decode_plan, payload, lsn, time_extracted, conn_info):
+    """
+    Returns the record of an insert, update or delete payload at lsn
+    """
     # Example of Insert payload:
     # {
     #   "action":"I",
@@ -414,50 +545,12 @@ def consume_message(streams, state, msg, time_extracted, conn_info):
     #       {"name":"c","type":"timestamp without time zone","value":"2019-12-29 04:58:34.806671"}
     #   ]
     # }
-
-    # Action Types:
-    # I = Insert
-    # U = Update
-    # D = Delete
-    # B = Begin Transaction
-    # C = Commit Transaction
-    # M = Message
-    # T = Truncate
-    action = payload['action']
-
-    if action not in {'I', 'U', 'D'}:
-        raise UnsupportedPayloadKindError(f"unrecognized replication operation: {action}")
-
-    # Get the additional fields in payload that are not in schema properties:
-    # only inserts and updates have the list of columns that can be used to detect any different in columns
-    diff = set()
-    if action in {'I', 'U'}:
-        diff = {column['name'] for column in payload['columns']}.\
-            difference(target_stream['schema']['properties'].keys())
-
-    # if there is new columns in the payload that are not in the schema properties then refresh the stream schema
-    if diff:
-        LOGGER.info('Detected new columns "%s", refreshing schema of stream %s', diff, target_stream['stream'])
-        # encountered a column that is not in the schema
-        # refresh the stream schema and metadata by running discovery
-        refresh_streams_schema(conn_info, [target_stream])
-
-        # add the automatic properties back to the stream
-        add_automatic_properties(target_stream, conn_info.get('debug_lsn', False))
-
-        # publish new schema
-        sync_common.send_schema_message(target_stream, ['lsn'])
-
-    stream_version = get_stream_version(target_stream['tap_stream_id'], state)
-    stream_md_map = metadata.to_map(target_stream['metadata'])
-
-    desired_columns = {c for c in target_stream['schema']['properties'].keys() if sync_common.should_sync_column(
-        stream_md_map, c)}
+    desired_columns = decode_plan['desired_columns']
 
     col_names = []
     col_vals = []
 
-    if action in {'I', 'U'}:
+    if payload['action'] in {'I', 'U'}:
         for col in payload['columns']:
             if col['name'] in desired_columns:
                 col_names.append(col['name'])
@@ -466,9 +559,9 @@ def consume_message(streams, state, msg, time_extracted, conn_info):
         col_names.append('_sdc_deleted_at')
         col_vals.append(None)
 
-    elif action == 'D':
+    else:
         for column in payload['identity']:
-            if column['name'] in set(desired_columns):
+            if column['name'] in desired_columns:
                 col_names.append(column['name'])
                 col_vals.append(column['value'])
 
@@ -479,20 +572,205 @@ def consume_message(streams, state, msg, time_extracted, conn_info):
         col_names.append('_sdc_lsn')
         col_vals.append(str(lsn))
 
-    record_message = row_to_singer_message(target_stream,
-                                           col_vals,
-                                           stream_version,
-                                           col_names,
-                                           time_extracted,
-                                           stream_md_map,
-                                           conn_info)
+    return {column: convert(value) for column, convert, value in
+            zip(col_names, decode_plan_converters(decode_plan, col_names, conn_info), col_vals)}
+
+
+def consume_change(streams, state, payload, lsn, time_extracted, conn_info, decode_plans=None):
+    """
+    Writes the record of a change payload in the wal2json format-version 2 layout at lsn
+    """
+    if decode_plans is None:
+        decode_plans = {}
+
+    decode_plan = stream_decode_plan(streams, payload, decode_plans)
+    if decode_plan is None:
+        return state
+
+    target_stream = decode_plan['stream']
+
+    # Get the additional fields in payload that are not in schema properties
+    diff = new_payload_columns(decode_plan, payload)
+
+    # if there is new columns in the payload that are not in the schema properties then refresh the stream schema
+    if diff:
+        LOGGER.info('Detected new columns "%s", refreshing schema of stream %s', diff, target_stream['stream'])
+        # encountered a column that is not in the schema
+        # refresh the stream schema and metadata by running discovery
+        refresh_streams_schema(conn_info, [target_stream])
+
+        # add the automatic properties back to the stream
+        add_automatic_properties(target_stream, conn_info.get('debug_lsn', False))
 
-    singer.write_message(record_message)
+        # publish new schema
+        sync_common.send_schema_message(target_stream, ['lsn'])
+
+        decode_plan = decode_plans[target_stream['tap_stream_id']] = build_decode_plan(target_stream)
+
+    record_message = singer.RecordMessage(
+        stream=decode_plan['destination_stream'],
+        record=change_record(decode_plan, payload, lsn, time_extracted, conn_info),
+        version=get_stream_version(target_stream['tap_stream_id'], state),
+        time_extracted=time_extracted)
+
+    sync_common.write_message(record_message)
     state = singer.write_bookmark(state, target_stream['tap_stream_id'], 'lsn', lsn)
 
     return state
 
 
+def _init_decode_worker(streams, time_extracted, conn_info):
+    _DECODE_WORKER.update(streams=streams, time_extracted=time_extracted, conn_info=conn_info, decode_plans={},
+                          refreshes={})
+
+
+def _refresh_decode_worker_streams(refreshed_streams):
+    for tap_stream_id, (refresh, stream) in refreshed_streams.items():
+        if _DECODE_WORKER['refreshes'].get(tap_stream_id) != refresh:
+            _DECODE_WORKER['streams'] = [stream if s['tap_stream_id'] == tap_stream_id else s
+                                         for s in _DECODE_WORKER['streams']]
+            _DECODE_WORKER['decode_plans'].pop(tap_stream_id, None)
+            _DECODE_WORKER['refreshes'][tap_stream_id] = refresh
+
+
+def _decode_wal2json_messages(messages, refreshed_streams):
+    """
+    Decodes a batch of (lsn, payload) wal2json messages in a decode worker process, after replacing the streams
+    whose schema the main process refreshed. Returns for every message None when it is not a change of a
+    replicated table, the parsed payload when the schema of its stream has to be refreshed first, which is left
+    to the main process, or its tap_stream_id and its record as json.
+    """
+    _refresh_decode_worker_streams(refreshed_streams)
+    streams = _DECODE_WORKER['streams']
+    decode_plans = _DECODE_WORKER['decode_plans']
+    decoded = []
+    for lsn, payload in messages:
+        try:
+            payload = json.loads(payload)
+        except Exception:
+            decoded.append(None)
+            continue
+
+        decode_plan = stream_decode_plan(streams, payload, decode_plans)
+        if decode_plan is None:
+            decoded.append(None)
+        elif new_payload_columns(decode_plan, payload):
+            decoded.append(payload)
+        else:
+            record = change_record(decode_plan, payload, lsn, _DECODE_WORKER['time_extracted'],
+                                   _DECODE_WORKER['conn_info'])
+            # serialised like singer.format_message does
+            decoded.append((decode_plan['stream']['tap_stream_id'], simplejson.dumps(record, use_decimal=True)))
+
+    return decoded
+
+
+# pylint: disable=too-many-instance-attributes
+class DecodePool:
+    """
+    Decodes wal2json messages on a pool of worker processes: parsing the json and converting the values of
+    changes is what bounds replication to one core. Messages are sent to the workers in batches and the
+    records are written in the order the messages were read, so the lsn bookmarks of the streams never move
+    past a message whose record is not written yet.
+
+    Streams whose schema is refreshed by the main process are sent along with every later batch, numbered by
+    refresh, so whichever worker decodes the batch replaces its stale copy.
+    """
+
+    def __init__(self, streams, time_extracted, conn_info, workers):
+        self.streams = streams
+        self.time_extracted = time_extracted
+        self.conn_info = conn_info
+        self.max_pending_batches = 2 * workers
+        self.decode_plans = {}
+        self.envelopes = {}
+        # tap_stream_id -> (number of the refresh, stream) of the streams whose schema was refreshed
+        self.refreshed_streams = {}
+        self.batch = []
+        # (lsns, AsyncResult) of the batches sent to the workers, in the order they were read
+        self.results = deque()
+        # worker processes are spawned, forking a process with replication threads running is not safe
+        self.pool = multiprocessing.get_context('spawn').Pool(workers, _init_decode_worker,
+                                                              (streams, time_extracted, conn_info))
+
+    @property
+    def pending(self):
+        """Whether records of submitted messages are not written yet"""
+        return bool(self.batch or self.results)
+
+    def submit(self, state, msg):
+        """
+        Queues a message for decoding and writes the records of the batches decoded so far. Waits for the
+        oldest batch when the workers are too far behind.
+        """
+        self.batch.append((msg.data_start, msg.payload))
+        if len(self.batch) >= DECODE_BATCH_SIZE:
+            self._send_batch()
+
+        while len(self.results) > self.max_pending_batches:
+            state = self._write_batch(state)
+
+        return self.drain(state)
+
+    def drain(self, state, wait=False):
+        """
+        Sends the queued messages to the workers and writes the records of the batches decoded so far,
+        or of every batch with wait
+        """
+        self._send_batch()
+        while self.results and (wait or self.results[0][1].ready()):
+            state = self._write_batch(state)
+
+        return state
+
+    def close(self):
+        """
+        Stops the worker processes, records not written yet are lost
+        """
+        self.pool.terminate()
+        self.pool.join()
+
+    def _send_batch(self):
+        if self.batch:
+            self.results.append(([lsn for lsn, _ in self.batch],
+                                 self.pool.apply_async(_decode_wal2json_messages,
+                                                       (self.batch, self.refreshed_streams))))
+            self.batch = []
+
+    def _write_batch(self, state):
+        lsns, result = self.results.popleft()
+        for lsn, decoded in zip(lsns, result.get()):
+            if isinstance(decoded, dict):
+                tap_stream_id = post_db.compute_tap_stream_id(decoded['schema'], decoded['table'])
+                decode_plan = self.decode_plans.get(tap_stream_id)
+                state = consume_change(self.streams, state, decoded, lsn, self.time_extracted, self.conn_info,
+                                       self.decode_plans)
+                if self.decode_plans.get(tap_stream_id) is not decode_plan:
+                    self._refresh_stream(tap_stream_id)
+            elif decoded is not None:
+                tap_stream_id, record_json = decoded
+                sync_common.write_json_record(self._envelope(tap_stream_id, state), record_json)
+                state = singer.write_bookmark(state, tap_stream_id, 'lsn', lsn)
+
+        return state
+
+    def _refresh_stream(self, tap_stream_id):
+        refresh = self.refreshed_streams.get(tap_stream_id, (0, None))[0] + 1
+        stream = next(s for s in self.streams if s['tap_stream_id'] == tap_stream_id)
+        # batches are pickled by a thread of the pool, so the dict they were sent with is never changed
+        self.refreshed_streams = {**self.refreshed_streams, tap_stream_id: (refresh, copy.deepcopy(stream))}
+
+    def _envelope(self, tap_stream_id, state):
+        envelope = self.envelopes.get(tap_stream_id)
+        if envelope is None:
+            stream = next(s for s in self.streams if s['tap_stream_id'] == tap_stream_id)
+            envelope = self.envelopes[tap_stream_id] = post_db.json_record_envelope(
+                stream, get_stream_version(tap_stream_id, state), self.time_extracted,
+                metadata.to_map(stream['metadata']))
+
+        return envelope
+
+
 def generate_replication_slot_name(dbname, tap_id=None, prefix='pipelinewise'):
     """Generate replication slot name with
 
@@ -535,11 +813,76 @@ def locate_replication_slot_by_cur(cursor, dbname, tap_id=None):
 
 
 def locate_replication_slot(conn_info):
-    with post_db.open_connection(conn_info, False, True) as conn:
+    with post_db.pooled_connection(conn_info, prioritize_primary=True) as conn:
         with conn.cursor() as cur:
             return locate_replication_slot_by_cur(cur, conn_info['dbname'], conn_info['tap_id'])
 
 
+def locate_replication_slots(conn_info, count):
+    """Locates the replication slots the streams of a database are sharded across: the slot found by
+    locate_replication_slot followed by the slots named after it with a _1, _2, ... suffix.
+
+    :param conn_info: Connection config of the database
+    :param count: Number of replication slots
+    :return: confirmed_flush_lsn of every slot by slot name, in slot order
+    :rtype: dict
+    """
+    with post_db.pooled_connection(conn_info, prioritize_primary=True) as conn:
+        with conn.cursor() as cur:
+            first_slot = locate_replication_slot_by_cur(cur, conn_info['dbname'], conn_info['tap_id'])
+            slots = [first_slot] + [f'{first_slot}_{shard}' for shard in range(1, count)]
+            cur.execute("SELECT slot_name, confirmed_flush_lsn::text FROM pg_replication_slots "
+                        "WHERE slot_name = ANY(%s)", (slots,))
+            confirmed_flush_lsns = dict(cur.fetchall())
+
+    missing_slots = [slot for slot in slots if slot not in confirmed_flush_lsns]
+    if missing_slots:
+        raise ReplicationSlotNotFoundError(f'Unable to find replication slots {", ".join(missing_slots)}')
+
+    return {slot: lsn_to_int(confirmed_flush_lsns[slot]) or 0 for slot in slots}
+
+
+def shard_streams(streams, state, slots):
+    """Splits the streams of a database across its replication slots, bookmarking the slot of every stream.
+
+    A stream belongs to the slot its tap_stream_id hashes to. It is moved there from the slot it is
+    bookmarked with, the first one if none, only once the new slot has not confirmed changes past the lsn
+    bookmark of the stream, so none of its changes are skipped; until then it stays on its slot. A stream
+    whose slot is no longer used goes to any slot that has not confirmed changes past its lsn bookmark.
+
+    :param streams: LOG_BASED streams of the database
+    :param state: State with the lsn and replication_slot bookmarks of the streams
+    :param slots: confirmed_flush_lsn of every slot by slot name, as returned by locate_replication_slots
+    :return: the state and the streams of every slot by slot name
+    :rtype: tuple
+    """
+    slot_names = list(slots)
+    shards = {slot: [] for slot in slot_names}
+    for stream in streams:
+        tap_stream_id = stream['tap_stream_id']
+        lsn = get_bookmark(state, tap_stream_id, 'lsn')
+        target_slot = slot_names[zlib.crc32(tap_stream_id.encode('utf-8')) % len(slot_names)]
+        current_slot = get_bookmark(state, tap_stream_id, 'replication_slot', slot_names[0])
+
+        if target_slot != current_slot and slots[target_slot] <= lsn:
+            LOGGER.info('Moving stream %s from replication slot %s to %s', tap_stream_id, current_slot, target_slot)
+            slot = target_slot
+        elif current_slot in slots:
+            slot = current_slot
+        else:
+            slot = next((name for name in slot_names if slots[name] <= lsn), None)
+            if slot is None:
+                raise ReplicationSlotBehindError(
+                    f'Replication slot {current_slot} of stream {tap_stream_id} is no longer used and every slot '
+                    f'has confirmed changes past its lsn {int_to_lsn(lsn)}, the stream has to be resynced')
+            LOGGER.info('Moving stream %s from replication slot %s to %s', tap_stream_id, current_slot, slot)
+
+        shards[slot].append(stream)
+        state = singer.write_bookmark(state, tap_stream_id, 'replication_slot', slot)
+
+    return state, shards
+
+
 # pylint: disable=anomalous-backslash-in-string
 def streams_to_wal2json_tables(streams):
     """Converts a list of singer stream dictionaries to wal2json plugin compatible string list.
@@ -570,13 +913,46 @@ def streams_to_wal2json_tables(streams):
     return ','.join(tables)
 
 
-def sync_tables(conn_info, logical_streams, state, end_lsn, state_file):
-    state_comitted = state
-    lsn_comitted = min([get_bookmark(state_comitted, s['tap_stream_id'], 'lsn') for s in logical_streams])
+def check_publication_tables(conn_info, publication, streams):
+    """Makes sure the tables of the streams are in the publication streamed by pgoutput. The changes of a table
+    missing from it would never be streamed while the lsn bookmark of its stream moves on.
+
+    :param conn_info: Connection settings of the database of the streams
+    :param publication: Name of the publication
+    :param streams: LOG_BASED streams replicated from the publication
+    :raises PublicationTablesMissingError: if any table is not in the publication
+    """
+    with post_db.pooled_connection(conn_info, prioritize_primary=True) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT schemaname, tablename FROM pg_publication_tables WHERE pubname = %s",
+                        (publication,))
+            published = {tuple(row) for row in cur.fetchall()}
+
+    missing = [s['tap_stream_id'] for s in streams
+               if (metadata.to_map(s['metadata']).get(()).get('schema-name'), s['table_name']) not in published]
+    if missing:
+        raise PublicationTablesMissingError(f'Tables of streams {missing} are not in publication {publication}, '
+                                            f'add them with ALTER PUBLICATION')
+
+
+def publication_names_option(publications):
+    """Converts a list of publication names to the 'publication_names' option of the pgoutput plugin.
+    Names are quoted because pgoutput parses the option as a list of identifiers, which folds unquoted
+    names to lower case.
+
+    :param publications: List of publication names
+    :return: comma separated list of quoted publication names
+    :rtype: str
+    """
+    return ','.join('"' + publication.replace('"', '""') + '"' for publication in publications)
+
+
+def sync_tables(conn_info, logical_streams, state, end_lsn, state_file, slot=None):
+    lsn_comitted = min([get_bookmark(state, s['tap_stream_id'], 'lsn') for s in logical_streams])
     start_lsn = lsn_comitted
     lsn_to_flush = None
     time_extracted = utils.now()
-    slot = locate_replication_slot(conn_info)
+    slot = slot or locate_replication_slot(conn_info)
     lsn_last_processed = None
     lsn_currently_processing = None
     lsn_processed_count = 0
@@ -589,6 +965,8 @@ def sync_tables(conn_info, logical_streams, state, end_lsn, state_file):
     for s in logical_streams:
         sync_common.send_schema_message(s, ['lsn'])
 
+    decode_plans = {}
+
     version = get_pg_version(conn_info)
 
     # Create replication connection and cursor
@@ -601,41 +979,69 @@ def sync_tables(conn_info, logical_streams, state, end_lsn, state_file):
         LOGGER.info('Set session wal_sender_timeout = %i milliseconds', wal_sender_timeout)
         cur.execute(f"SET SESSION wal_sender_timeout = {wal_sender_timeout}")
 
+    if conn_info.get('logical_decoding_plugin') == DECODING_PLUGIN_PGOUTPUT:
+        publication = conn_info.get('publication') or slot
+        check_publication_tables(conn_info, publication, logical_streams)
+        pgoutput_decoder = pgoutput.PgoutputDecoder(psycopg2.extensions.encodings[conn.encoding])
+        replication_options = {
+            'proto_version': str(pgoutput.PROTO_VERSION),
+            'publication_names': publication_names_option([publication])
+        }
+    else:
+        pgoutput_decoder = None
+        replication_options = {
+            'format-version': 2,
+            'include-transaction': False,
+            'include-timestamp': True,
+            'include-types': False,
+            'actions': 'insert,update,delete',
+            'add-tables': streams_to_wal2json_tables(logical_streams)
+        }
+
     try:
         LOGGER.info('Request wal streaming from %s to %s (slot %s)',
                     int_to_lsn(start_lsn),
                     int_to_lsn(end_lsn),
                     slot)
         # psycopg2 2.8.4 will send a keep-alive message to postgres every status_interval
+        # pgoutput messages are binary and decoded by pgoutput_decoder
         cur.start_replication(slot_name=slot,
-                              decode=True,
+                              decode=pgoutput_decoder is None,
                               start_lsn=start_lsn,
                               status_interval=poll_interval,
-                              options={
-                                  'format-version': 2,
-                                  'include-transaction': False,
-                                  'include-timestamp': True,
-                                  'include-types': False,
-                                  'actions': 'insert,update,delete',
-                                  'add-tables': streams_to_wal2json_tables(logical_streams)
-                              })
+                              options=replication_options)
 
     except psycopg2.ProgrammingError as ex:
         raise Exception(f"Unable to start replication with logical replication (slot {ex})") from ex
 
     lsn_received_timestamp = datetime.datetime.utcnow()
-    poll_timestamp = datetime.datetime.utcnow()
+    poll_timestamp = lsn_received_timestamp
+    max_run_timestamp = start_run_timestamp + datetime.timedelta(seconds=max_run_seconds)
+
+    decode_pool = None
+    if pgoutput_decoder is None and conn_info.get('logical_decode_workers', 1) > 1:
+        LOGGER.info('Decoding wal2json messages with %i worker processes', conn_info['logical_decode_workers'])
+        decode_pool = DecodePool(logical_streams, time_extracted, conn_info, conn_info['logical_decode_workers'])
+
+    # The committed lsn is read from the lsn_ack_file or the state_file on a thread of its own
+    lsn_reader = committed_lsn.CommittedLsnReader(state_file, [s['tap_stream_id'] for s in logical_streams],
+                                                  lsn_comitted, poll_interval, conn_info.get('lsn_ack_file'))
+    if state_file or lsn_reader.ack_file:
+        lsn_reader.start()
 
     try:
         while True:
+            # The clock is read once per message
+            now = datetime.datetime.utcnow()
+
             # Disconnect when no data received for logical_poll_total_seconds
             # needs to be long enough to wait for the largest single wal payload to avoid unplanned timeouts
-            poll_duration = (datetime.datetime.utcnow() - lsn_received_timestamp).total_seconds()
+            poll_duration = (now - lsn_received_timestamp).total_seconds()
             if poll_duration > logical_poll_total_seconds:
                 LOGGER.info('Breaking - %i seconds of polling with no data', poll_duration)
                 break
 
-            if datetime.datetime.utcnow() >= (start_run_timestamp + datetime.timedelta(seconds=max_run_seconds)):
+            if now >= max_run_timestamp:
                 LOGGER.info('Breaking - reached max_run_seconds of %i', max_run_seconds)
                 break
 
@@ -652,7 +1058,13 @@ def sync_tables(conn_info, logical_streams, state, end_lsn, state_file):
                                 int_to_lsn(end_lsn))
                     break
 
-                state = consume_message(logical_streams, state, msg, time_extracted, conn_info)
+                if decode_pool is not None:
+                    state = decode_pool.submit(state, msg)
+                elif pgoutput_decoder is None:
+                    state = consume_message(logical_streams, state, msg, time_extracted, conn_info, decode_plans)
+                else:
+                    state = consume_pgoutput_message(logical_streams, state, msg, time_extracted, conn_info,
+                                                     pgoutput_decoder, decode_plans)
 
                 # When using wal2json with write-in-chunks, multiple messages can have the same lsn
                 # This is to ensure we only flush to lsn that has completed entirely
@@ -672,50 +1084,65 @@ def sync_tables(conn_info, logical_streams, state, end_lsn, state_file):
                 elif int(msg.data_start) > lsn_currently_processing:
                     lsn_last_processed = lsn_currently_processing
                     lsn_currently_processing = msg.data_start
-                    lsn_received_timestamp = datetime.datetime.utcnow()
+                    lsn_received_timestamp = now
                     lsn_processed_count = lsn_processed_count + 1
                     if lsn_processed_count >= UPDATE_BOOKMARK_PERIOD:
                         LOGGER.debug('Updating bookmarks for all streams to lsn = %s (%s)',
                                     lsn_last_processed,
                                     int_to_lsn(lsn_last_processed))
+                        if decode_pool is not None:
+                            state = decode_pool.drain(state, wait=True)
                         for s in logical_streams:
                             state = singer.write_bookmark(state, s['tap_stream_id'], 'lsn', lsn_last_processed)
-                        singer.write_message(singer.StateMessage(value=copy.deepcopy(state)))
+                        sync_common.write_message(singer.StateMessage(value=copy.deepcopy(state)))
                         lsn_processed_count = 0
             else:
+                if decode_pool is not None:
+                    state = decode_pool.drain(state, wait=True)
+                # Wait for a message, a newer committed lsn or the next timer, whichever comes first
+                timeout = min(poll_timestamp + datetime.timedelta(seconds=poll_interval),
+                              lsn_received_timestamp + datetime.timedelta(seconds=logical_poll_total_seconds),
+                              max_run_timestamp) - now
                 try:
-                    # Wait for a second unless a message arrives
-                    select([cur], [], [], 1)
+                    readable, _, _ = select([cur, lsn_reader], [], [], max(timeout.total_seconds(), 0))
+                    if lsn_reader in readable:
+                        lsn_reader.acknowledge()
                 except InterruptedError:
                     pass
 
-            # Every poll_interval, update latest comitted lsn position from the state_file
-            if datetime.datetime.utcnow() >= (poll_timestamp + datetime.timedelta(seconds=poll_interval)):
+            # Confirm the flush of every lsn the target committed since the last confirmation
+            lsn_comitted = lsn_reader.lsn_comitted
+            if lsn_currently_processing is not None and lsn_currently_processing > lsn_comitted > lsn_to_flush:
+                lsn_to_flush = lsn_comitted
+                LOGGER.info('Confirming write up to %s, flush to %s',
+                            int_to_lsn(lsn_to_flush),
+                            int_to_lsn(lsn_to_flush))
+                cur.send_feedback(write_lsn=lsn_to_flush, flush_lsn=lsn_to_flush, reply=True, force=True)
+
+            if now >= poll_timestamp + datetime.timedelta(seconds=poll_interval):
                 if lsn_currently_processing is None:
                     LOGGER.info('Waiting for first wal message')
                 else:
                     LOGGER.info('Lastest wal message received was %s', int_to_lsn(lsn_last_processed))
-                    try:
-                        with open(state_file, mode="r", encoding="utf-8") as fh:
-                            state_comitted = json.load(fh)
-                    except Exception:
-                        LOGGER.debug('Unable to open and parse %s', state_file)
-                    finally:
-                        lsn_comitted = min(
-                            [get_bookmark(state_comitted, s['tap_stream_id'], 'lsn') for s in logical_streams])
-                        if (lsn_currently_processing > lsn_comitted) and (lsn_comitted > lsn_to_flush):
-                            lsn_to_flush = lsn_comitted
-                            LOGGER.info('Confirming write up to %s, flush to %s',
-                                        int_to_lsn(lsn_to_flush),
-                                        int_to_lsn(lsn_to_flush))
-                            cur.send_feedback(write_lsn=lsn_to_flush, flush_lsn=lsn_to_flush, reply=True, force=True)
-
-                poll_timestamp = datetime.datetime.utcnow()
+
+                poll_timestamp = now
+
+        if decode_pool is not None:
+            state = decode_pool.drain(state, wait=True)
 
         # Close replication connection and cursor
         cur.close()
         conn.close()
     finally:
+        lsn_reader.stop()
+        lsn_comitted = lsn_reader.lsn_comitted
+
+        if decode_pool is not None:
+            if decode_pool.pending:
+                # records of messages read are not written, the bookmarks stay at the last record written
+                lsn_last_processed = None
+            decode_pool.close()
+
         if lsn_last_processed:
             if lsn_comitted > lsn_last_processed:
                 lsn_last_processed = lsn_comitted
@@ -730,6 +1157,6 @@ def sync_tables(conn_info, logical_streams, state, end_lsn, state_file):
             for s in logical_streams:
                 state = singer.write_bookmark(state, s['tap_stream_id'], 'lsn', lsn_last_processed)
 
-        singer.write_message(singer.StateMessage(value=copy.deepcopy(state)))
+        sync_common.write_message(singer.StateMessage(value=copy.deepcopy(state)))
 
     return state
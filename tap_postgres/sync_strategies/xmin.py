@@ -0,0 +1,101 @@
+import copy
+import time
+import singer
+
+from singer import utils
+from singer import metrics
+
+import tap_postgres.db as post_db
+import tap_postgres.sync_strategies.common as sync_common
+
+LOGGER = singer.get_logger('tap_postgres')
+
+# The xmin of a row is a 32 bit transaction id that wraps around, txid_current_snapshot() counts transaction
+# ids with their epoch
+XID_RANGE = 2 ** 32
+
+# The oldest transaction still running, every transaction before it is finished, and the next transaction id
+SNAPSHOT_SQL = "SELECT txid_snapshot_xmin(s), txid_snapshot_xmax(s) FROM txid_current_snapshot() AS s"
+
+
+def modified_since_clause(snapshot_xmin, next_xid):
+    """
+    Builds the WHERE clause selecting the rows written by transactions from snapshot_xmin on, the ones that
+    were running or not started yet when the snapshot of the previous sync was taken. The xmin of a row is
+    put in the epoch that makes it the latest transaction id before next_xid. Rows frozen more than
+    2^32 transactions ago can look recent again, and are sent once more.
+    Returns an empty clause when more than 2^32 transactions have gone by since snapshot_xmin.
+    """
+    max_age = next_xid - snapshot_xmin
+    if max_age >= XID_RANGE:
+        return ''
+
+    return f"WHERE ({next_xid % XID_RANGE} - xmin::text::bigint + {XID_RANGE}) % {XID_RANGE} <= {max_age}"
+
+
+# pylint: disable=too-many-locals
+def sync_table(conn_info, stream, state, desired_columns, md_map):
+    """
+    Syncs the rows inserted or updated since the previous sync of the table. The bookmark is the oldest
+    transaction still running when the sync started, taken before the rows are read: the rows of every
+    transaction before it were visible to the sync, the ones of every transaction from it on are read again
+    by the next sync. Deleted rows are not detected.
+    """
+    time_extracted = utils.now()
+    tap_stream_id = stream['tap_stream_id']
+
+    stream_version = singer.get_bookmark(state, tap_stream_id, 'version')
+    if stream_version is None:
+        stream_version = int(time.time() * 1000)
+
+    state = singer.write_bookmark(state, tap_stream_id, 'version', stream_version)
+    sync_common.write_message(singer.StateMessage(value=copy.deepcopy(state)))
+
+    sync_common.write_message(singer.ActivateVersionMessage(
+        stream=post_db.calculate_destination_stream_name(stream, md_map),
+        version=stream_version))
+
+    escaped_columns = post_db.prepare_select_list_sql(desired_columns, md_map, conn_info)
+    converters = post_db.row_converters(desired_columns, md_map)
+    json_envelope = post_db.json_record_envelope(stream, stream_version, time_extracted, md_map) \
+        if post_db.uses_json_records(desired_columns, md_map, conn_info) else None
+    fq_table_name = post_db.fully_qualified_table_name(md_map.get(()).get('schema-name'), stream['table_name'])
+    snapshot_xmin = singer.get_bookmark(state, tap_stream_id, 'snapshot_xmin')
+    hstore_available = post_db.hstore_available(conn_info)
+
+    with metrics.record_counter(None) as counter:
+        with post_db.pooled_connection(conn_info) as conn:
+
+            # The server and client encodings are logged once per database by post_db.session_info
+            if hstore_available:
+                post_db.register_hstore(conn, conn_info)
+
+            with conn.cursor() as cur:
+                cur.execute(SNAPSHOT_SQL)
+                next_snapshot_xmin, next_xid = cur.fetchone()
+
+            if snapshot_xmin is None:
+                LOGGER.info("Beginning new XMIN replication sync %s of the whole table", stream_version)
+                where_statement = ''
+            else:
+                LOGGER.info("Beginning new XMIN replication sync %s of the rows written from transaction %s on",
+                            stream_version, snapshot_xmin)
+                where_statement = modified_since_clause(snapshot_xmin, next_xid)
+
+            select_sql = f"SELECT {','.join(escaped_columns)} FROM {fq_table_name} {where_statement}"
+            LOGGER.info("select %s with itersize %s", select_sql, post_db.CURSOR_ITER_SIZE)
+
+            for rec in post_db.fetch_rows(conn, conn_info, select_sql, desired_columns, md_map):
+                if json_envelope:
+                    sync_common.write_json_record(json_envelope, rec[0])
+                else:
+                    sync_common.write_message(post_db.selected_row_to_singer_message(stream,
+                                                                                     rec,
+                                                                                     stream_version,
+                                                                                     desired_columns,
+                                                                                     time_extracted,
+                                                                                     md_map,
+                                                                                     converters))
+                counter.increment()
+
+    return singer.write_bookmark(state, tap_stream_id, 'snapshot_xmin', next_snapshot_xmin)
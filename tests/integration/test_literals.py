@@ -0,0 +1,74 @@
+import random
+import unittest
+
+from tap_postgres import literals
+
+from ..utils import get_test_connection
+
+FUZZ_CHARACTERS = ['a', 'b', 'Z', '1', ' ', '\t', '\n', ',', '{', '}', '"', '\\', "'", '=', '>', 'é', '€', '😀']
+
+
+def random_text(rand):
+    if rand.random() < 0.1:
+        return rand.choice(['', 'NULL', 'null', ' NULL ', 'NULLS'])
+    return ''.join(rand.choice(FUZZ_CHARACTERS) for _ in range(rand.randint(0, 8)))
+
+
+def random_array(rand, dimensions, make_element):
+    if not dimensions:
+        return None if rand.random() < 0.1 else make_element(rand)
+    return [random_array(rand, dimensions[1:], make_element) for _ in range(dimensions[0])]
+
+
+class TestLiteralsAgainstServer(unittest.TestCase):
+    """Compare the local parsers with the casting of the server"""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.conn = get_test_connection()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.conn.close()
+
+    def assert_parsed_like_server(self, value, cast_datatype, parse_element):
+        with self.conn.cursor() as cur:
+            cur.execute(f"SELECT (%s)::{cast_datatype}::text, (%s)::{cast_datatype}", (value, value))
+            text, server_value = cur.fetchone()
+        self.assertEqual(server_value, literals.parse_array(text, parse_element), text)
+
+    def test_text_arrays(self):
+        rand = random.Random(20221111)
+        for _ in range(300):
+            dimensions = [rand.randint(1, 4) for _ in range(rand.randint(1, 3))]
+            self.assert_parsed_like_server(random_array(rand, dimensions, random_text), 'text[]', str)
+
+    def test_integer_arrays(self):
+        rand = random.Random(20221112)
+        for _ in range(100):
+            dimensions = [rand.randint(1, 4) for _ in range(rand.randint(1, 3))]
+            value = random_array(rand, dimensions, lambda r: r.randint(-2 ** 31, 2 ** 31 - 1))
+            self.assert_parsed_like_server(value, 'integer[]', int)
+
+    def test_boolean_and_float_arrays(self):
+        self.assert_parsed_like_server([True, None, False], 'boolean[]', literals.parse_boolean)
+        self.assert_parsed_like_server([1.5, -0.1, 1e300, None], 'double precision[]', float)
+
+    def test_dimension_decoration(self):
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT '[0:1][2:3]={{1,2},{3,4}}'::integer[]::text")
+            text = cur.fetchone()[0]
+        self.assertEqual([[1, 2], [3, 4]], literals.parse_array(text, int))
+
+    def test_hstores(self):
+        rand = random.Random(20221113)
+        with self.conn.cursor() as cur:
+            cur.execute("CREATE EXTENSION IF NOT EXISTS hstore")
+            for _ in range(300):
+                keys = [random_text(rand) for _ in range(rand.randint(0, 5))]
+                values = [None if rand.random() < 0.1 else random_text(rand) for _ in keys]
+                cur.execute("SELECT hstore(%s::text[], %s::text[])::text", (keys, values))
+                text = cur.fetchone()[0]
+                cur.execute("SELECT hstore_to_array(%s::hstore)", (text,))
+                server_pairs = cur.fetchone()[0]
+                self.assertEqual(dict(zip(server_pairs[::2], server_pairs[1::2])), literals.parse_hstore(text), text)
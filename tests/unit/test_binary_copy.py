@@ -0,0 +1,172 @@
+import datetime
+import decimal
+import struct
+
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from tap_postgres import binary_copy
+
+
+def copy_stream(rows):
+    """Builds a binary COPY stream of rows made of already encoded fields, None meaning NULL"""
+    parts = [binary_copy.SIGNATURE, struct.pack('!ii', 0, 0)]
+    for row in rows:
+        parts.append(struct.pack('!h', len(row)))
+        for field in row:
+            if field is None:
+                parts.append(struct.pack('!i', -1))
+            else:
+                parts.append(struct.pack('!i', len(field)) + field)
+    parts.append(struct.pack('!h', -1))
+    return b''.join(parts)
+
+
+def numeric(ndigits_weight_sign_dscale, digits):
+    return struct.pack('!hhHH', *ndigits_weight_sign_dscale) + struct.pack(f'!{len(digits)}h', *digits)
+
+
+def array(element_oid, dimensions, elements):
+    data = struct.pack('!iiI', len(dimensions), 1 if None in elements else 0, element_oid)
+    for size in dimensions:
+        data += struct.pack('!ii', size, 1)
+    for element in elements:
+        data += struct.pack('!i', -1) if element is None else struct.pack('!i', len(element)) + element
+    return data
+
+
+class TestBinaryCopyDecoders(TestCase):
+    """Test Cases for the binary send format decoders"""
+
+    def test_integers_and_floats(self):
+        self.assertEqual(-2, binary_copy.decode_int2(struct.pack('!h', -2)))
+        self.assertEqual(2 ** 31 - 1, binary_copy.decode_int4(struct.pack('!i', 2 ** 31 - 1)))
+        self.assertEqual(-2 ** 63, binary_copy.decode_int8(struct.pack('!q', -2 ** 63)))
+        self.assertEqual(1.5, binary_copy.decode_float4(struct.pack('!f', 1.5)))
+        self.assertEqual(0.1, binary_copy.decode_float8(struct.pack('!d', 0.1)))
+        self.assertTrue(binary_copy.decode_bool(b'\x01'))
+        self.assertFalse(binary_copy.decode_bool(b'\x00'))
+
+    def test_numeric(self):
+        self.assertEqual(decimal.Decimal('12345.678'),
+                         binary_copy.decode_numeric(numeric((3, 1, 0, 3), [1, 2345, 6780])))
+        self.assertEqual(decimal.Decimal('-0.0012'),
+                         binary_copy.decode_numeric(numeric((1, -1, 0x4000, 4), [12])))
+        self.assertEqual(decimal.Decimal('10000'),
+                         binary_copy.decode_numeric(numeric((1, 1, 0, 0), [1])))
+        self.assertEqual(decimal.Decimal('0.00'),
+                         binary_copy.decode_numeric(numeric((0, 0, 0, 2), [])))
+        self.assertEqual('0.00', str(binary_copy.decode_numeric(numeric((0, 0, 0, 2), []))))
+        self.assertTrue(binary_copy.decode_numeric(numeric((0, 0, 0xC000, 0), [])).is_nan())
+
+    def test_dates_and_times(self):
+        self.assertEqual(datetime.date(1999, 12, 31), binary_copy.decode_date(struct.pack('!i', -1)))
+        self.assertEqual(datetime.date.max, binary_copy.decode_date(struct.pack('!i', 0x7FFFFFFF)))
+        self.assertEqual(datetime.datetime(2000, 1, 2, 0, 0, 1, 5),
+                         binary_copy.decode_timestamp(struct.pack('!q', 86401000005)))
+        self.assertEqual(datetime.datetime(2000, 1, 1, 1, tzinfo=datetime.timezone.utc),
+                         binary_copy.decode_timestamptz(struct.pack('!q', 3600000000)))
+        self.assertEqual(datetime.time(13, 30, 15),
+                         binary_copy.decode_time(struct.pack('!q', (13 * 3600 + 30 * 60 + 15) * 1000000)))
+        self.assertEqual(datetime.time(0, 0), binary_copy.decode_time(struct.pack('!q', 24 * 3600 * 1000000)))
+        self.assertEqual(datetime.time(10, tzinfo=datetime.timezone(datetime.timedelta(hours=2))),
+                         binary_copy.decode_timetz(struct.pack('!qi', 10 * 3600 * 1000000, -7200)))
+
+    def test_text_types(self):
+        self.assertEqual('héllo', binary_copy.decoder_for('text', 'utf-8')('héllo'.encode('utf-8')))
+        self.assertEqual('{"a": 1}', binary_copy.decoder_for('jsonb', 'utf-8')(b'\x01{"a": 1}'))
+        self.assertEqual('0f2a4b3c-5d6e-4f70-8192-a3b4c5d6e7f8',
+                         binary_copy.decoder_for('uuid', 'utf-8')(
+                             bytes.fromhex('0f2a4b3c5d6e4f708192a3b4c5d6e7f8')))
+
+    def test_hstore(self):
+        data = struct.pack('!i', 2) + struct.pack('!i', 1) + b'a' + struct.pack('!i', 1) + b'1' \
+            + struct.pack('!i', 1) + b'b' + struct.pack('!i', -1)
+        self.assertEqual({'a': '1', 'b': None}, binary_copy.decoder_for('hstore', 'utf-8')(data))
+
+    def test_arrays(self):
+        decode = binary_copy.decoder_for('integer[]', 'utf-8')
+        self.assertEqual([], decode(struct.pack('!iiI', 0, 0, 23)))
+        self.assertEqual([1, None, 3], decode(array(23, [3], [struct.pack('!i', 1), None, struct.pack('!i', 3)])))
+        self.assertEqual([[1, 2, 3], [4, 5, 6]],
+                         decode(array(23, [2, 3], [struct.pack('!i', value) for value in range(1, 7)])))
+
+    def test_types_without_decoder_are_read_as_text(self):
+        self.assertFalse(binary_copy.has_decoder('money'))
+        self.assertFalse(binary_copy.has_decoder(None))
+        self.assertTrue(binary_copy.has_decoder('bigint[]'))
+        self.assertEqual('$1.00', binary_copy.decoder_for('money', 'utf-8')(b'$1.00'))
+        self.assertEqual(['1', '0'], binary_copy.decoder_for('bit[]', 'utf-8')(array(25, [2], [b'1', b'0'])))
+
+
+class TestBinaryCopyParser(TestCase):
+    """Test Cases for parsing binary COPY streams"""
+
+    def setUp(self) -> None:
+        self.decoders = binary_copy.column_decoders(['integer', 'text'], 'utf-8')
+        self.stream = copy_stream([[struct.pack('!i', idx), f'row {idx}'.encode()] for idx in range(5)]
+                                  + [[None, None]])
+
+    def test_parse_whole_stream(self):
+        rows = []
+        parser = binary_copy.BinaryCopyParser(self.decoders, rows.extend)
+        parser.write(self.stream)
+
+        self.assertTrue(parser.finished)
+        self.assertEqual([[idx, f'row {idx}'] for idx in range(5)] + [[None, None]], rows)
+
+    def test_parse_stream_split_at_every_byte(self):
+        rows = []
+        parser = binary_copy.BinaryCopyParser(self.decoders, rows.extend)
+        for idx in range(len(self.stream)):
+            parser.write(self.stream[idx:idx + 1])
+
+        self.assertTrue(parser.finished)
+        self.assertEqual([[idx, f'row {idx}'] for idx in range(5)] + [[None, None]], rows)
+
+    def test_invalid_signature(self):
+        parser = binary_copy.BinaryCopyParser(self.decoders, lambda rows: None)
+        with self.assertRaises(binary_copy.BinaryCopyError):
+            parser.write(b'PGCOPY\n\xff\r\n\x01' + bytes(8))
+
+    def test_field_count_mismatch(self):
+        parser = binary_copy.BinaryCopyParser(self.decoders, lambda rows: None)
+        with self.assertRaises(binary_copy.BinaryCopyError):
+            parser.write(copy_stream([[struct.pack('!i', 1)]]))
+
+
+class TestCopyRows(TestCase):
+    """Test Cases for streaming rows out of COPY"""
+
+    def test_copy_rows(self):
+        decoders = binary_copy.column_decoders(['bigint'], 'utf-8')
+        stream = copy_stream([[struct.pack('!q', idx)] for idx in range(2500)])
+        conn = MagicMock()
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.copy_expert.side_effect = lambda sql, file: [file.write(stream[i:i + 100])
+                                                            for i in range(0, len(stream), 100)]
+
+        rows = list(binary_copy.copy_rows(conn, 'SELECT "id" FROM "public"."foo";', decoders))
+
+        self.assertEqual([[idx] for idx in range(2500)], rows)
+        self.assertEqual('COPY (SELECT "id" FROM "public"."foo") TO STDOUT (FORMAT binary)',
+                         cursor.copy_expert.call_args[0][0])
+
+    def test_copy_rows_raises_copy_errors(self):
+        conn = MagicMock()
+        conn.cursor.return_value.__enter__.return_value.copy_expert.side_effect = ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            list(binary_copy.copy_rows(conn, 'SELECT 1', binary_copy.column_decoders(['integer'], 'utf-8')))
+
+    def test_copy_rows_stops_copy_when_not_consumed(self):
+        decoders = binary_copy.column_decoders(['bigint'], 'utf-8')
+        stream = copy_stream([[struct.pack('!q', idx)] for idx in range(100000)])
+        conn = MagicMock()
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.copy_expert.side_effect = lambda sql, file: [file.write(stream[i:i + 100])
+                                                            for i in range(0, len(stream), 100)]
+
+        rows = binary_copy.copy_rows(conn, 'SELECT 1', decoders)
+        self.assertEqual([0], next(rows))
+        rows.close()
@@ -0,0 +1,104 @@
+import json
+import os
+import tempfile
+import unittest
+
+from select import select
+
+from tap_postgres.sync_strategies import committed_lsn
+
+
+class TestCommittedLsnReader(unittest.TestCase):
+    """Test Cases for reading the committed lsn from the state file"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.state_file = os.path.join(self.tmp_dir.name, 'state.json')
+        self.reader = committed_lsn.CommittedLsnReader(self.state_file, ['public-a', 'public-b'], 10, 0.01)
+
+    def tearDown(self):
+        self.reader.stop()
+        self.tmp_dir.cleanup()
+
+    def write_state(self, lsn_a, lsn_b):
+        with open(self.state_file, 'w', encoding='utf-8') as state_file:
+            json.dump({'bookmarks': {'public-a': {'lsn': lsn_a}, 'public-b': {'lsn': lsn_b}}}, state_file)
+
+    def readable(self):
+        return self.reader in select([self.reader], [], [], 0)[0]
+
+    def test_read_state_file(self):
+        self.reader.read_state_file()
+        self.assertEqual(10, self.reader.lsn_comitted)
+        self.assertFalse(self.readable())
+
+        self.write_state(30, 20)
+        self.reader.read_state_file()
+        self.assertTrue(self.readable())
+        self.assertEqual(20, self.reader.acknowledge())
+        self.assertFalse(self.readable())
+
+        # the committed lsn never moves back
+        self.write_state(15, 20)
+        self.reader.read_state_file()
+        self.assertFalse(self.readable())
+        self.assertEqual(20, self.reader.lsn_comitted)
+
+    def test_thread_wakes_up_the_replication_loop(self):
+        self.reader.start()
+        self.write_state(40, 50)
+
+        self.assertEqual([self.reader], select([self.reader], [], [], 5)[0])
+        self.assertEqual(40, self.reader.acknowledge())
+
+    def write_ack(self, lsn_text, mtime_ns):
+        with open(self.ack_file, 'w', encoding='utf-8') as ack_file:
+            ack_file.write(lsn_text)
+        os.utime(self.ack_file, ns=(mtime_ns, mtime_ns))
+
+    def test_read_ack_file_when_modified(self):
+        self.ack_file = os.path.join(self.tmp_dir.name, 'lsn.ack')
+        self.reader.ack_file = self.ack_file
+
+        # missing or unparseable files are read again
+        self.reader.read_ack_file()
+        self.write_ack('16/B3', 1000)
+        self.reader.read_ack_file()
+        self.assertEqual((0x16 << 32) + 0xB3, self.reader.acknowledge())
+
+        # a file of the same inode, modification time and size is not read
+        self.write_ack('99/B3', 1000)
+        self.reader.read_ack_file()
+        self.assertFalse(self.readable())
+
+        # a file of another size within the resolution of the modification time is read
+        self.write_ack('99999999990', 1000)
+        self.reader.read_ack_file()
+        self.assertEqual(99999999990, self.reader.acknowledge())
+
+        # and so is a file of the same size and modification time replaced by a rename
+        replacement = os.path.join(self.tmp_dir.name, 'lsn.ack.tmp')
+        with open(replacement, 'w', encoding='utf-8') as ack_file:
+            ack_file.write('99999999999')
+        os.utime(replacement, ns=(1000, 1000))
+        os.replace(replacement, self.ack_file)
+        self.reader.read_ack_file()
+        self.assertTrue(self.readable())
+        self.assertEqual(99999999999, self.reader.acknowledge())
+
+    def test_thread_watches_the_ack_file(self):
+        self.ack_file = os.path.join(self.tmp_dir.name, 'lsn.ack')
+        self.reader.ack_file = self.ack_file
+        self.write_state(40, 50)
+        self.write_ack('30', 1000)
+        self.reader.start()
+
+        # the state file is not read when the target acknowledges through the ack file
+        self.assertEqual([self.reader], select([self.reader], [], [], 5)[0])
+        self.assertEqual(30, self.reader.acknowledge())
+
+    def test_parse_lsn(self):
+        self.assertEqual(123, committed_lsn.parse_lsn('123'))
+        self.assertEqual((1 << 32) + 255, committed_lsn.parse_lsn('1/FF'))
+        with self.assertRaises(ValueError):
+            committed_lsn.parse_lsn('1/')
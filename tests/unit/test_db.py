@@ -3,6 +3,8 @@ import unittest
 
 import datetime
 
+from unittest.mock import patch
+
 from tap_postgres import db
 
 
@@ -221,3 +223,218 @@ class TestDbFunctions(unittest.TestCase):
         actual_output = db.filter_schemas_sql_clause(sql, filter_schemas)
         self.assertEqual(expected_output, actual_output)
 
+
+    def test_prepare_json_record_sql(self):
+        md_map = {('properties', 'id'): {'sql-datatype': 'integer'},
+                  ('properties', "it's"): {'sql-datatype': 'text[]'},
+                  ('properties', 'at'): {'sql-datatype': 'date'}}
+        actual_output = db.prepare_json_record_sql(['id', "it's"], md_map)
+        self.assertEqual("""json_build_object('id',  "id" , 'it''s', COALESCE(to_json( "it's" ), '[]'::json))::text""",
+                         actual_output)
+        self.assertIn("to_char( \"at\" , 'YYYY-MM-DD')", db.prepare_json_record_sql(['at'], md_map))
+
+    def test_prepare_json_record_sql_merges_objects_of_wide_tables(self):
+        columns = [f'c{idx}' for idx in range(db.JSON_OBJECT_MAX_COLUMNS + 1)]
+        md_map = {('properties', c): {'sql-datatype': 'bigint'} for c in columns}
+        actual_output = db.prepare_json_record_sql(columns, md_map)
+        self.assertEqual(2, actual_output.count('json_build_object('))
+        self.assertTrue(actual_output.endswith(f"""::jsonb || json_build_object('c50',  "c50" )::jsonb)::text"""))
+
+    def test_prepare_select_list_sql_falls_back_to_columns(self):
+        conn_info = {'extraction_engine': db.EXTRACTION_ENGINE_COPY_JSON}
+        md_map = {('properties', 'id'): {'sql-datatype': 'integer'},
+                  ('properties', 'ts'): {'sql-datatype': 'timestamp without time zone[]'}}
+        self.assertTrue(db.uses_json_records(['id'], md_map, conn_info))
+        self.assertFalse(db.uses_json_records(['id'], md_map, {}))
+        self.assertFalse(db.uses_json_records(['id', 'ts'], md_map, conn_info))
+        self.assertEqual([' "id" ', ' "ts" '], db.prepare_select_list_sql(['id', 'ts'], md_map, conn_info))
+        self.assertEqual([db.prepare_json_record_sql(['id'], md_map)],
+                         db.prepare_select_list_sql(['id'], md_map, conn_info))
+
+    def test_json_record_envelope(self):
+        md_map = {(): {'schema-name': 'public'}}
+        time_extracted = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        before, after = db.json_record_envelope({'stream': 'foo'}, 1, time_extracted, md_map)
+        self.assertEqual('{"type": "RECORD", "stream": "public-foo", "record": {"id": 1}, "version": 1, '
+                         '"time_extracted": "2020-01-01T00:00:00.000000Z"}',
+                         before + '{"id": 1}' + after)
+
+    def test_value_converter(self):
+        """Test if value converters return what selected_value_to_singer_value returns"""
+        test_values = [('integer', 5), ('integer', None), ('text', 'foo'), ('boolean', False),
+                       ('numeric', decimal.Decimal('1.50')), ('numeric', decimal.Decimal('nan')),
+                       ('double precision', float('inf')), ('real', 1.5), ('json', '{"foo": 1}'), ('jsonb', None),
+                       ('date', datetime.date(2022, 11, 11)),
+                       ('timestamp without time zone', datetime.datetime(2022, 11, 11, 1, 2, 3, 4)),
+                       ('timestamp with time zone', datetime.datetime(2022, 11, 11, tzinfo=datetime.timezone.utc)),
+                       ('time without time zone', '24:00:00'), ('bit', '1'), ('hstore', {'foo': 'bar'}),
+                       ('integer[]', [[1, None], [3, 4]]), ('date[]', [datetime.date(2022, 11, 11)]),
+                       ('text[]', None)]
+        for sql_datatype, elem in test_values:
+            self.assertEqual(db.selected_value_to_singer_value(elem, sql_datatype),
+                             db.value_converter(sql_datatype)(elem))
+
+    def test_selected_row_to_singer_message_with_converters(self):
+        md_map = {(): {'schema-name': 'public'},
+                  ('properties', 'id'): {'sql-datatype': 'integer'},
+                  ('properties', 'tags'): {'sql-datatype': 'text[]'}}
+        converters = db.row_converters(['id', 'tags'], md_map)
+        message = db.selected_row_to_singer_message({'stream': 'foo'}, [1, None], 2, ['id', 'tags'], None, md_map,
+                                                    converters)
+        self.assertEqual({'id': 1, 'tags': []}, message.record)
+        self.assertEqual('public-foo', message.stream)
+
+
+class TestSessionInfo(unittest.TestCase):
+    """Test Cases for the per database session info cache"""
+
+    TYPES_JSON = '[["integer", "int4", 23, 1007, "b"], ["hstore", "hstore", 16400, 16405, "b"], ' \
+                 '["uuid", "uuid", 2950, 2951, "b"], ["mood", "mood", 16500, 16499, "e"], ' \
+                 '["bit", "bit", 1560, 1561, "b"], ["time with time zone", "timetz", 1266, 1270, "b"]]'
+
+    def setUp(self) -> None:
+        db._SESSION_INFO.clear()
+        self.conn_info = {'host': 'foo', 'port': 5432, 'dbname': 'session_db', 'user': 'foo', 'use_secondary': False}
+
+    def tearDown(self) -> None:
+        db._SESSION_INFO.clear()
+
+    @patch('tap_postgres.db.open_connection')
+    def test_session_info_is_fetched_once_per_database(self, mocked_open_connection):
+        cursor = mocked_open_connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = ('UTF8', 'UTF8', True, self.TYPES_JSON)
+
+        info = db.session_info(self.conn_info)
+        self.assertIs(info, db.session_info(self.conn_info, ['integer', 'mood', 'bit(3)', 'time(3) with time zone']))
+        self.assertEqual(1, cursor.execute.call_count)
+
+        self.assertTrue(info['hstore_available'])
+        self.assertEqual((16400, 16405), info['hstore_oids'])
+        self.assertEqual({'bit': 1561, 'uuid': 2951}, info['string_array_oids'])
+        self.assertEqual([16499], info['enum_array_oids'])
+
+        # a type created after the info was cached
+        db.session_info(self.conn_info, ['integer', 'colour'])
+        self.assertEqual(2, cursor.execute.call_count)
+
+        db.session_info(dict(self.conn_info, dbname='other_db'))
+        self.assertEqual(3, cursor.execute.call_count)
+
+    @patch('psycopg2.extras.register_hstore')
+    @patch('tap_postgres.db.open_connection')
+    def test_register_hstore_with_cached_oids(self, mocked_open_connection, mocked_register_hstore):
+        cursor = mocked_open_connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = ('UTF8', 'UTF8', True, self.TYPES_JSON)
+
+        db.register_hstore('conn', self.conn_info)
+        mocked_register_hstore.assert_called_once_with('conn', oid=16400, array_oid=16405)
+
+
+class FakeConnection:
+    """Stands in for a psycopg2 connection in the connection pool tests"""
+
+    def __init__(self, healthy=True):
+        self.closed = 0
+        self.healthy = healthy
+        self.executed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def get_transaction_status(self):
+        return db.psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        conn = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+            def execute(self, sql):
+                if not conn.healthy:
+                    raise db.psycopg2.OperationalError('server closed the connection unexpectedly')
+                conn.executed.append(sql)
+
+        return Cursor()
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class TestConnectionPool(unittest.TestCase):
+    """Test Cases for the connection pool"""
+
+    def setUp(self) -> None:
+        self.conn_config = {'host': 'foo', 'port': 5432, 'dbname': 'foo_db', 'user': 'foo', 'use_secondary': True,
+                            'secondary_host': 'foo-replica'}
+        self.pool = db.ConnectionPool(idle_timeout=300, health_check_interval=30, max_idle_connections=1)
+
+    @patch('tap_postgres.db.open_connection')
+    def test_connections_are_reused_per_database_and_role(self, mocked_open_connection):
+        mocked_open_connection.side_effect = lambda *args, **kwargs: FakeConnection()
+
+        conn = self.pool.get(self.conn_config)
+        self.pool.put(conn, self.conn_config)
+        self.assertIs(conn, self.pool.get(self.conn_config))
+
+        primary_conn = self.pool.get(self.conn_config, prioritize_primary=True)
+        self.assertIsNot(conn, primary_conn)
+        self.assertEqual(2, mocked_open_connection.call_count)
+
+        # the pool keeps at most one idle connection per key
+        other_conn = self.pool.get(self.conn_config)
+        self.pool.put(conn, self.conn_config)
+        self.pool.put(other_conn, self.conn_config)
+        self.assertEqual(1, other_conn.closed)
+        self.assertEqual(0, conn.closed)
+
+    @patch('tap_postgres.db.time.monotonic')
+    @patch('tap_postgres.db.open_connection')
+    def test_idle_timeout_and_health_check(self, mocked_open_connection, mocked_monotonic):
+        mocked_open_connection.side_effect = lambda *args, **kwargs: FakeConnection()
+        mocked_monotonic.return_value = 1000
+
+        conn = self.pool.get(self.conn_config)
+        self.pool.put(conn, self.conn_config)
+        mocked_monotonic.return_value = 1010
+        self.assertIs(conn, self.pool.get(self.conn_config))
+        self.assertEqual([], conn.executed)
+
+        # checked after being idle for longer than the health check interval
+        self.pool.put(conn, self.conn_config)
+        mocked_monotonic.return_value = 1100
+        self.assertIs(conn, self.pool.get(self.conn_config))
+        self.assertEqual(['SELECT 1'], conn.executed)
+
+        # discarded when the check fails
+        self.pool.put(conn, self.conn_config)
+        conn.healthy = False
+        mocked_monotonic.return_value = 1200
+        self.assertIsNot(conn, self.pool.get(self.conn_config))
+        self.assertEqual(1, conn.closed)
+
+        # closed when idle for longer than the idle timeout
+        other_conn = self.pool.get(self.conn_config)
+        self.pool.put(other_conn, self.conn_config)
+        mocked_monotonic.return_value = 1600
+        self.pool.get(self.conn_config)
+        self.assertEqual(1, other_conn.closed)
+
+    @patch('tap_postgres.db.open_connection')
+    def test_closed_connections_are_not_returned_to_the_pool(self, mocked_open_connection):
+        mocked_open_connection.side_effect = lambda *args, **kwargs: FakeConnection()
+
+        conn = self.pool.get(self.conn_config)
+        conn.close()
+        self.pool.put(conn, self.conn_config)
+        self.assertIsNot(conn, self.pool.get(self.conn_config))
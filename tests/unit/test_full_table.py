@@ -1,6 +1,9 @@
 from unittest import TestCase
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
+import singer
+
+from tap_postgres.sync_strategies import full_table
 from tap_postgres.sync_strategies.full_table import sync_view
 
 from tests.utils import MockedConnect
@@ -56,3 +59,291 @@ class TestFullTable(TestCase):
             mocked_time.return_value = mocked_time_value
             actual_output = sync_view(self.conn_config, stream, state, desired_columns, md_map)
             self.assertEqual(expected_output_without_version, actual_output)
+
+
+class TestFullTableChunks(TestCase):
+    """Test Cases for chunked full_table syncs"""
+
+    def setUp(self) -> None:
+        self.md_map = {(): {'schema-name': 'public', 'table-key-properties': ['id']},
+                       ('properties', 'id'): {'sql-datatype': 'integer'},
+                       ('properties', 'name'): {'sql-datatype': 'text'}}
+
+    @staticmethod
+    def _cursor(server_version, *fetchone_values):
+        cursor = MagicMock()
+        cursor.connection.server_version = server_version
+        cursor.fetchone.side_effect = list(fetchone_values)
+        return cursor
+
+    def test_is_interrupted(self):
+        """Test if an xmin or chunks bookmark marks the full table sync as interrupted"""
+        self.assertFalse(full_table.is_interrupted({}, 'foo-bar'))
+        self.assertFalse(full_table.is_interrupted({'bookmarks': {'foo-bar': {'xmin': None, 'chunks': None}}},
+                                                   'foo-bar'))
+        self.assertTrue(full_table.is_interrupted({'bookmarks': {'foo-bar': {'xmin': 123}}}, 'foo-bar'))
+        self.assertTrue(full_table.is_interrupted({'bookmarks': {'foo-bar': {'chunks': {'done': []}}}}, 'foo-bar'))
+
+    def test_plan_chunks_small_table_is_not_split(self):
+        """Test if tables smaller than a chunk are not split"""
+        cursor = self._cursor(140000, (10, 100))
+        self.assertIsNone(full_table.plan_chunks(cursor, {'full_table_chunk_size': 1000}, '"public"."foo"',
+                                                 self.md_map))
+
+    def test_plan_chunks_by_ctid(self):
+        """Test if tables are split into page ranges on PostgreSQL 14+"""
+        cursor = self._cursor(140005, (100, 3000))
+        chunks = full_table.plan_chunks(cursor, {'full_table_chunk_size': 1000}, '"public"."foo"', self.md_map)
+        self.assertEqual({'kind': 'ctid', 'column': None, 'bounds': [0, 34, 68, None], 'done': []}, chunks)
+
+    def test_plan_chunks_by_primary_key(self):
+        """Test if tables are split into primary key ranges before PostgreSQL 14"""
+        cursor = self._cursor(130010, (100, 3000), (1, 3000))
+        chunks = full_table.plan_chunks(cursor, {'full_table_chunk_size': 1000}, '"public"."foo"', self.md_map)
+        self.assertEqual({'kind': 'pk', 'column': 'id', 'bounds': [None, 1001, 2001, None], 'done': []}, chunks)
+
+    def test_plan_chunks_without_integer_primary_key(self):
+        """Test if tables without a single integer primary key are not split before PostgreSQL 14"""
+        self.md_map[('properties', 'id')]['sql-datatype'] = 'uuid'
+        cursor = self._cursor(130010, (100, 3000))
+        self.assertIsNone(full_table.plan_chunks(cursor, {'full_table_chunk_size': 1000}, '"public"."foo"',
+                                                 self.md_map))
+
+    def test_chunk_where_clause(self):
+        """Test if the WHERE clause of every chunk covers its range"""
+        ctid_chunks = {'kind': 'ctid', 'column': None, 'bounds': [0, 34, None], 'done': []}
+        self.assertEqual("WHERE ctid >= '(0,0)'::tid AND ctid < '(34,0)'::tid",
+                         full_table.chunk_where_clause(ctid_chunks, 0))
+        self.assertEqual("WHERE ctid >= '(34,0)'::tid", full_table.chunk_where_clause(ctid_chunks, 1))
+
+        pk_chunks = {'kind': 'pk', 'column': 'id', 'bounds': [None, 1001, None], 'done': []}
+        self.assertEqual('WHERE  "id"  < 1001', full_table.chunk_where_clause(pk_chunks, 0))
+        self.assertEqual('WHERE  "id"  >= 1001', full_table.chunk_where_clause(pk_chunks, 1))
+
+    @patch('tap_postgres.sync_strategies.full_table._sync_chunk')
+    @patch('tap_postgres.sync_strategies.full_table.sync_common.write_message')
+    @patch('psycopg2.connect')
+    def test_sync_table_chunks_resumes_pending_chunks_only(self, mocked_connect, _, mocked_sync_chunk):
+        """Test if only the chunks not done yet are read when resuming"""
+        mocked_connect.return_value.cursor.return_value.__enter__.return_value.fetchone.return_value = ['snap-1']
+        mocked_sync_chunk.return_value = 5
+        chunks = {'kind': 'pk', 'column': 'id', 'bounds': [None, 10, 20, None], 'done': [1]}
+        state = {'bookmarks': {'foo-bar': {'version': 1, 'chunks': chunks}}}
+        stream = {'tap_stream_id': 'foo-bar', 'stream': 'foo', 'table_name': 'foo'}
+        conn_config = {'host': 'foo', 'dbname': 'foo_db', 'user': 'foo_user', 'password': 'foo_pass',
+                       'port': 12345, 'use_secondary': False, 'full_table_workers': 2}
+
+        new_state = full_table.sync_table_chunks(conn_config, stream, state, ['id'], self.md_map,
+                                                 {'version': 1, 'time_extracted': None, 'hstore_available': False})
+
+        self.assertEqual([0, 1, 2], sorted(new_state['bookmarks']['foo-bar']['chunks']['done']))
+        self.assertEqual([0, 2], sorted(call.args[-1] for call in mocked_sync_chunk.call_args_list))
+
+    @patch('tap_postgres.sync_strategies.full_table.sync_table_in_pages', side_effect=lambda *args: args[2])
+    @patch('tap_postgres.sync_strategies.full_table.sync_table_chunks')
+    @patch('tap_postgres.sync_strategies.full_table.post_db.hstore_available', return_value=False)
+    @patch('tap_postgres.sync_strategies.full_table.sync_common.write_message')
+    def test_interrupted_ctid_chunks_start_over(self, mocked_write_message, _, mocked_sync_table_chunks,
+                                                mocked_sync_table_in_pages):
+        """Test if the chunks bookmark of ctid chunks is discarded and a new table version is taken"""
+        chunks = {'kind': 'ctid', 'column': None, 'bounds': [0, 10, 20, None], 'done': [1]}
+        state = {'bookmarks': {'foo-bar': {'version': 1, 'chunks': chunks}}}
+        stream = {'tap_stream_id': 'foo-bar', 'stream': 'foo', 'table_name': 'foo'}
+
+        state = full_table.sync_table({'full_table_workers': 1}, stream, state, ['id'], self.md_map)
+
+        mocked_sync_table_chunks.assert_not_called()
+        mocked_sync_table_in_pages.assert_called_once()
+        self.assertIsNone(state['bookmarks']['foo-bar']['chunks'])
+        self.assertNotEqual(1, state['bookmarks']['foo-bar']['version'])
+        activate_versions = [c[0][0].version for c in mocked_write_message.call_args_list
+                             if isinstance(c[0][0], singer.ActivateVersionMessage)]
+        self.assertEqual([state['bookmarks']['foo-bar']['version']], activate_versions)
+
+
+class TestFullTablePages(TestCase):
+    """Test Cases for full_table syncs reading one page per transaction"""
+
+    def setUp(self) -> None:
+        self.stream = {'tap_stream_id': 'foo-bar', 'stream': 'foo', 'table_name': 'foo'}
+        self.md_map = {(): {'schema-name': 'public', 'table-key-properties': ['id']},
+                       ('properties', 'id'): {'sql-datatype': 'integer'},
+                       ('properties', 'name'): {'sql-datatype': 'text'}}
+        self.sync_info = {'version': 1, 'time_extracted': None, 'counter': MagicMock(), 'conn_info': {}}
+        self.original_itersize = full_table.post_db.CURSOR_ITER_SIZE
+        full_table.post_db.CURSOR_ITER_SIZE = 2
+
+    def tearDown(self) -> None:
+        full_table.post_db.CURSOR_ITER_SIZE = self.original_itersize
+
+    @patch('tap_postgres.sync_strategies.full_table.singer.write_message')
+    def test_sync_table_by_keyset(self, mocked_write_message):
+        """Test if pages seek past the last primary key of the previous page and the bookmark follows"""
+        conn = MagicMock()
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.mogrify.side_effect = lambda sql, params: sql.replace('%s', f"'{params[0]}'").encode()
+        cursor.__iter__.side_effect = [iter([[1, 'a', '1'], [2, 'b', '2']]), iter([[3, 'c', '3']])]
+        state = {'bookmarks': {'foo-bar': {'version': 1}}}
+
+        state = full_table.sync_table_by_keyset(conn, self.stream, state, ['id', 'name'], self.md_map,
+                                                self.sync_info)
+
+        self.assertIsNone(state['bookmarks']['foo-bar']['pk_keyset'])
+        second_select = cursor.execute.call_args_list[-1][0][0]
+        self.assertIn("""WHERE ( "id" ) > ('2')""", second_select)
+        self.assertIn('ORDER BY  "id"', second_select)
+
+        records = [c[0][0].record for c in mocked_write_message.call_args_list if hasattr(c[0][0], 'record')]
+        self.assertEqual([{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b'}, {'id': 3, 'name': 'c'}], records)
+
+        states = [c[0][0].value for c in mocked_write_message.call_args_list if hasattr(c[0][0], 'value')]
+        self.assertEqual(['2'], states[0]['bookmarks']['foo-bar']['pk_keyset'])
+
+    @patch('tap_postgres.sync_strategies.full_table.sync_common.write_json_record')
+    @patch('tap_postgres.sync_strategies.full_table.post_db.fetch_rows')
+    @patch('tap_postgres.sync_strategies.full_table.singer.write_message')
+    def test_sync_table_by_keyset_with_json_records(self, mocked_write_message, mocked_fetch_rows,
+                                                    mocked_write_json_record):
+        """Test if records built by postgres are written as they are and the bookmark follows the extra columns"""
+        conn = MagicMock()
+        conn.cursor.return_value.__enter__.return_value.mogrify.return_value = b"'2'"
+        mocked_fetch_rows.side_effect = [iter([['{"id": 1}', '1'], ['{"id": 2}', '2']]), iter([])]
+        state = {'bookmarks': {'foo-bar': {'version': 1}}}
+        sync_info = dict(self.sync_info, conn_info={'extraction_engine': 'copy_json'})
+
+        full_table.sync_table_by_keyset(conn, self.stream, state, ['id', 'name'], self.md_map, sync_info)
+
+        self.assertTrue(mocked_fetch_rows.call_args_list[0][0][2].startswith(
+            """SELECT json_build_object('id',  "id" , 'name',  "name" )::text,  "id" ::text"""))
+        self.assertEqual(['{"id": 1}', '{"id": 2}'], [c[0][1] for c in mocked_write_json_record.call_args_list])
+        states = [c[0][0].value for c in mocked_write_message.call_args_list if hasattr(c[0][0], 'value')]
+        self.assertEqual(['2'], states[0]['bookmarks']['foo-bar']['pk_keyset'])
+
+    @patch('tap_postgres.sync_strategies.full_table.singer.write_message')
+    def test_sync_table_by_ctid_reads_every_range_in_one_snapshot(self, mocked_write_message):
+        """Test if page ranges are read in one repeatable read transaction and a ctid_page bookmark is ignored"""
+        conn = MagicMock()
+        conn.cursor.return_value.__enter__.return_value.fetchone.return_value = (10, 10)
+        conn.cursor.return_value.__enter__.return_value.__iter__.return_value = iter([])
+        state = {'bookmarks': {'foo-bar': {'version': 1, 'ctid_page': 6}}}
+        conn.commit.reset_mock()
+
+        state = full_table.sync_table_by_ctid(conn, self.stream, state, ['id', 'name'], self.md_map,
+                                              self.sync_info)
+
+        statements = [c[0][0] for c in conn.cursor.return_value.__enter__.return_value.execute.call_args_list[1:]]
+        self.assertEqual(["SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY",
+                          "SELECT  \"id\" , \"name\"  FROM \"public\".\"foo\" "
+                          "WHERE ctid >= '(0,0)'::tid AND ctid < '(2,0)'::tid"],
+                         statements[:2])
+        self.assertEqual("SELECT  \"id\" , \"name\"  FROM \"public\".\"foo\" WHERE ctid >= '(8,0)'::tid",
+                         statements[-1])
+        self.assertEqual(6, len(statements))
+        # the size query and the snapshot
+        self.assertEqual(2, conn.commit.call_count)
+        self.assertFalse([c for c in mocked_write_message.call_args_list if hasattr(c[0][0], 'value')])
+        self.assertIsNone(state['bookmarks']['foo-bar']['ctid_page'])
+
+
+class TestFetchTableStats(TestCase):
+    """Test Cases for reading the modification statistics of full table streams"""
+
+    @patch('tap_postgres.sync_strategies.full_table.post_db.pooled_connection')
+    def test_fetch_table_stats(self, mocked_pooled_connection):
+        cursor = mocked_pooled_connection.return_value.__enter__.return_value.cursor.return_value.__enter__. \
+            return_value
+        cursor.fetchall.return_value = [('public', 'lookup', 16390, 10, 2, 0, '2022-11-01 00:00:00+00'),
+                                        ('public', 'not_selected', 16400, 1, 0, 0, '2022-11-01 00:00:00+00')]
+        streams = [{'tap_stream_id': 'public-lookup', 'table_name': 'lookup', 'metadata': [
+            {'breadcrumb': [], 'metadata': {'database-name': 'foo_db', 'schema-name': 'public'}}]}]
+
+        self.assertEqual({'public-lookup': {'relfilenode': 16390, 'n_tup_ins': 10, 'n_tup_upd': 2, 'n_tup_del': 0,
+                                            'stats_reset': '2022-11-01 00:00:00+00'}},
+                         full_table.fetch_table_stats({'dbname': 'postgres'}, streams))
+        self.assertEqual('foo_db', mocked_pooled_connection.call_args[0][0]['dbname'])
+
+
+class TestChecksums(TestCase):
+    """Test Cases for re-reading the chunks of full table streams whose checksum changed"""
+
+    def setUp(self) -> None:
+        self.stream = {'tap_stream_id': 'public-lookup', 'stream': 'lookup', 'table_name': 'lookup'}
+        self.md_map = {(): {'schema-name': 'public', 'table-key-properties': ['id']},
+                       ('properties', 'id'): {'sql-datatype': 'integer'}}
+        self.cursor = MagicMock()
+        self.cursor.mogrify.side_effect = lambda sql, values: ','.join(f"'{v}'" for v in values).encode()
+
+    def test_checksum_where_clause(self):
+        self.assertEqual('', full_table.checksum_where_clause(self.cursor, ['"a"', '"b"'], None, None))
+        self.assertEqual('WHERE ("a","b") >= (\'1\',\'x\') AND ("a","b") < (\'2\',\'y\')',
+                         full_table.checksum_where_clause(self.cursor, ['"a"', '"b"'], ['1', 'x'], ['2', 'y']))
+
+    @patch('tap_postgres.sync_strategies.full_table.sync_common.write_message')
+    @patch('tap_postgres.sync_strategies.full_table.post_db.hstore_available', return_value=False)
+    @patch('tap_postgres.sync_strategies.full_table.post_db.fetch_rows')
+    @patch('tap_postgres.sync_strategies.full_table.post_db.pooled_connection')
+    def test_only_changed_chunks_are_read_and_split(self, mocked_pooled_connection, mocked_fetch_rows, _,
+                                                    mocked_write_message):
+        mocked_pooled_connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value = \
+            self.cursor
+        # no rows were deleted, the first chunk is unchanged, the second changed and grew into two chunks
+        self.cursor.fetchone.side_effect = [(3,), ('aaaa',), ('cccc',)]
+        self.cursor.fetchall.return_value = [('100', 'dddd', 10000), ('150', 'eeee', 1)]
+        mocked_fetch_rows.return_value = iter([[100], [150]])
+        state = {'bookmarks': {'public-lookup': {'version': 1, 'checksums': {'bounds': [None, ['100'], None],
+                                                                             'hashes': ['aaaa', 'bbbb'],
+                                                                             'rows': [10000, 10000],
+                                                                             'n_tup_del': 3}}}}
+
+        state = full_table.sync_table({'full_table_checksums': True}, self.stream, state, ['id'], self.md_map)
+
+        self.assertEqual({'bounds': [None, ['100'], ['150'], None], 'hashes': ['aaaa', 'dddd', 'eeee'],
+                          'rows': [10000, 10000, 1], 'n_tup_del': 3},
+                         state['bookmarks']['public-lookup']['checksums'])
+        self.assertEqual(1, mocked_fetch_rows.call_count)
+        self.assertIn('WHERE ( "id" ) >= (\'100\')', mocked_fetch_rows.call_args[0][2])
+        records = [c[0][0] for c in mocked_write_message.call_args_list if isinstance(c[0][0], singer.RecordMessage)]
+        self.assertEqual([({'id': 100}, 1), ({'id': 150}, 1)], [(r.record, r.version) for r in records])
+
+    @patch('tap_postgres.sync_strategies.full_table.post_db.hstore_available', return_value=False)
+    @patch('tap_postgres.sync_strategies.full_table.post_db.fetch_rows')
+    @patch('tap_postgres.sync_strategies.full_table.post_db.pooled_connection')
+    def test_deleted_rows_fall_back_to_a_full_sync(self, mocked_pooled_connection, mocked_fetch_rows, _):
+        mocked_pooled_connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value = \
+            self.cursor
+        checksums = {'bounds': [None, ['100'], None], 'hashes': ['aaaa', 'bbbb'], 'rows': [10000, 10000],
+                     'n_tup_del': 3}
+        state = {'bookmarks': {'public-lookup': {'version': 1, 'checksums': checksums}}}
+
+        # the deleted rows counter moved
+        self.cursor.fetchone.side_effect = [(4,)]
+        self.assertIsNone(full_table.sync_table_checksums({}, self.stream, state, ['id'], self.md_map))
+
+        # a changed chunk shrank
+        self.cursor.fetchone.side_effect = [(3,), ('aaaa',), ('cccc',)]
+        self.cursor.fetchall.return_value = [('100', 'dddd', 9999)]
+        self.assertIsNone(full_table.sync_table_checksums({}, self.stream, state, ['id'], self.md_map))
+
+        # checksums of an earlier version of the tap
+        self.cursor.fetchone.side_effect = [(3,)]
+        state['bookmarks']['public-lookup']['checksums'] = {'bounds': [None, None], 'hashes': ['aaaa']}
+        self.assertIsNone(full_table.sync_table_checksums({}, self.stream, state, ['id'], self.md_map))
+
+        mocked_fetch_rows.assert_not_called()
+
+    @patch('tap_postgres.sync_strategies.full_table.sync_table_in_pages', side_effect=lambda *args: args[2])
+    @patch('tap_postgres.sync_strategies.full_table.sync_table_checksums')
+    @patch('tap_postgres.sync_strategies.full_table.post_db.hstore_available', return_value=False)
+    @patch('tap_postgres.sync_strategies.full_table.sync_common.write_message')
+    def test_checksums_are_not_used_on_secondary(self, _, __, mocked_sync_table_checksums,
+                                                 mocked_sync_table_in_pages):
+        state = {'bookmarks': {'public-lookup': {'version': 1, 'checksums': {'bounds': [None, None],
+                                                                             'hashes': ['aaaa'], 'rows': [1],
+                                                                             'n_tup_del': 0}}}}
+
+        state = full_table.sync_table({'full_table_checksums': True, 'use_secondary': True}, self.stream, state,
+                                      ['id'], self.md_map)
+
+        mocked_sync_table_checksums.assert_not_called()
+        mocked_sync_table_in_pages.assert_called_once()
+        self.assertNotIn('checksums', state['bookmarks']['public-lookup'])
@@ -1,10 +1,14 @@
+import datetime
+import threading
+
 from unittest import TestCase
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 import singer
 
 from tests.utils import MockedConnect
 
+import tap_postgres.db as post_db
 from tap_postgres.sync_strategies import incremental
 
 
@@ -17,10 +21,13 @@ class TestIncremental(TestCase):
         cls.patcher = patch('psycopg2.connect')
         mocked_connect = cls.patcher.start()
         mocked_connect.return_value.__enter__.return_value = MockedConnect()
+        cls.session_info_patcher = patch('tap_postgres.db.session_info')
+        cls.session_info_patcher.start().return_value = {'hstore_available': True, 'hstore_oids': (16400, 16405)}
 
     @classmethod
     def tearDownClass(cls) -> None:
         cls.patcher.stop()
+        cls.session_info_patcher.stop()
 
     def setUp(self) -> None:
         self.conn_config = {
@@ -97,3 +104,223 @@ class TestIncremental(TestCase):
                          )
         incremental.UPDATE_BOOKMARK_PERIOD = original_update_bookmark_period
         mocked_singer_write.assert_called_with(singer.StateMessage(value=self.state))
+
+
+class TestIncrementalBackfill(TestCase):
+    """Test Cases for backfilling incremental streams by replication key windows"""
+
+    def test_split_replication_key_range(self):
+        self.assertEqual([0, 25, 50, 75, 100], incremental.split_replication_key_range(0, 100, 4))
+        self.assertEqual([0, 1, 2, 3], incremental.split_replication_key_range(0, 3, 8))
+        self.assertEqual([7, 7], incremental.split_replication_key_range(7, 7, 4))
+        self.assertEqual([datetime.date(2022, 1, 1), datetime.date(2022, 1, 16), datetime.date(2022, 1, 31)],
+                         incremental.split_replication_key_range(datetime.date(2022, 1, 1),
+                                                                 datetime.date(2022, 1, 31), 2))
+        self.assertEqual([datetime.datetime(2022, 1, 1), datetime.datetime(2022, 1, 1, 12),
+                          datetime.datetime(2022, 1, 2)],
+                         incremental.split_replication_key_range(datetime.datetime(2022, 1, 1),
+                                                                 datetime.datetime(2022, 1, 2), 2))
+        self.assertIsNone(incremental.split_replication_key_range('a', 'z', 4))
+        self.assertIsNone(incremental.split_replication_key_range(False, True, 4))
+
+    def test_window_where_clause(self):
+        windows = {'bounds': [0, 50, 100], 'done': []}
+        self.assertEqual('WHERE ( "id"  >= \'0\'::integer AND  "id"  < \'50\'::integer) OR  "id"  IS NULL',
+                         incremental.window_where_clause(windows, 0, 'id', 'integer'))
+        self.assertEqual('WHERE  "id"  >= \'50\'::integer AND  "id"  <= \'100\'::integer',
+                         incremental.window_where_clause(windows, 1, 'id', 'integer'))
+
+    @patch('tap_postgres.sync_strategies.incremental.sync_common.write_message')
+    @patch('tap_postgres.sync_strategies.incremental._sync_window')
+    def test_bookmark_moves_up_to_the_highest_contiguous_window(self, mocked_sync_window, mocked_write_message):
+        finish_order = [2, 0, 1]
+        bookmarked = threading.Condition()
+
+        def write_message(message):
+            with bookmarked:
+                bookmarked.notify_all()
+
+        def sync_window(*args):
+            # every window finishes once the one before it in finish_order has been bookmarked
+            with bookmarked:
+                bookmarked.wait_for(lambda: mocked_write_message.call_count >= finish_order.index(args[-1]), 10)
+            return 10
+
+        mocked_write_message.side_effect = write_message
+
+        mocked_sync_window.side_effect = sync_window
+        windows = {'bounds': [0, 50, 100, 150], 'done': []}
+        state = {'bookmarks': {'public-events': {'version': 1}}}
+
+        state = incremental.sync_table_windows({'incremental_backfill_workers': 3}, {'tap_stream_id': 'public-events'},
+                                               state, ['id'], {}, windows, {})
+
+        bookmarks = [c[0][0].value['bookmarks']['public-events'] for c in mocked_write_message.call_args_list]
+        self.assertEqual([None, 50, 150], [b.get('replication_key_value') for b in bookmarks])
+        self.assertEqual([[2], [2, 0]], [b['windows']['done'] for b in bookmarks[:2]])
+        self.assertNotIn('windows', bookmarks[2])
+        self.assertEqual({'version': 1, 'replication_key_value': 150}, state['bookmarks']['public-events'])
+
+
+class TestIncrementalKeyset(TestCase):
+    """Test Cases for reading incremental streams in pages by replication key and primary key"""
+
+    def setUp(self) -> None:
+        self.stream = {'tap_stream_id': 'public-events', 'stream': 'events', 'table_name': 'events'}
+        self.md_map = {
+            (): {'schema-name': 'public', 'replication-key': 'updated_at', 'table-key-properties': ['id']},
+            ('properties', 'updated_at'): {'sql-datatype': 'integer'},
+            ('properties', 'id'): {'sql-datatype': 'integer'}
+        }
+        self.sync_info = {'version': 1, 'time_extracted': None, 'desired_columns': ['updated_at', 'id'],
+                          'escaped_columns': ['"updated_at"', '"id"'],
+                          'converters': post_db.row_converters(['updated_at', 'id'], self.md_map),
+                          'json_envelope': None,
+                          'conn_info': {'limit': None}, 'counter': MagicMock(), 'rows_saved': 0}
+        self.conn = MagicMock()
+        self.conn.cursor.return_value.__enter__.return_value.mogrify.side_effect = \
+            lambda sql, values: ','.join(f"'{v}'" for v in values).encode()
+
+    @patch('tap_postgres.sync_strategies.incremental.sync_common.write_message')
+    @patch('tap_postgres.sync_strategies.incremental.post_db.fetch_rows')
+    @patch('tap_postgres.sync_strategies.incremental.post_db.CURSOR_ITER_SIZE', 2)
+    def test_pages_seek_past_replication_key_and_primary_key(self, mocked_fetch_rows, mocked_write_message):
+        pages = [[[10, 3, '10', '3'], [10, 4, '10', '4']], [[11, 1, '11', '1']]]
+        mocked_fetch_rows.side_effect = lambda *args, **kwargs: iter(pages.pop(0))
+        state = {'bookmarks': {'public-events': {'version': 1, 'replication_key_value': 10,
+                                                 'replication_key_pk': ['2']}}}
+
+        state = incremental.sync_table_by_keyset(self.conn, self.stream, state, self.md_map, self.sync_info)
+
+        select_sqls = [c[0][2] for c in mocked_fetch_rows.call_args_list]
+        self.assertIn('WHERE ( "updated_at" , "id" ) > (\'10\'::integer,\'2\')', select_sqls[0])
+        self.assertIn('WHERE ( "updated_at" , "id" ) > (\'10\'::integer,\'4\')', select_sqls[1])
+        self.assertIn('LIMIT 2', select_sqls[0])
+        self.assertEqual(2, self.conn.commit.call_count)
+        self.assertEqual([{'updated_at': 10, 'id': 3}, {'updated_at': 10, 'id': 4}, {'updated_at': 11, 'id': 1}],
+                         [c[0][0].record for c in mocked_write_message.call_args_list])
+        self.assertEqual({'version': 1, 'replication_key_value': '11', 'replication_key_pk': ['1']},
+                         state['bookmarks']['public-events'])
+
+    @patch('tap_postgres.sync_strategies.incremental.sync_common.write_message')
+    @patch('tap_postgres.sync_strategies.incremental.post_db.fetch_rows')
+    def test_first_sync_reads_null_replication_keys_last_within_limit(self, mocked_fetch_rows, _):
+        pages = [[[10, 1, '10', '1']], [[None, 2, None, '2']]]
+        mocked_fetch_rows.side_effect = lambda *args, **kwargs: iter(pages.pop(0))
+        self.sync_info['conn_info']['limit'] = 5
+        state = {'bookmarks': {'public-events': {'version': 1}}}
+
+        state = incremental.sync_table_by_keyset(self.conn, self.stream, state, self.md_map, self.sync_info)
+
+        select_sqls = [c[0][2] for c in mocked_fetch_rows.call_args_list]
+        self.assertIn('WHERE  "updated_at"  IS NOT NULL', select_sqls[0])
+        self.assertIn('LIMIT 5', select_sqls[0])
+        self.assertIn('WHERE  "updated_at"  IS NULL', select_sqls[1])
+        self.assertIn('LIMIT 4', select_sqls[1])
+        self.assertEqual(2, self.sync_info['rows_saved'])
+        self.assertEqual({'version': 1, 'replication_key_value': '10', 'replication_key_pk': ['1']},
+                         state['bookmarks']['public-events'])
+
+    @patch('tap_postgres.sync_strategies.incremental.sync_common.write_message')
+    @patch('tap_postgres.sync_strategies.incremental.post_db.fetch_rows')
+    def test_bookmark_without_primary_key_is_resumed_inclusively(self, mocked_fetch_rows, _):
+        mocked_fetch_rows.return_value = iter([])
+        state = {'bookmarks': {'public-events': {'version': 1, 'replication_key_value': 10}}}
+
+        incremental.sync_table_by_keyset(self.conn, self.stream, state, self.md_map, self.sync_info)
+
+        self.assertEqual(1, mocked_fetch_rows.call_count)
+        self.assertIn('WHERE  "updated_at"  >= \'10\'::integer', mocked_fetch_rows.call_args[0][2])
+
+    @patch('tap_postgres.sync_strategies.incremental.sync_common.write_message')
+    @patch('tap_postgres.sync_strategies.incremental.post_db.fetch_rows')
+    @patch('tap_postgres.sync_strategies.incremental.post_db.CURSOR_ITER_SIZE', 2)
+    def test_pages_seek_past_replication_keys_out_of_python_range(self, mocked_fetch_rows, _):
+        self.md_map[('properties', 'updated_at')] = {'sql-datatype': 'timestamp without time zone'}
+        self.sync_info['converters'] = post_db.row_converters(['updated_at', 'id'], self.md_map)
+        clamped = datetime.datetime(9999, 12, 31, 23, 59, 59, 999000)
+        pages = [[[clamped, 1, 'infinity', '1'], [clamped, 2, 'infinity', '2']],
+                 [[clamped, 3, 'infinity', '3']],
+                 []]
+        mocked_fetch_rows.side_effect = lambda *args, **kwargs: iter(pages.pop(0))
+        state = {'bookmarks': {'public-events': {'version': 1}}}
+
+        state = incremental.sync_table_by_keyset(self.conn, self.stream, state, self.md_map, self.sync_info)
+
+        select_sqls = [c[0][2] for c in mocked_fetch_rows.call_args_list]
+        self.assertIn('WHERE ( "updated_at" , "id" ) > (\'infinity\'::timestamp without time zone,\'2\')',
+                      select_sqls[1])
+        self.assertEqual({'version': 1, 'replication_key_value': 'infinity', 'replication_key_pk': ['3']},
+                         state['bookmarks']['public-events'])
+
+
+class TestFetchChangedStreams(TestCase):
+    """Test Cases for probing which incremental streams have rows past their bookmark"""
+
+    @staticmethod
+    def stream(table_name, table_pks):
+        return {'tap_stream_id': f'public-{table_name}', 'table_name': table_name, 'metadata': [
+            {'breadcrumb': [], 'metadata': {'schema-name': 'public', 'database-name': 'foo_db',
+                                            'replication-key': 'updated_at', 'table-key-properties': table_pks}},
+            {'breadcrumb': ['properties', 'updated_at'], 'metadata': {'sql-datatype': 'integer'}}]}
+
+    @patch('tap_postgres.sync_strategies.incremental.post_db.pooled_connection')
+    def test_one_probe_per_database(self, mocked_pooled_connection):
+        cursor = mocked_pooled_connection.return_value.__enter__.return_value.cursor.return_value.__enter__. \
+            return_value
+        cursor.mogrify.side_effect = lambda sql, values: ','.join(f"'{v}'" for v in values).encode()
+        cursor.fetchone.return_value = (False, True)
+        streams = [self.stream('a', ['id']), self.stream('b', []), self.stream('c', ['id'])]
+        state = {'bookmarks': {'public-a': {'replication_key_value': 10, 'replication_key_pk': ['4']},
+                               'public-b': {'replication_key_value': 20},
+                               'public-c': {'version': 1}}}
+
+        changed = incremental.fetch_changed_streams({'dbname': 'postgres'}, streams, state)
+
+        self.assertEqual({'public-b', 'public-c'}, changed)
+        self.assertEqual('foo_db', mocked_pooled_connection.call_args[0][0]['dbname'])
+        cursor.execute.assert_called_once_with(
+            'SELECT EXISTS (SELECT 1 FROM "public"."a" WHERE ( "updated_at" , "id" ) > (\'10\'::integer,\'4\')), '
+            'EXISTS (SELECT 1 FROM "public"."b" WHERE  "updated_at"  > \'20\'::integer)')
+
+
+class TestDetectDeletes(TestCase):
+    """Test Cases for detecting the rows deleted from incremental streams"""
+
+    @patch('tap_postgres.sync_strategies.incremental.sync_common.write_message')
+    @patch('tap_postgres.sync_strategies.incremental.pk_set.remove_sets')
+    @patch('tap_postgres.sync_strategies.incremental.pk_set.diff_key_sets')
+    @patch('tap_postgres.sync_strategies.incremental.post_db.pooled_connection')
+    def test_detect_deletes(self, mocked_pooled_connection, mocked_diff_key_sets, mocked_remove_sets,
+                            mocked_write_message):
+        cursor = mocked_pooled_connection.return_value.__enter__.return_value.cursor.return_value.__enter__. \
+            return_value
+        mocked_diff_key_sets.return_value = iter([[3, 'b']])
+        stream = {'tap_stream_id': 'public-events', 'stream': 'events', 'table_name': 'events'}
+        md_map = {(): {'schema-name': 'public', 'table-key-properties': ['id', 'code']},
+                  ('properties', 'id'): {'sql-datatype': 'bigint'},
+                  ('properties', 'code'): {'sql-datatype': 'character varying'}}
+        state = {'bookmarks': {'public-events': {'version': 7, 'pk_set_generation': 4}}}
+
+        with patch('tap_postgres.sync_strategies.incremental.os.makedirs'):
+            state = incremental.detect_deletes({'pk_set_dir': '/pk_sets'}, stream, state, md_map)
+
+        cursor.execute.assert_called_once_with(
+            'SELECT  "id" , "code" ::text COLLATE "C" FROM "public"."events" '
+            'ORDER BY  "id" , "code" ::text COLLATE "C"')
+        self.assertEqual(('/pk_sets/public-events.4.pks', '/pk_sets/public-events.5.pks', ['id', 'code'], cursor),
+                         mocked_diff_key_sets.call_args[0])
+        mocked_remove_sets.assert_called_once_with('/pk_sets', 'public-events', keep={4})
+        self.assertEqual(5, state['bookmarks']['public-events']['pk_set_generation'])
+        record_message = mocked_write_message.call_args[0][0]
+        self.assertEqual((7, 3, 'b'), (record_message.version, record_message.record['id'],
+                                       record_message.record['code']))
+        self.assertIsNotNone(record_message.record['_sdc_deleted_at'])
+
+    @patch('tap_postgres.sync_strategies.incremental.post_db.pooled_connection')
+    def test_primary_keys_of_other_types_are_not_diffed(self, mocked_pooled_connection):
+        md_map = {(): {'schema-name': 'public', 'table-key-properties': ['day']},
+                  ('properties', 'day'): {'sql-datatype': 'date'}}
+        self.assertEqual({}, incremental.detect_deletes({'pk_set_dir': '/pk_sets'}, {'tap_stream_id': 'public-days'},
+                                                        {}, md_map))
+        mocked_pooled_connection.assert_not_called()
@@ -0,0 +1,100 @@
+import random
+import unittest
+
+from tap_postgres import literals
+
+
+# characters that need quoting or escaping in array literals, mixed with ordinary ones
+FUZZ_CHARACTERS = ['a', 'b', 'Z', '1', ' ', '\t', '\n', ',', '{', '}', '"', '\\', "'", '=', '>', 'é', '€', '😀']
+
+
+def random_text(rand):
+    if rand.random() < 0.1:
+        return rand.choice(['', 'NULL', 'null', ' NULL ', 'NULLS'])
+    return ''.join(rand.choice(FUZZ_CHARACTERS) for _ in range(rand.randint(0, 8)))
+
+
+def random_array(rand, dimensions, make_element):
+    if not dimensions:
+        return None if rand.random() < 0.1 else make_element(rand)
+    return [random_array(rand, dimensions[1:], make_element) for _ in range(dimensions[0])]
+
+
+def array_out(value):
+    """Formats nested lists the way the array output function of postgres does"""
+    if isinstance(value, list):
+        return '{' + ','.join(array_out(element) for element in value) + '}'
+    if value is None:
+        return 'NULL'
+    text = str(value)
+    if text == '' or text.upper() == 'NULL' or any(c in text for c in '{},"\\') or \
+            any(c.isspace() for c in text):
+        return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return text
+
+
+class TestParseArray(unittest.TestCase):
+    """Test Cases for parsing the text of postgres arrays"""
+
+    def test_parse_array(self):
+        self.assertEqual([], literals.parse_array('{}'))
+        self.assertEqual(['a', None, 'NULL', ''], literals.parse_array('{a,NULL,"NULL",""}'))
+        self.assertEqual([['a b', 'c'], ['d', None]], literals.parse_array('{{ a b ,c},{"d",null}}'))
+        self.assertEqual(['a"b', 'c\\d', 'e,f', '{g}'], literals.parse_array(r'{"a\"b","c\\d","e,f","{g}"}'))
+        self.assertEqual(['NULL', 'a b '], literals.parse_array(r'{\NULL,a b\ }'))
+        self.assertEqual([1, 2], literals.parse_array('[0:1]={1,2}', int))
+        self.assertEqual([[True], [False]], literals.parse_array('[1:2][1:1]={{t},{f}}', literals.parse_boolean))
+
+    def test_parse_array_errors(self):
+        for text in ['', 'a', '{a', '{"a}', '{a}b', '{a"b"}', '{{a}']:
+            with self.assertRaises(literals.LiteralParseError, msg=text):
+                literals.parse_array(text)
+
+        with self.assertRaises(literals.LiteralParseError):
+            literals.parse_array('{x}', literals.parse_boolean)
+
+    def test_parse_array_fuzz(self):
+        """Random arrays formatted like postgres does parse back to the same nested lists"""
+        rand = random.Random(20221111)
+        for _ in range(2000):
+            dimensions = [rand.randint(1, 4) for _ in range(rand.randint(1, 3))]
+            value = random_array(rand, dimensions, random_text)
+            self.assertEqual(value, literals.parse_array(array_out(value)), array_out(value))
+
+    def test_parse_array_fuzz_integers(self):
+        rand = random.Random(20221112)
+        for _ in range(500):
+            dimensions = [rand.randint(1, 5) for _ in range(rand.randint(1, 3))]
+            value = random_array(rand, dimensions, lambda r: r.randint(-2 ** 31, 2 ** 31 - 1))
+            self.assertEqual(value, literals.parse_array(array_out(value), int))
+
+
+def hstore_out(pairs):
+    """Formats a dictionary the way the hstore output function of postgres does"""
+    def quote(text):
+        return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+    return ', '.join(f'{quote(key)}=>{"NULL" if value is None else quote(value)}' for key, value in pairs.items())
+
+
+class TestParseHstore(unittest.TestCase):
+    """Test Cases for parsing the text of hstores"""
+
+    def test_parse_hstore(self):
+        self.assertEqual({}, literals.parse_hstore(''))
+        self.assertEqual({'a': '1', 'b': None, 'c': 'NULL'}, literals.parse_hstore('"a"=>"1", "b"=>NULL, "c"=>"NULL"'))
+        self.assertEqual({'a': 'b', 'c d': 'e'}, literals.parse_hstore(' a => b ,"c d"=>e '))
+        self.assertEqual({'a"b': 'c\\d', 'e,f': '=>'}, literals.parse_hstore(r'"a\"b"=>"c\\d", a\"b=>c\\d, "e,f"=>"=>"'))
+
+    def test_parse_hstore_errors(self):
+        for text in ['a', 'a=>', '"a"=>"b', 'a=>b c=>d', 'a b=>c', '=>b']:
+            with self.assertRaises(literals.LiteralParseError, msg=text):
+                literals.parse_hstore(text)
+
+    def test_parse_hstore_fuzz(self):
+        """Random hstores formatted like postgres does parse back to the same dictionaries"""
+        rand = random.Random(20221113)
+        for _ in range(2000):
+            pairs = {random_text(rand): None if rand.random() < 0.1 else random_text(rand)
+                     for _ in range(rand.randint(0, 5))}
+            self.assertEqual(pairs, literals.parse_hstore(hstore_out(pairs)), hstore_out(pairs))
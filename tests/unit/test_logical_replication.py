@@ -1,3 +1,4 @@
+import copy
 import json
 import unittest
 import decimal
@@ -10,6 +11,8 @@ from datetime import datetime, date, timezone
 from unittest.mock import patch
 from dateutil.tz import tzoffset
 
+import tap_postgres
+
 from tap_postgres.sync_strategies import logical_replication
 from tap_postgres.sync_strategies.logical_replication import UnsupportedPayloadKindError
 
@@ -677,61 +680,44 @@ class TestLogicalReplication(unittest.TestCase):
         actual_value = logical_replication.get_stream_version(tap_stream_id, state)
         self.assertEqual(state['bookmarks']['foo']['version'], actual_value)
 
-    def test_tuples_to_map(self):
-        """Test if the output of tuples_to_map is as expected"""
-        accum = {'foo_key': 'foo_value'}
-        t = ['bar_1', 'bar_2']
-        expected_output = accum.copy()
-        expected_output[t[0]] = t[1]
-
-        actual_output = logical_replication.tuples_to_map(accum, t)
-        self.assertEqual(expected_output, actual_output)
-
-    @patch("psycopg2.connect")
-    def test_create_hstore_elem(self, mocked_connect):
+    def test_create_hstore_elem(self):
         """Test if the output of create_hstore_elem is as expected"""
-        mocked_cursor = mocked_connect.return_value.__enter__.return_value.cursor
-        mocked_fetchone = mocked_cursor.return_value.__enter__.return_value.fetchone
-        mocked_fetchone.return_value = (['foo', 'bar'],)
-        elem = 'foo=>bar'
-        expected_output = {'foo': 'bar'}
-        actual_output = logical_replication.create_hstore_elem(self.conn_info, elem)
-        self.assertDictEqual(expected_output, actual_output)
+        test_values = [('foo=>bar', {'foo': 'bar'}),
+                       ('', {}),
+                       ('"a"=>"1", "b"=>NULL, "c"=>"NULL"', {'a': '1', 'b': None, 'c': 'NULL'}),
+                       ('"a \\"b\\""=>"c\\\\d", " "=>""', {'a "b"': 'c\\d', ' ': ''})]
+        for elem, expected_output in test_values:
+            actual_output = logical_replication.create_hstore_elem(self.conn_info, elem)
+            self.assertDictEqual(expected_output, actual_output)
 
-    @patch("psycopg2.connect")
-    def test_create_array_elem(self, mocked_connect):
+    def test_create_array_elem(self):
         """Test if the output of create_array_elem is as expected"""
-        mocked_cursor = mocked_connect.return_value.__enter__.return_value.cursor
-        mocked_fetchone = mocked_cursor.return_value.__enter__.return_value.fetchone
         test_values = [('foo', '{bar}', ['bar']),
-                       ('bit[]', {1}, [True]),
+                       ('bit[]', '{1,0}', [True, False]),
                        ('foo', None, None),
-                       ('boolean[]', {True}, [True]),
-                       ('character varying[]', {1, 'foo'}, ['1', "'foo'"]),
-                       ('cidr[]', "{127.0.0.1}", ['127.0.0.1/32']),
-                       ('citext[]', {1, 'foo'}, ['1', "'foo'"]),
+                       ('boolean[]', '{t,f,NULL}', [True, False, None]),
+                       ('character varying[]', '{1,"\'foo\'"}', ['1', "'foo'"]),
+                       ('cidr[]', '{127.0.0.1/32}', ['127.0.0.1/32']),
+                       ('citext[]', '{1,\'foo\'}', ['1', "'foo'"]),
                        ('date[]', '{2022-11-11}', ['2022-11-11']),
-                       ('double precision[]', {234.45}, [234.45]),
-                       ('hstore[]', {'foo'}, ["'foo'"]),
-                       ('integer[]', {123}, [123]),
-                       ('inet[]', "{127.0.0.1}", ['127.0.0.1']),
-                       ('json[]', {"foo": "bar"}, ["'foo': 'bar'"]),
-                       ('jsonb[]', {"foo": "bar"}, ["'foo': 'bar'"]),
-                       ('macaddr[]', "{aa:bb:cc:dd:ee:ff}", ['aa:bb:cc:dd:ee:ff']),
-                       ('money[]', {12.5}, ['12.5']),
-                       ('numeric[]', {12.5}, ['12.5']),
-                       ('real[]', {12.5}, [12.5]),
-                       ('smallint[]', {12}, [12]),
-                       ('text[]', '{foo}', ['foo']),
-                       ('time without time zone[]', '{22:22:22}', ['22:22:22']),
-                       ('time with time zone[]', '{22:22:22+00:00}', ['22:22:22+00:00']),
-                       ('timestamp without time zone[]', '{2022-11-11T22:22:22}', ['2022-11-11T22:22:22']),
-                       ('uuid[]', '{aabbccdd}', ['aabbccdd'])]
+                       ('double precision[]', '{234.45,NaN,-Infinity}', [234.45, float('nan'), float('-inf')]),
+                       ('hstore[]', '{"\\"foo\\"=>\\"bar\\""}', ['"foo"=>"bar"']),
+                       ('integer[]', '{{1,2},{3,NULL}}', [[1, 2], [3, None]]),
+                       ('inet[]', '{127.0.0.1}', ['127.0.0.1']),
+                       ('jsonb[]', '{"{\\"foo\\": \\"bar\\"}"}', ['{"foo": "bar"}']),
+                       ('macaddr[]', '{aa:bb:cc:dd:ee:ff}', ['aa:bb:cc:dd:ee:ff']),
+                       ('money[]', '{$12.50}', ['$12.50']),
+                       ('numeric[]', '{12.5}', ['12.5']),
+                       ('real[]', '{12.5}', [12.5]),
+                       ('smallint[]', '[0:1]={12,13}', [12, 13]),
+                       ('text[]', '{foo,"a,b","NULL",""}', ['foo', 'a,b', 'NULL', '']),
+                       ('time with time zone[]', '{22:22:22+00}', ['22:22:22+00']),
+                       ('timestamp without time zone[]', '{"2022-11-11 22:22:22"}', ['2022-11-11 22:22:22']),
+                       ('uuid[]', '{}', [])]
 
         for sql_datatype, elem, expected_output in test_values:
-            mocked_fetchone.return_value = [(expected_output), ]
             actual_output = logical_replication.create_array_elem(elem, sql_datatype, self.conn_info)
-            self.assertEqual(expected_output, actual_output)
+            self.assertEqual(str(expected_output), str(actual_output))
 
     def test_selected_array_to_singer_value(self):
         """Test if selected_array_to_singer_value returns excpected output"""
@@ -758,6 +744,31 @@ class TestLogicalReplication(unittest.TestCase):
             actual_output = logical_replication.selected_value_to_singer_value(elem, sql_datatype, self.conn_info)
             self.assertEqual(expected_output, actual_output)
 
+    def test_value_converter(self):
+        """Test if value converters return what selected_value_to_singer_value returns"""
+        test_values = [('integer', 5), ('integer', None), ('bigint', '5'), ('text', 'foo'), ('boolean', True),
+                       ('numeric', '12.50'), ('numeric', None), ('jsonb', '{"foo": [1]}'), ('bit', '1'),
+                       ('date', '2021-09-07'), ('timestamp without time zone', '2020-09-01 20:10:56'),
+                       ('time without time zone', '24:00:00'), ('double precision', 1.5), ('foo', 'bar')]
+        for sql_datatype, elem in test_values:
+            self.assertEqual(logical_replication.selected_value_to_singer_value(elem, sql_datatype, self.conn_info),
+                             logical_replication.value_converter(sql_datatype, self.conn_info)(elem))
+
+    @patch('tap_postgres.sync_strategies.logical_replication.create_array_elem')
+    def test_value_converter_of_arrays(self, mocked_create_array_elem):
+        """Test if array converters parse the array and convert every element of every dimension"""
+        mocked_create_array_elem.return_value = [['2022-11-11', None], ['2022-11-12', '2022-11-13']]
+        convert = logical_replication.value_converter('date[]', self.conn_info)
+
+        self.assertEqual([['2022-11-11T00:00:00+00:00', None],
+                          ['2022-11-12T00:00:00+00:00', '2022-11-13T00:00:00+00:00']],
+                         convert('{{2022-11-11,NULL},{2022-11-12,2022-11-13}}'))
+        mocked_create_array_elem.assert_called_once_with('{{2022-11-11,NULL},{2022-11-12,2022-11-13}}', 'date[]',
+                                                         self.conn_info)
+
+        mocked_create_array_elem.return_value = None
+        self.assertEqual([], convert(None))
+
     def test_row_to_singer_message_raises_exception_if_no_sql_datatype_in_md_map(self):
         """Test row_to_singer_message raises exception if no sql_datatype in md_map"""
         stream = 'bar'
@@ -909,12 +920,8 @@ class TestLogicalReplication(unittest.TestCase):
 
         self.assertEqual(expected_output, actual_output)
 
-    @patch("psycopg2.connect")
-    def test_impl_with_sql_datatype_is_hstore(self, mocked_connect):
+    def test_impl_with_sql_datatype_is_hstore(self):
         """Test selected_value_to_singer_value_impl if datatype is hstore"""
-        mocked_cursor = mocked_connect.return_value.__enter__.return_value.cursor
-        mocked_fetchone = mocked_cursor.return_value.__enter__.return_value.fetchone
-        mocked_fetchone.return_value = (['1', '0', '2', '1'],)
         og_sql_datatype = 'hstore'
         hstore_elem = '1=>0,2=>1'
         expected_output = {'1': '0', '2': '1'}
@@ -1013,6 +1020,49 @@ class TestLogicalReplication(unittest.TestCase):
         actual_output = logical_replication.consume_message(streams, state, update_msg, time_extracted, self.conn_info)
         self.assertDictEqual(expected_output, actual_output)
 
+    @patch('tap_postgres.sync_strategies.logical_replication.singer.write_message')
+    @patch('tap_postgres.sync_strategies.logical_replication.refresh_streams_schema')
+    @patch('tap_postgres.sync_strategies.logical_replication.sync_common.send_schema_message')
+    def test_consume_message_reuses_decode_plan_until_schema_refresh(self, _, mocked_refresh, mocked_write_message):
+        """Test if the decode plan of a stream is built once and rebuilt when the schema is refreshed"""
+        streams = [{
+            'tap_stream_id': 'foo-bar',
+            'schema': {'properties': {'id': {}}},
+            'stream': 'bar',
+            'metadata': [{'metadata': {'schema-name': 'foo'}, 'breadcrumb': []},
+                         {'metadata': {'sql-datatype': 'integer'}, 'breadcrumb': ['properties', 'id']}]
+        }]
+        state = {'bookmarks': {'foo-bar': {'version': 1}}}
+        decode_plans = {}
+
+        def message(columns):
+            return self.WalMessage(data_start=1, payload=json.dumps(
+                {'schema': 'foo', 'table': 'bar', 'action': 'I', 'columns': columns}))
+
+        logical_replication.consume_message(streams, state, message([{'name': 'id', 'value': 1}]), None,
+                                            self.conn_info, decode_plans)
+        decode_plan = decode_plans['foo-bar']
+        logical_replication.consume_message(streams, state, message([{'name': 'id', 'value': 2}]), None,
+                                            self.conn_info, decode_plans)
+        self.assertIs(decode_plan, decode_plans['foo-bar'])
+
+        def refresh_schema(_, refreshed_streams):
+            refreshed_streams[0]['schema']['properties']['name'] = {}
+            refreshed_streams[0]['metadata'].append({'metadata': {'sql-datatype': 'text'},
+                                                     'breadcrumb': ['properties', 'name']})
+        mocked_refresh.side_effect = refresh_schema
+
+        logical_replication.consume_message(streams, state, message([{'name': 'id', 'value': 3},
+                                                                     {'name': 'name', 'value': 'x'}]),
+                                            None, self.conn_info, decode_plans)
+        self.assertIsNot(decode_plan, decode_plans['foo-bar'])
+
+        records = [c[0][0].record for c in mocked_write_message.call_args_list]
+        self.assertEqual([{'id': 1, '_sdc_deleted_at': None},
+                          {'id': 2, '_sdc_deleted_at': None},
+                          {'id': 3, 'name': 'x', '_sdc_deleted_at': None}], records)
+        self.assertEqual('foo-bar', mocked_write_message.call_args[0][0].stream)
+
     @patch('tap_postgres.sync_strategies.logical_replication.refresh_streams_schema')
     @patch('tap_postgres.sync_strategies.logical_replication.sync_common.send_schema_message')
     def test_consume_message_raises_exception_if_delete_and_no_datatype_for_stream(self, *args):
@@ -1263,3 +1313,184 @@ class TestLogicalReplication(unittest.TestCase):
         mocked_send_feedback.assert_called_with(write_lsn=test_message.data_start,
                                                 flush_lsn=test_message.data_start,
                                                 reply=True, force=True)
+
+    @patch("psycopg2.connect")
+    def test_locate_replication_slots(self, mocked_connect):
+        """Test locate_replication_slots returns the confirmed flush lsn of every slot"""
+        mocked_cursor = mocked_connect.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        mocked_cursor.fetchall.side_effect = [['pipelinewise_foo_db'],
+                                              [('pipelinewise_foo_db_1', '0/20'), ('pipelinewise_foo_db', '0/10')]]
+
+        self.assertEqual({'pipelinewise_foo_db': 16, 'pipelinewise_foo_db_1': 32},
+                         logical_replication.locate_replication_slots(self.conn_info, 2))
+        self.assertEqual((['pipelinewise_foo_db', 'pipelinewise_foo_db_1'],), mocked_cursor.execute.call_args[0][1])
+
+        mocked_cursor.fetchall.side_effect = [['pipelinewise_foo_db'], [('pipelinewise_foo_db', '0/10')]]
+        with self.assertRaises(logical_replication.ReplicationSlotNotFoundError):
+            logical_replication.locate_replication_slots(self.conn_info, 3)
+
+    @patch('tap_postgres.sync_strategies.logical_replication.post_db.pooled_connection')
+    def test_check_publication_tables(self, mocked_pooled_connection):
+        """Test check_publication_tables fails on tables missing from the publication"""
+        cursor = mocked_pooled_connection.return_value.__enter__.return_value.cursor.return_value.__enter__. \
+            return_value
+        cursor.fetchall.return_value = [('public', 'a'), ('public', 'b')]
+        streams = [{'tap_stream_id': f'{schema}-{table}', 'table_name': table,
+                    'metadata': [{'breadcrumb': [], 'metadata': {'schema-name': schema}}]}
+                   for schema, table in [('public', 'a'), ('public', 'b'), ('other', 'a')]]
+
+        logical_replication.check_publication_tables(self.conn_info, 'slot', streams[:2])
+        self.assertEqual(('slot',), cursor.execute.call_args[0][1])
+
+        with self.assertRaisesRegex(logical_replication.PublicationTablesMissingError, 'other-a'):
+            logical_replication.check_publication_tables(self.conn_info, 'slot', streams)
+
+    def test_shard_streams(self):
+        """Test shard_streams only moves streams to slots without changes confirmed past their lsn"""
+        streams = [{'tap_stream_id': tap_stream_id} for tap_stream_id in ['public-a', 'public-b', 'public-d',
+                                                                          'public-e']]
+        state = {'bookmarks': {'public-a': {'lsn': 30},
+                               'public-b': {'lsn': 5},
+                               'public-d': {'lsn': 25, 'replication_slot': 'slot_1'},
+                               'public-e': {'lsn': 15, 'replication_slot': 'slot_2'}}}
+
+        state, shards = logical_replication.shard_streams(streams, state, {'slot': 20, 'slot_1': 10})
+
+        # public-a and public-b hash to slot_1, public-d and public-e to slot, which is past the lsn of public-e
+        self.assertEqual({'slot': ['public-b', 'public-d'], 'slot_1': ['public-a', 'public-e']},
+                         {slot: [s['tap_stream_id'] for s in shard] for slot, shard in shards.items()})
+        self.assertEqual({'public-a': 'slot_1', 'public-b': 'slot', 'public-d': 'slot', 'public-e': 'slot_1'},
+                         {tap_stream_id: bookmark['replication_slot']
+                          for tap_stream_id, bookmark in state['bookmarks'].items()})
+
+    def test_shard_streams_of_a_dropped_slot_past_every_slot(self):
+        """Test shard_streams raises rather than skip changes of a stream whose slot is no longer used"""
+        streams = [{'tap_stream_id': 'public-e'}]
+        state = {'bookmarks': {'public-e': {'lsn': 5, 'replication_slot': 'slot_2'}}}
+
+        with self.assertRaises(logical_replication.ReplicationSlotBehindError):
+            logical_replication.shard_streams(streams, state, {'slot': 10, 'slot_1': 20})
+
+    @patch('tap_postgres.stream_scheduler.StreamScheduler')
+    @patch('tap_postgres.replication_slot_groups')
+    @patch('tap_postgres.logical_replication.add_automatic_properties', side_effect=lambda stream, _: stream)
+    def test_sharded_slots_of_every_database_are_consumed_at_once(self, _, mocked_replication_slot_groups,
+                                                                   mocked_stream_scheduler):
+        """Test the slots of every sharded database get a worker whatever logical_replication_workers"""
+        streams = [{'tap_stream_id': tap_stream_id} for tap_stream_id in ['db1-a', 'db1-b', 'db2-a', 'db2-b']]
+        state = {'currently_syncing': None, 'bookmarks': {}}
+        mocked_replication_slot_groups.return_value = state, [({}, slot, [stream])
+                                                              for slot, stream in zip(['s', 's_1'] * 2, streams)]
+        conn_config = {'logical_replication_workers': 1, 'logical_replication_slots': 2}
+
+        tap_postgres.sync_logical_streams(conn_config, streams, state, 100, None)
+        self.assertEqual(4, mocked_stream_scheduler.call_args[0][1])
+
+        mocked_replication_slot_groups.return_value = state, [({}, None, streams[:2]), ({}, None, streams[2:])]
+        tap_postgres.sync_logical_streams(dict(conn_config, logical_replication_workers=2,
+                                               logical_replication_slots=1), streams, state, 100, None)
+        self.assertEqual(2, mocked_stream_scheduler.call_args[0][1])
+
+
+def change_payload(table, lsn, **columns):
+    return json.dumps({'action': 'I', 'schema': 'public', 'table': table,
+                       'columns': [{'name': name, 'value': value} for name, value in columns.items()]})
+
+
+class TestDecodePool(unittest.TestCase):
+    """Test Cases for decoding wal2json messages on worker processes"""
+
+    WalMessage = namedtuple('WalMessage', ['data_start', 'payload'])
+
+    def setUp(self):
+        self.streams = [{
+            'tap_stream_id': f'public-{table}',
+            'stream': table,
+            'table_name': table,
+            'schema': {'properties': {'id': {}, 'price': {}}},
+            'metadata': [{'metadata': {'schema-name': 'public'}, 'breadcrumb': []},
+                         {'metadata': {'sql-datatype': 'integer'}, 'breadcrumb': ['properties', 'id']},
+                         {'metadata': {'sql-datatype': 'numeric'}, 'breadcrumb': ['properties', 'price']}]
+        } for table in ['a', 'b']]
+        self.state = {'bookmarks': {'public-a': {'version': 1, 'lsn': 1}, 'public-b': {'version': 2, 'lsn': 1}}}
+        self.time_extracted = datetime(2022, 11, 1, tzinfo=timezone.utc)
+        self.messages = [self.WalMessage(10, change_payload('a', 10, id=1, price='1.50')),
+                         self.WalMessage(11, change_payload('other', 11, id=2)),
+                         self.WalMessage(12, 'not json'),
+                         self.WalMessage(13, change_payload('b', 13, id=3, price='2.25')),
+                         self.WalMessage(14, change_payload('a', 14, id=4, price=None))]
+
+    def test_decode_wal2json_messages(self):
+        logical_replication._init_decode_worker(self.streams, self.time_extracted, {})
+        try:
+            decoded = logical_replication._decode_wal2json_messages(
+                [(msg.data_start, msg.payload) for msg in self.messages]
+                + [(15, change_payload('b', 15, id=5, new_column=1))], {})
+        finally:
+            logical_replication._DECODE_WORKER.clear()
+
+        self.assertEqual([('public-a', '{"id": 1, "price": 1.50, "_sdc_deleted_at": null}'),
+                          None,
+                          None,
+                          ('public-b', '{"id": 3, "price": 2.25, "_sdc_deleted_at": null}'),
+                          ('public-a', '{"id": 4, "price": null, "_sdc_deleted_at": null}'),
+                          {'action': 'I', 'schema': 'public', 'table': 'b',
+                           'columns': [{'name': 'id', 'value': 5}, {'name': 'new_column', 'value': 1}]}],
+                         decoded)
+
+    def test_decode_wal2json_messages_with_refreshed_streams(self):
+        refreshed_stream = copy.deepcopy(self.streams[1])
+        refreshed_stream['schema']['properties']['new_column'] = {}
+        refreshed_stream['metadata'].append({'metadata': {'sql-datatype': 'integer'},
+                                             'breadcrumb': ['properties', 'new_column']})
+        logical_replication._init_decode_worker(self.streams, self.time_extracted, {})
+        try:
+            messages = [(15, change_payload('b', 15, id=5, new_column=1))]
+            self.assertIsInstance(logical_replication._decode_wal2json_messages(messages, {})[0], dict)
+            decoded = logical_replication._decode_wal2json_messages(
+                messages, {'public-b': (1, refreshed_stream)})
+        finally:
+            logical_replication._DECODE_WORKER.clear()
+
+        self.assertEqual([('public-b', '{"id": 5, "new_column": 1, "_sdc_deleted_at": null}')], decoded)
+
+    @patch('tap_postgres.sync_strategies.logical_replication.consume_change')
+    def test_decode_pool_sends_refreshed_streams_to_the_workers(self, mocked_consume_change):
+        def consume_change(streams, state, payload, lsn, time_extracted, conn_info, decode_plans):
+            decode_plans['public-b'] = {'refreshed': True}
+            return state
+
+        mocked_consume_change.side_effect = consume_change
+        with patch('tap_postgres.sync_strategies.logical_replication.multiprocessing.get_context'):
+            decode_pool = logical_replication.DecodePool(self.streams, self.time_extracted, {}, 2)
+        decode_pool.pool.apply_async.return_value.get.return_value = \
+            [json.loads(change_payload('b', 15, id=5, new_column=1))]
+
+        decode_pool.submit(self.state, self.WalMessage(15, ''))
+        decode_pool.drain(self.state, wait=True)
+        decode_pool.submit(self.state, self.WalMessage(16, ''))
+        decode_pool.drain(self.state)
+
+        sent_streams = [c[0][1][1] for c in decode_pool.pool.apply_async.call_args_list]
+        self.assertEqual({}, sent_streams[0])
+        self.assertEqual({'public-b': (1, self.streams[1])}, sent_streams[1])
+
+    @patch('tap_postgres.sync_strategies.logical_replication.DECODE_BATCH_SIZE', 2)
+    @patch('tap_postgres.sync_strategies.logical_replication.sync_common.write_json_record')
+    def test_decode_pool_writes_records_in_lsn_order(self, mocked_write_json_record):
+        decode_pool = logical_replication.DecodePool(self.streams, self.time_extracted, {}, 2)
+        try:
+            state = self.state
+            for msg in self.messages:
+                state = decode_pool.submit(state, msg)
+            state = decode_pool.drain(state, wait=True)
+            self.assertFalse(decode_pool.pending)
+        finally:
+            decode_pool.close()
+
+        records = [(c[0][0], json.loads(c[0][1])['id']) for c in mocked_write_json_record.call_args_list]
+        self.assertEqual([1, 3, 4], [record_id for _, record_id in records])
+        # the envelope carries the version of the stream
+        self.assertIn('"version": 2', records[1][0][1])
+        self.assertEqual(14, state['bookmarks']['public-a']['lsn'])
+        self.assertEqual(13, state['bookmarks']['public-b']['lsn'])
@@ -0,0 +1,118 @@
+import datetime
+import decimal
+import unittest
+
+from collections import namedtuple
+from unittest.mock import patch
+
+from tap_postgres import pgoutput
+from tap_postgres.sync_strategies import logical_replication
+
+# pgoutput (proto_version 1) messages as a slot streams them for the table
+#   CREATE TYPE mood AS ENUM ('happy', 'sad');
+#   CREATE TABLE public.awesome_table (id integer PRIMARY KEY, name text, price numeric, active boolean, mood mood);
+# for the statements
+#   INSERT INTO awesome_table VALUES (1, 'Backup', 12.50, true, 'happy');
+#   UPDATE awesome_table SET price = 13.00, active = false, mood = NULL;  -- name is an unchanged TOASTed value
+#   DELETE FROM awesome_table;
+RELATION = bytes.fromhex('52000040017075626c696300617765736f6d655f7461626c65006400050169640000000017ffffffff006e616d'
+                         '650000000019ffffffff00707269636500000006a4ffffffff006163746976650000000010ffffffff006d6f6f'
+                         '640000004006ffffffff')
+TYPE = bytes.fromhex('59000040067075626c6963006d6f6f6400')
+INSERT = bytes.fromhex('49000040014e000574000000013174000000064261636b7570740000000531322e3530740000000174740000000568'
+                       '61707079')
+UPDATE = bytes.fromhex('55000040014e000574000000013175740000000531332e30307400000001666e')
+DELETE = bytes.fromhex('44000040014b00057400000001316e6e6e6e')
+BEGIN = bytes.fromhex('4200000000016b3748000287dfe725eff2000002e6')
+COMMIT = bytes.fromhex('430000000000016b374800000000016b3780000287dfe725eff2')
+
+
+class TestPgoutputDecoder(unittest.TestCase):
+    """Test Cases for decoding pgoutput messages"""
+
+    def setUp(self) -> None:
+        self.decoder = pgoutput.PgoutputDecoder()
+        self.assertIsNone(self.decoder.decode(TYPE))
+        self.assertIsNone(self.decoder.decode(RELATION))
+
+    def test_relation_and_type_are_cached(self):
+        self.assertEqual({16390: ('public', 'mood')}, self.decoder.types)
+        self.assertEqual({16385: {'schema': 'public', 'table': 'awesome_table', 'columns': [
+            {'name': 'id', 'type_oid': 23, 'key': True},
+            {'name': 'name', 'type_oid': 25, 'key': False},
+            {'name': 'price', 'type_oid': 1700, 'key': False},
+            {'name': 'active', 'type_oid': 16, 'key': False},
+            {'name': 'mood', 'type_oid': 16390, 'key': False},
+        ]}}, self.decoder.relations)
+
+    def test_insert(self):
+        self.assertEqual({'action': 'I', 'schema': 'public', 'table': 'awesome_table', 'columns': [
+            {'name': 'id', 'value': 1},
+            {'name': 'name', 'value': 'Backup'},
+            {'name': 'price', 'value': '12.50'},
+            {'name': 'active', 'value': True},
+            {'name': 'mood', 'value': 'happy'},
+        ]}, self.decoder.decode(INSERT))
+
+    def test_update_leaves_out_unchanged_toasted_values(self):
+        self.assertEqual({'action': 'U', 'schema': 'public', 'table': 'awesome_table', 'columns': [
+            {'name': 'id', 'value': 1},
+            {'name': 'price', 'value': '13.00'},
+            {'name': 'active', 'value': False},
+            {'name': 'mood', 'value': None},
+        ]}, self.decoder.decode(UPDATE))
+
+    def test_delete_has_replica_identity_only(self):
+        self.assertEqual({'action': 'D', 'schema': 'public', 'table': 'awesome_table',
+                          'identity': [{'name': 'id', 'value': 1}]}, self.decoder.decode(DELETE))
+
+    def test_transaction_messages_are_skipped(self):
+        self.assertIsNone(self.decoder.decode(BEGIN))
+        self.assertIsNone(self.decoder.decode(COMMIT))
+
+    def test_errors(self):
+        with self.assertRaises(pgoutput.PgoutputDecodeError):
+            pgoutput.PgoutputDecoder().decode(INSERT)
+
+        with self.assertRaises(pgoutput.PgoutputDecodeError):
+            self.decoder.decode(INSERT[:-3])
+
+        with self.assertRaises(pgoutput.PgoutputDecodeError):
+            self.decoder.decode(b'Z')
+
+
+class TestConsumePgoutputMessage(unittest.TestCase):
+    """Test Cases for writing the records of pgoutput changes"""
+
+    ReplicationMessage = namedtuple('ReplicationMessage', ['data_start', 'payload'])
+
+    @patch('tap_postgres.sync_strategies.logical_replication.singer.write_message')
+    def test_consume_pgoutput_message(self, mocked_write_message):
+        streams = [{
+            'tap_stream_id': 'public-awesome_table',
+            'schema': {'properties': {'id': {}, 'name': {}, 'price': {}, 'active': {}, 'mood': {}}},
+            'stream': 'awesome_table',
+            'metadata': [{'metadata': {'schema-name': 'public'}, 'breadcrumb': []},
+                         {'metadata': {'sql-datatype': 'integer'}, 'breadcrumb': ['properties', 'id']},
+                         {'metadata': {'sql-datatype': 'text'}, 'breadcrumb': ['properties', 'name']},
+                         {'metadata': {'sql-datatype': 'numeric'}, 'breadcrumb': ['properties', 'price']},
+                         {'metadata': {'sql-datatype': 'boolean'}, 'breadcrumb': ['properties', 'active']},
+                         {'metadata': {'sql-datatype': 'mood'}, 'breadcrumb': ['properties', 'mood']}]
+        }]
+        state = {'bookmarks': {'public-awesome_table': {'version': 1}}}
+        decoder = pgoutput.PgoutputDecoder()
+        time_extracted = datetime.datetime(2022, 11, 1, tzinfo=datetime.timezone.utc)
+
+        for lsn, payload in enumerate([BEGIN, TYPE, RELATION, INSERT, UPDATE, DELETE, COMMIT], 100):
+            state = logical_replication.consume_pgoutput_message(streams, state,
+                                                                 self.ReplicationMessage(lsn, payload),
+                                                                 time_extracted, {}, decoder, {})
+
+        records = [c[0][0].record for c in mocked_write_message.call_args_list]
+        self.assertEqual(3, len(records))
+        self.assertEqual({'id': 1, 'name': 'Backup', 'price': decimal.Decimal('12.50'),
+                          'active': True, 'mood': 'happy', '_sdc_deleted_at': None}, records[0])
+        self.assertEqual({'id': 1, 'price': decimal.Decimal('13.00'), 'active': False,
+                          'mood': None, '_sdc_deleted_at': None}, records[1])
+        self.assertEqual({'id': 1, '_sdc_deleted_at': '2022-11-01T00:00:00+00:00'}, records[2])
+        self.assertEqual(105, state['bookmarks']['public-awesome_table']['lsn'])
@@ -0,0 +1,64 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from tap_postgres import pk_set
+
+
+class TestDiffKeySets(unittest.TestCase):
+    """Test Cases for diffing sorted primary key sets against the set of the previous run"""
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.generation = 0
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def diff(self, keys, key_columns=('id',)):
+        previous_path = pk_set.set_path(self.tmp_dir, 'public-events', self.generation) if self.generation else None
+        self.generation += 1
+        return list(pk_set.diff_key_sets(previous_path, pk_set.set_path(self.tmp_dir, 'public-events',
+                                                                         self.generation),
+                                         list(key_columns), iter(keys)))
+
+    def test_first_run_stores_the_keys(self):
+        self.assertEqual([], self.diff([(1,), (2,), (5,)]))
+        with open(os.path.join(self.tmp_dir, 'public-events.1.pks'), encoding='utf-8') as keys_file:
+            self.assertEqual([['id'], [1], [2], [5]], [json.loads(line) for line in keys_file])
+
+    def test_missing_keys_are_yielded(self):
+        self.diff([(1,), (2,), (5,), (9,)])
+        self.assertEqual([[1], [5], [9]], self.diff([(2,), (3,), (7,)]))
+        self.assertEqual([[2], [3], [7]], self.diff([]))
+
+    def test_composite_text_keys(self):
+        self.diff([('a', 'x'), ('a', 'y'), ('b', 'é')], key_columns=('tenant', 'code'))
+        self.assertEqual([['a', 'y']], self.diff([('a', 'x'), ('b', 'é'), ('c', 'z')], key_columns=('tenant', 'code')))
+
+    def test_set_of_other_key_columns_is_ignored(self):
+        self.diff([(1,), (2,)])
+        self.assertEqual([], self.diff([(1,)], key_columns=('uuid',)))
+
+    def test_diff_keeps_the_previous_set(self):
+        self.diff([(1,), (2,), (3,)])
+        diff = pk_set.diff_key_sets(pk_set.set_path(self.tmp_dir, 'public-events', 1),
+                                    pk_set.set_path(self.tmp_dir, 'public-events', 2), ['id'], iter([(2,), (3,)]))
+        self.assertEqual([1], next(diff))
+        diff.close()
+        # the target did not commit generation 2, so generation 1 is diffed against again
+        self.generation = 1
+        self.assertEqual([[1], [2], [3]], self.diff([]))
+
+    def test_remove_sets(self):
+        for file_name in ('public-events.1.pks', 'public-events.2.pks', 'public-events.3.pks.tmp',
+                          'public-events_log.1.pks', 'other.1.pks'):
+            with open(os.path.join(self.tmp_dir, file_name), 'w', encoding='utf-8'):
+                pass
+
+        pk_set.remove_sets(self.tmp_dir, 'public-events', keep={2})
+
+        self.assertEqual(['other.1.pks', 'public-events.2.pks', 'public-events_log.1.pks'],
+                         sorted(os.listdir(self.tmp_dir)))
@@ -0,0 +1,67 @@
+import unittest
+
+from unittest.mock import patch
+
+import tap_postgres
+
+
+def stream(tap_stream_id, is_view=False):
+    return {'tap_stream_id': tap_stream_id, 'table_name': tap_stream_id, 'schema': {'properties': {'id': {}}},
+            'metadata': [{'breadcrumb': [], 'metadata': {'database-name': 'foo_db', 'schema-name': 'public',
+                                                         'is-view': is_view}},
+                         {'breadcrumb': ['properties', 'id'], 'metadata': {'selected': True}}]}
+
+
+class TestSkipUnchangedStreams(unittest.TestCase):
+    """Test Cases for leaving out the streams that have not changed since their last sync"""
+
+    def setUp(self) -> None:
+        self.stats = {'relfilenode': 16390, 'n_tup_ins': 10, 'n_tup_upd': 2, 'n_tup_del': 0, 'stats_reset': None}
+        self.streams = [stream('events'), stream('lookup'), stream('changed'), stream('interrupted'),
+                        stream('a_view', is_view=True)]
+        self.lookup = {'events': 'incremental', 'lookup': 'full', 'changed': 'full', 'interrupted': 'full',
+                       'a_view': 'full'}
+        self.state = {'bookmarks': {
+            'lookup': {'version': 1, 'table_stats': dict(self.stats, columns=['id'])},
+            'changed': {'version': 1, 'table_stats': dict(self.stats, n_tup_upd=1, columns=['id'])},
+            'interrupted': {'version': 1, 'pk_keyset': [5], 'table_stats': dict(self.stats, columns=['id'])},
+        }}
+
+    @patch('tap_postgres.full_table.fetch_table_stats')
+    @patch('tap_postgres.incremental.fetch_changed_streams')
+    def test_skip_unchanged_streams(self, mocked_fetch_changed_streams, mocked_fetch_table_stats):
+        mocked_fetch_changed_streams.return_value = set()
+        mocked_fetch_table_stats.side_effect = lambda config, streams: {
+            s['tap_stream_id']: dict(self.stats) for s in streams}
+
+        streams, skipped, table_stats = tap_postgres.skip_unchanged_streams(
+            {'skip_unchanged_streams': True, 'skip_unchanged_full_tables': True}, self.streams, self.lookup,
+            self.state)
+
+        self.assertEqual(['changed', 'interrupted', 'a_view'], [s['tap_stream_id'] for s in streams])
+        self.assertEqual(['events', 'lookup'], skipped)
+        self.assertEqual({'changed': dict(self.stats, columns=['id']), 'interrupted': dict(self.stats, columns=['id'])},
+                         table_stats)
+        self.assertEqual(['lookup', 'changed', 'interrupted'],
+                         [s['tap_stream_id'] for s in mocked_fetch_table_stats.call_args[0][1]])
+
+    @patch('tap_postgres.full_table.fetch_table_stats')
+    def test_full_tables_are_not_skipped_on_secondary(self, mocked_fetch_table_stats):
+        streams, skipped, table_stats = tap_postgres.skip_unchanged_streams(
+            {'skip_unchanged_full_tables': True, 'use_secondary': True}, self.streams, self.lookup, self.state)
+
+        self.assertEqual(self.streams, streams)
+        self.assertEqual(([], {}), (skipped, table_stats))
+        mocked_fetch_table_stats.assert_not_called()
+
+    @patch('tap_postgres.sync_common.send_schema_message')
+    @patch('tap_postgres.full_table.sync_table')
+    def test_full_table_sync_bookmarks_the_table_stats(self, mocked_sync_table, _):
+        mocked_sync_table.side_effect = lambda conn_config, stream, state, *args: state
+
+        state = tap_postgres.do_sync_full_table({}, stream('changed'), self.state, ['id'], {},
+                                                dict(self.stats, columns=['id']))
+        state = tap_postgres.do_sync_full_table({}, stream('lookup'), state, ['id'], {})
+
+        self.assertEqual(dict(self.stats, columns=['id']), state['bookmarks']['changed']['table_stats'])
+        self.assertNotIn('table_stats', state['bookmarks']['lookup'])
@@ -0,0 +1,138 @@
+import copy
+import threading
+import unittest
+
+from unittest.mock import patch
+
+import singer
+
+from tap_postgres import stream_scheduler
+from tap_postgres.sync_strategies import common as sync_common
+
+
+class TestStreamScheduler(unittest.TestCase):
+    """Test Cases for syncing streams concurrently"""
+
+    def setUp(self) -> None:
+        self.streams = [{'tap_stream_id': 'public-a'}, {'tap_stream_id': 'public-b'}]
+        self.state = {'currently_syncing': None, 'bookmarks': {'public-c': {'version': 3}}}
+
+    def test_get_currently_syncing_streams(self):
+        self.assertEqual([], stream_scheduler.get_currently_syncing_streams({}))
+        self.assertEqual(['public-a'], stream_scheduler.get_currently_syncing_streams(
+            {'currently_syncing': 'public-a'}))
+        self.assertEqual(['public-a', 'public-b'], stream_scheduler.get_currently_syncing_streams(
+            {'currently_syncing': 'public-a', 'currently_syncing_streams': ['public-a', 'public-b']}))
+
+    @patch('tap_postgres.stream_scheduler.singer.write_message')
+    def test_run_merges_the_state_of_concurrent_streams(self, mocked_write_message):
+        both_started = threading.Barrier(2, timeout=10)
+        a_bookmarked = threading.Event()
+
+        def sync_stream(stream, state):
+            tap_stream_id = stream['tap_stream_id']
+            both_started.wait()
+            if tap_stream_id == 'public-b':
+                a_bookmarked.wait(10)
+
+            state = singer.write_bookmark(state, tap_stream_id, 'version', tap_stream_id[-1])
+            sync_common.write_message(singer.StateMessage(value=copy.deepcopy(state)))
+            if tap_stream_id == 'public-a':
+                a_bookmarked.set()
+            return state
+
+        state = stream_scheduler.StreamScheduler(self.state, 2).run(self.streams, sync_stream)
+
+        self.assertEqual({'currently_syncing': None,
+                          'bookmarks': {'public-a': {'version': 'a'},
+                                        'public-b': {'version': 'b'},
+                                        'public-c': {'version': 3}}}, state)
+
+        states = [c[0][0].value for c in mocked_write_message.call_args_list]
+        # both streams are in flight when a writes its state, b then sees the bookmark of a
+        self.assertEqual(['public-a', 'public-b'], states[0]['currently_syncing_streams'])
+        self.assertEqual({'public-a': {'version': 'a'}, 'public-c': {'version': 3}}, states[0]['bookmarks'])
+        self.assertEqual({'version': 'a'}, states[-1]['bookmarks']['public-a'])
+        self.assertEqual({'version': 'b'}, states[-1]['bookmarks']['public-b'])
+        self.assertEqual([], states[-1]['currently_syncing_streams'])
+
+    @patch('tap_postgres.stream_scheduler.singer.write_message')
+    def test_failed_stream_stays_currently_syncing(self, mocked_write_message):
+        def sync_stream(stream, state):
+            if stream['tap_stream_id'] == 'public-a':
+                raise RuntimeError('boom')
+            return state
+
+        with self.assertRaises(RuntimeError):
+            stream_scheduler.StreamScheduler(self.state, 1).run(self.streams, sync_stream)
+
+        # whether b started before being cancelled or not, a is left in flight for the next run to resume
+        for call in mocked_write_message.call_args_list:
+            self.assertIn('public-a', call[0][0].value['currently_syncing_streams'])
+
+    @patch('tap_postgres.stream_scheduler.singer.write_message')
+    def test_run_groups_merges_the_state_of_every_group(self, mocked_write_message):
+        both_started = threading.Barrier(2)
+
+        def sync_group(streams, state):
+            both_started.wait(timeout=5)
+            for stream in streams:
+                state = singer.write_bookmark(state, stream['tap_stream_id'], 'lsn', len(streams))
+                sync_common.write_message(singer.StateMessage(value=state))
+            return state
+
+        groups = [[{'tap_stream_id': 'public-a'}, {'tap_stream_id': 'public-b'}], [{'tap_stream_id': 'public-c'}]]
+        state = stream_scheduler.StreamScheduler(self.state, 2).run_groups(groups, sync_group)
+
+        self.assertEqual({'public-a': {'lsn': 2},
+                          'public-b': {'lsn': 2},
+                          'public-c': {'version': 3, 'lsn': 1}}, state['bookmarks'])
+        states = [c[0][0].value for c in mocked_write_message.call_args_list]
+        self.assertEqual(state, states[-1])
+        for written_state in states:
+            self.assertNotIn('currently_syncing_streams', written_state)
+
+    def test_state_handler_is_per_thread(self):
+        handled = []
+        with patch('singer.write_message') as mocked_write_message:
+            with sync_common.state_handler(handled.append):
+                sync_common.write_message(singer.StateMessage(value={'a': 1}))
+                thread = threading.Thread(target=sync_common.write_message,
+                                          args=(singer.StateMessage(value={'b': 2}),))
+                thread.start()
+                thread.join()
+            sync_common.write_message(singer.StateMessage(value={'c': 3}))
+
+        self.assertEqual([{'a': 1}], handled)
+        self.assertEqual([{'b': 2}, {'c': 3}], [c[0][0].value for c in mocked_write_message.call_args_list])
+
+
+def stream_with_statistics(tap_stream_id, **statistics):
+    return {'tap_stream_id': tap_stream_id, 'metadata': [{'breadcrumb': [], 'metadata': statistics}]}
+
+
+class TestPlanStreams(unittest.TestCase):
+    """Test Cases for ordering streams by their estimated size"""
+
+    def test_estimate_stream_size(self):
+        self.assertEqual(8192, stream_scheduler.estimate_stream_size(
+            stream_with_statistics('a', **{'relation-size': 8192, 'row-count': 10, 'row-width': 20})))
+        self.assertEqual(200, stream_scheduler.estimate_stream_size(
+            stream_with_statistics('a', **{'row-count': 10, 'row-width': 20})))
+        self.assertEqual(1000, stream_scheduler.estimate_stream_size(stream_with_statistics('a', **{'row-count': 10})))
+        self.assertEqual(0, stream_scheduler.estimate_stream_size(stream_with_statistics('a', **{'row-count': -1})))
+        self.assertEqual(0, stream_scheduler.estimate_stream_size(stream_with_statistics('a')))
+
+    def test_plan_streams_largest_first(self):
+        streams = [stream_with_statistics('public-a', **{'relation-size': 10}),
+                   stream_with_statistics('public-b', **{'relation-size': 500}),
+                   stream_with_statistics('public-c'),
+                   stream_with_statistics('public-d', **{'relation-size': 500}),
+                   stream_with_statistics('public-e', **{'relation-size': 40})]
+
+        with self.assertLogs('tap_postgres', 'INFO') as logs:
+            planned = stream_scheduler.plan_streams(streams, 2)
+
+        self.assertEqual(['public-b', 'public-d', 'public-e', 'public-a', 'public-c'],
+                         [stream['tap_stream_id'] for stream in planned])
+        self.assertIn('Estimated work of 5 streams', logs.output[0])
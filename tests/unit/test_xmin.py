@@ -0,0 +1,36 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from tap_postgres.sync_strategies import xmin
+
+
+class TestXmin(TestCase):
+    """Test Cases for XMIN replication"""
+
+    def test_modified_since_clause(self):
+        self.assertEqual('WHERE (1000 - xmin::text::bigint + 4294967296) % 4294967296 <= 100',
+                         xmin.modified_since_clause(900, 1000))
+        # the epoch is left out of xmin, the next transaction id of the 3rd epoch wrapped around to 10
+        self.assertEqual('WHERE (10 - xmin::text::bigint + 4294967296) % 4294967296 <= 30',
+                         xmin.modified_since_clause(2 * 2 ** 32 - 20, 2 * 2 ** 32 + 10))
+        self.assertEqual('', xmin.modified_since_clause(100, 2 ** 32 + 100))
+
+    @patch('tap_postgres.sync_strategies.xmin.sync_common.write_message')
+    @patch('tap_postgres.sync_strategies.xmin.post_db.hstore_available', return_value=False)
+    @patch('tap_postgres.sync_strategies.xmin.post_db.fetch_rows')
+    @patch('tap_postgres.sync_strategies.xmin.post_db.pooled_connection')
+    def test_sync_table(self, mocked_pooled_connection, mocked_fetch_rows, *_):
+        cursor = MagicMock()
+        cursor.fetchone.return_value = (1500, 1600)
+        mocked_pooled_connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value = \
+            cursor
+        mocked_fetch_rows.return_value = iter([[1], [2]])
+        stream = {'tap_stream_id': 'public-legacy', 'stream': 'legacy', 'table_name': 'legacy'}
+        md_map = {(): {'schema-name': 'public'}, ('properties', 'id'): {'sql-datatype': 'integer'}}
+        state = {'bookmarks': {'public-legacy': {'version': 1, 'snapshot_xmin': 1200}}}
+
+        state = xmin.sync_table({}, stream, state, ['id'], md_map)
+
+        self.assertIn('WHERE (1600 - xmin::text::bigint + 4294967296) % 4294967296 <= 400',
+                      mocked_fetch_rows.call_args[0][2])
+        self.assertEqual({'version': 1, 'snapshot_xmin': 1500}, state['bookmarks']['public-legacy'])